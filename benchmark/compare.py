@@ -0,0 +1,78 @@
+"""
+Compares two benchmark result files and flags regressions:
+
+    python -m benchmark.compare before.json after.json --threshold 0.10
+
+Latencies and durations (*_ms, seconds) regress when they grow; throughputs (*_per_second)
+and recall (recall_*) regress when they shrink. Stages too short to time reliably (under MIN_STAGE_SECONDS, or latencies
+under MIN_LATENCY_MS in both runs) are shown but never flagged. Exits with status 1 if any metric
+regressed by more than the threshold.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Optional
+
+MIN_STAGE_SECONDS = 0.1
+MIN_LATENCY_MS = 1.0
+
+
+def _direction(metric: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None for metrics that are not compared."""
+    if metric.endswith("_per_second") or metric.startswith("recall_"):
+        return 1
+    if metric.endswith("_ms") or metric == "seconds":
+        return -1
+    return None
+
+
+def flatten(results: dict) -> Dict[str, float]:
+    return {f"{stage}.{metric}": value
+            for stage, metrics in results["stages"].items()
+            for metric, value in metrics.items()
+            if isinstance(value, (int, float)) and _direction(metric) is not None}
+
+
+def _measurable(key: str, before: Dict[str, float], after: Dict[str, float]) -> bool:
+    stage, metric = key.rsplit(".", 1)
+    if metric.endswith("_ms"):
+        return max(before[key], after[key]) >= MIN_LATENCY_MS
+    seconds_key = f"{stage}.seconds"
+    if seconds_key in before and seconds_key in after:
+        return max(before[seconds_key], after[seconds_key]) >= MIN_STAGE_SECONDS
+    return True
+
+
+def compare(before: dict, after: dict, threshold: float) -> int:
+    old, new = flatten(before), flatten(after)
+    regressions = 0
+    print(f"{'metric':<36}{'before':>14}{'after':>14}{'change':>10}")
+    for key in sorted(old.keys() & new.keys()):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        worse = change * _direction(key.rsplit(".", 1)[1]) < -threshold and _measurable(key, old, new)
+        regressions += worse
+        print(f"{key:<36}{old[key]:>14.2f}{new[key]:>14.2f}{change:>+10.1%}{'  REGRESSION' if worse else ''}")
+    if before.get("config") != after.get("config"):
+        print("\nWarning: the runs used different configurations.")
+    print(f"\n{regressions} regression(s) beyond {threshold:.0%} "
+          f"({before['meta']['commit']} -> {after['meta']['commit']})")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown (default 0.10)")
+    args = parser.parse_args(argv)
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    return compare(before, after, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
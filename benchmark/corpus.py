@@ -0,0 +1,84 @@
+import os
+from typing import List
+
+import numpy as np
+
+_CONSONANTS = list("bcdfghklmnprstvz")
+_VOWELS = list("aeiou")
+_AVERAGE_WORD_CHARS = 7  # including the separating space
+_PARAGRAPH_WORDS = 60
+
+
+class SyntheticCorpus:
+    """
+    Deterministic synthetic knowledge base for benchmarks. Words are drawn from a generated
+    vocabulary with a Zipf-like distribution (like natural text, a few words are very common and
+    most are rare); every chunk-sized section also mentions a service name and an error code, so
+    both semantic and exact-identifier queries have something to find.
+    """
+
+    def __init__(self, vocabulary_size: int = 20000, seed: int = 0, zipf_exponent: float = 1.1):
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        words = set()
+        while len(words) < vocabulary_size:
+            syllables = rng.integers(1, 4)
+            words.add("".join(rng.choice(_CONSONANTS) + rng.choice(_VOWELS) for _ in range(syllables))
+                      + rng.choice(_CONSONANTS))
+        self.vocabulary = np.array(sorted(words))
+        weights = 1.0 / np.arange(1, vocabulary_size + 1) ** zipf_exponent
+        self.probabilities = weights / weights.sum()
+
+    @staticmethod
+    def service_name(index: int) -> str:
+        return f"svc-{index % 997:03d}"
+
+    @staticmethod
+    def error_code(index: int) -> str:
+        return f"ERR-{1000 + index % 8999}"
+
+    def _section(self, rng: np.random.Generator, index: int, chars: int) -> str:
+        word_count = max(chars // _AVERAGE_WORD_CHARS, 8)
+        words = self.vocabulary[rng.choice(len(self.vocabulary), size=word_count, p=self.probabilities)]
+        paragraphs = [" ".join(words[i:i + _PARAGRAPH_WORDS]) + "."
+                      for i in range(0, word_count, _PARAGRAPH_WORDS)]
+        paragraphs[0] = f"{self.service_name(index)} returns {self.error_code(index)} when {paragraphs[0]}"
+        return "\n\n".join(paragraphs)
+
+    @staticmethod
+    def team_name(index: int) -> str:
+        return f"team_{index:02d}"
+
+    def write(self, directory: str, chunks: int, chunk_size: int = 1000, chunks_per_file: int = 20,
+              teams: int = 0) -> List[str]:
+        """
+        Writes roughly `chunks` chunk-sized sections as .txt files; returns the file paths. With
+        `teams`, the files are spread round-robin over team_00, team_01, ... subdirectories.
+        """
+        os.makedirs(directory, exist_ok=True)
+        rng = np.random.default_rng(self.seed + 1)
+        paths = []
+        for file_index, start in enumerate(range(0, chunks, chunks_per_file)):
+            sections = [self._section(rng, index, chunk_size)
+                        for index in range(start, min(start + chunks_per_file, chunks))]
+            file_directory = os.path.join(directory, self.team_name(file_index % teams)) if teams else directory
+            os.makedirs(file_directory, exist_ok=True)
+            path = os.path.join(file_directory, f"doc_{file_index:06d}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(sections))
+            paths.append(path)
+        return paths
+
+    def queries(self, count: int, chunks: int) -> List[str]:
+        """Benchmark questions: half about a service/error code, half plain mid-frequency words."""
+        rng = np.random.default_rng(self.seed + 2)
+        band = self.vocabulary[50:2000]
+        queries = []
+        for i in range(count):
+            words = " ".join(rng.choice(band, size=3))
+            if i % 2 == 0:
+                index = int(rng.integers(0, max(chunks, 1)))
+                queries.append(f"Why does {self.service_name(index)} return {self.error_code(index)} for {words}?")
+            else:
+                queries.append(f"What is {words}?")
+        return queries
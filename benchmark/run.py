@@ -0,0 +1,390 @@
+"""
+Offline benchmark of the retrieval stack and the mention path.
+
+Generates a synthetic corpus, ingests it with the fake embedding backend, then runs concurrent
+queries and simulated Slack mentions (fake LLM, in-memory Slack client). Each stage is timed
+separately and the results are written as JSON, which benchmark/compare.py can diff against an
+earlier run:
+
+    python -m benchmark.run --chunks 10000 --output before.json
+    python -m benchmark.run --chunks 10000 --output after.json
+    python -m benchmark.compare before.json after.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmark.corpus import SyntheticCorpus
+from knowledge.ingest_manifest import IngestManifest
+from knowledge.rag_pipeline import RAGPipeline
+from knowledge.response_cache import SemanticResponseCache
+from knowledge.sharded_backend import ShardedBackend
+from llm.ai_model import FakeAIModel
+from llm.ai_model_chain import AIModelChain
+from utils.fake_slack import FakeSlackClient
+from utils.mention_dispatcher import MentionDispatcher
+from utils.mention_handler import MentionHandler
+from utils.slack_cache import SlackMetadataCache
+
+
+def latency_summary(latencies: List[float], wall_seconds: float) -> Dict[str, float]:
+    """Percentiles in milliseconds plus throughput for a list of per-operation latencies (seconds)."""
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1000.0
+    return {
+        "count": len(latencies),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+        "ops_per_second": len(latencies) / wall_seconds if wall_seconds else 0.0,
+    }
+
+
+def throughput(items: int, seconds: float) -> Dict[str, float]:
+    return {"items": items, "seconds": seconds, "items_per_second": items / seconds if seconds else 0.0}
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool):
+    """Silences the pipeline's progress prints, which would otherwise dominate the timings."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def build_pipeline(args, source_dir: str, store_dir: str) -> RAGPipeline:
+    pipeline = RAGPipeline(
+        source_dir=source_dir,
+        chroma_dir=store_dir,
+        collection_name="bench",
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        chunking=args.chunking,
+        chunk_tokens=args.chunk_tokens,
+        chunk_overlap_tokens=args.chunk_overlap_tokens,
+        loader_workers=args.loader_workers,
+        ingest_batch_size=args.batch_size,
+        embedding_backend="fake",
+        embedding_concurrency=args.embed_concurrency,
+        vector_store_backend=args.backend,
+        ann_index=args.ann,
+        quantization=args.quantization,
+        rescore_factor=args.rescore_factor,
+        vector_store_shards=args.shards,
+        shard_partition=args.shard_partition,
+        retrieval_mode=args.retrieval_mode,
+        reranker=args.reranker,
+        query_batch_window_ms=args.query_batch_window_ms,
+        query_batch_max_wait_ms=args.query_batch_max_wait_ms,
+        query_batch_max_size=args.query_batch_max_size,
+    )
+    pipeline.embedding_manager.client.backend.latency = args.embed_latency
+    pipeline.vector_store_manager.load_existing_store()
+    return pipeline
+
+
+def bench_ingest(pipeline: RAGPipeline, paths: List[str], batch_size: int) -> Dict[str, dict]:
+    """
+    Runs load -> chunk -> embed -> store and times each stage. Files are loaded in worker processes
+    while the main thread works, so "load" is the time spent waiting for the next loaded file.
+    """
+    seconds = {"load": 0.0, "chunk": 0.0, "embed": 0.0, "store": 0.0, "index": 0.0}
+    files = chunks = 0
+    pending_docs, pending_ids = [], []
+    vector_store_manager = pipeline.vector_store_manager
+
+    def store_pending():
+        started = time.perf_counter()
+        vectors = pipeline.embeddings.embed_documents([doc.page_content for doc in pending_docs])
+        seconds["embed"] += time.perf_counter() - started
+        started = time.perf_counter()
+        vector_store_manager.store_embeddings(pending_docs, vectors, pending_ids)
+        seconds["store"] += time.perf_counter() - started
+        pending_docs.clear()
+        pending_ids.clear()
+
+    loaded_files = pipeline.doc_manager.iter_loaded_files(paths)
+    while True:
+        started = time.perf_counter()
+        item = next(loaded_files, None)
+        seconds["load"] += time.perf_counter() - started
+        if item is None:
+            break
+        path, documents = item
+        if documents is None:
+            continue
+        files += 1
+
+        started = time.perf_counter()
+        file_chunks = pipeline.text_processor.split_documents(pipeline.tagger.tag(path, documents))
+        seconds["chunk"] += time.perf_counter() - started
+
+        file_hash = IngestManifest.hash_file(path)
+        pending_docs.extend(file_chunks)
+        pending_ids.extend(IngestManifest.chunk_id(path, file_hash, i) for i in range(len(file_chunks)))
+        chunks += len(file_chunks)
+        if len(pending_docs) >= batch_size:
+            store_pending()
+    if pending_docs:
+        store_pending()
+
+    started = time.perf_counter()
+    vector_store_manager.flush()  # builds the ANN index and persists the lexical index
+    seconds["index"] += time.perf_counter() - started
+
+    results = {"load": throughput(files, seconds["load"])}
+    for stage in ("chunk", "embed", "store", "index"):
+        results[stage] = throughput(chunks, seconds[stage])
+    return results
+
+
+def bench_queries(pipeline: RAGPipeline, queries: List[str], k: int, concurrency: int,
+                  filter: Optional[dict] = None, prefix: str = "query") -> Dict[str, dict]:
+    embed_latencies, search_latencies, total_latencies = [], [], []
+    lock = threading.Lock()
+
+    def run_query(query: str):
+        started = time.perf_counter()
+        embedding = pipeline.embed_query(query)
+        embedded = time.perf_counter()
+        pipeline.query(query, k=k, query_embedding=embedding, filter=filter)
+        finished = time.perf_counter()
+        with lock:
+            embed_latencies.append(embedded - started)
+            search_latencies.append(finished - embedded)
+            total_latencies.append(finished - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run_query, queries))
+    wall = time.perf_counter() - started
+    return {
+        f"{prefix}_embed": latency_summary(embed_latencies, wall),
+        f"{prefix}_search": latency_summary(search_latencies, wall),
+        prefix: latency_summary(total_latencies, wall),
+    }
+
+
+def bench_rebuild(pipeline: RAGPipeline, queries: List[str], k: int, concurrency: int) -> Dict[str, dict]:
+    """Rebuilds shard 0 while queries are being answered; the queries are timed as usual."""
+    rebuild: Dict[str, float] = {}
+
+    def run_rebuild():
+        started = time.perf_counter()
+        pipeline.vector_store_manager.rebuild_shard(0)
+        rebuild["seconds"] = time.perf_counter() - started
+
+    thread = threading.Thread(target=run_rebuild)
+    thread.start()
+    stages = bench_queries(pipeline, queries, k, concurrency, prefix="query_during_rebuild")
+    thread.join()
+    stages["shard_rebuild"] = {"seconds": rebuild.get("seconds", 0.0)}
+    return stages
+
+
+def bench_quantization(pipeline: RAGPipeline, queries: List[str], k: int) -> Dict[str, dict]:
+    """Memory per vector and recall@k of the quantized store against full-precision exact search."""
+    from knowledge.quantization import quantization_report
+
+    embeddings = [pipeline.embed_query(query) for query in queries]
+    return {"quantization": quantization_report(pipeline.vector_store_manager.backend, embeddings, k=k)}
+
+
+def bench_mentions(pipeline: RAGPipeline, questions: List[str], args) -> Dict[str, dict]:
+    """Simulated app_mention events answered end to end through the dispatcher and MentionHandler."""
+    users = {f"U{i:03d}": f"User {i}" for i in range(50)}
+    client = FakeSlackClient(users=users, latency=args.slack_latency)
+    slack_cache = SlackMetadataCache()
+    slack_cache.prime(client)
+    model = FakeAIModel("fake", latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second)
+    chain = AIModelChain([model], hedge=False)
+    handler = MentionHandler(pipeline, SemanticResponseCache(), lambda: chain, top_k=args.k,
+                             stream_responses=not args.no_stream, stream_update_interval=args.stream_interval,
+                             slack_cache=slack_cache)
+    dispatcher = MentionDispatcher(workers=args.mention_workers, max_queue=len(questions),
+                                   per_channel_limit=args.mention_workers)
+
+    latencies = []
+    lock = threading.Lock()
+    user_ids = list(users)
+
+    def make_job(event: dict, submitted: float):
+        def job():
+            handler.handle(event, client)
+            with lock:
+                latencies.append(time.perf_counter() - submitted)
+        return job
+
+    started = time.perf_counter()
+    for i, question in enumerate(questions):
+        channel = f"C{i % args.channels:03d}"
+        message = client.add_message(channel, f"<@{client.bot_user_id}> {question}", user=user_ids[i % len(user_ids)])
+        event = dict(message, channel=channel)
+        dispatcher.submit(f"{channel}:{message['ts']}", channel, make_job(event, time.perf_counter()))
+    dispatcher.shutdown()
+    wall = time.perf_counter() - started
+
+    reads = sum(client.call_count(name) for name in ("auth_test", "conversations_replies", "users_info"))
+    return {
+        "mention": latency_summary(latencies, wall),
+        "mention_slack_calls": {
+            "reads": reads,
+            "writes": client.call_count("chat_postMessage") + client.call_count("chat_update"),
+            "failed_jobs": dispatcher.stats()["failed"],
+        },
+    }
+
+
+def run(args) -> dict:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="intellibot-bench-")
+    source_dir = os.path.join(workdir, "source")
+    store_dir = os.path.join(workdir, "store")
+    corpus = SyntheticCorpus(seed=args.seed)
+    stages: Dict[str, dict] = {}
+    pipeline = None
+    try:
+        started = time.perf_counter()
+        paths = corpus.write(source_dir, args.chunks, chunk_size=args.chunk_size,
+                             chunks_per_file=args.chunks_per_file, teams=args.teams)
+        stages["corpus"] = throughput(len(paths), time.perf_counter() - started)
+
+        with quiet(not args.verbose):
+            pipeline = build_pipeline(args, source_dir, store_dir)
+            stages.update(bench_ingest(pipeline, paths, args.batch_size))
+            if args.queries:
+                stages.update(bench_queries(pipeline, corpus.queries(args.queries, args.chunks), args.k,
+                                            args.query_concurrency))
+                if args.teams:
+                    # Searches restricted to one team's share (1/teams) of the corpus; the filter bitmaps
+                    # are built first, as the bot's warm-up does.
+                    pipeline.vector_store_manager.backend.warm_up()
+                    stages.update(bench_queries(pipeline, corpus.queries(args.queries, args.chunks), args.k,
+                                                args.query_concurrency, filter={"team": corpus.team_name(0)},
+                                                prefix="query_filtered"))
+                if args.shards > 1:
+                    stages.update(bench_rebuild(pipeline, corpus.queries(args.queries, args.chunks), args.k,
+                                                args.query_concurrency))
+            if args.quantization and args.backend == "numpy" and args.shards == 1:
+                stages.update(bench_quantization(pipeline, corpus.queries(min(args.queries, 200) or 200, args.chunks),
+                                                 args.k))
+            if args.mentions:
+                stages.update(bench_mentions(pipeline, corpus.queries(args.mentions, args.chunks), args))
+    finally:
+        if pipeline is not None and isinstance(pipeline.vector_store_manager.backend, ShardedBackend):
+            pipeline.vector_store_manager.backend.close()
+        if not args.workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose", "workdir")},
+        "stages": stages,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline retrieval and mention benchmark.")
+    corpus = parser.add_argument_group("corpus")
+    corpus.add_argument("--chunks", type=int, default=10000, help="approximate number of chunks to generate")
+    corpus.add_argument("--chunking", choices=["recursive", "structured"], default="recursive")
+    corpus.add_argument("--chunk-size", type=int, default=1000, help="characters per generated section, and per chunk with recursive chunking")
+    corpus.add_argument("--chunk-overlap", type=int, default=100)
+    corpus.add_argument("--chunk-tokens", type=int, default=256, help="tokens per chunk (structured chunking)")
+    corpus.add_argument("--chunk-overlap-tokens", type=int, default=32)
+    corpus.add_argument("--chunks-per-file", type=int, default=20)
+    corpus.add_argument("--seed", type=int, default=0)
+    corpus.add_argument("--teams", type=int, default=0,
+                        help="spread the files over this many team directories and also time queries filtered to one")
+
+    ingest = parser.add_argument_group("ingest")
+    ingest.add_argument("--backend", choices=["numpy", "chroma"], default="numpy")
+    ingest.add_argument("--ann", choices=["ivf", "hnsw"], default=None)
+    ingest.add_argument("--quantization", choices=["int8", "binary"], default=None, help="numpy backend only")
+    ingest.add_argument("--rescore-factor", type=int, default=8)
+    ingest.add_argument("--shards", type=int, default=1,
+                        help="split the store across this many worker processes; also times a shard rebuild under load")
+    ingest.add_argument("--shard-partition", choices=["hash", "source"], default="hash")
+    ingest.add_argument("--loader-workers", type=int, default=None)
+    ingest.add_argument("--batch-size", type=int, default=256)
+    ingest.add_argument("--embed-concurrency", type=int, default=4)
+    ingest.add_argument("--embed-latency", type=float, default=0.0, help="simulated seconds per embedding request")
+
+    query = parser.add_argument_group("queries")
+    query.add_argument("--queries", type=int, default=500)
+    query.add_argument("--query-concurrency", type=int, default=8)
+    query.add_argument("--k", type=int, default=3)
+    query.add_argument("--query-batch-window-ms", type=float, default=0.0, help="0 embeds and searches each query alone")
+    query.add_argument("--query-batch-max-wait-ms", type=float, default=10.0)
+    query.add_argument("--query-batch-max-size", type=int, default=32)
+    query.add_argument("--retrieval-mode", choices=["vector", "hybrid"], default="hybrid")
+    query.add_argument("--reranker", choices=["lexical", "cross-encoder"], default=None)
+
+    mention = parser.add_argument_group("mentions")
+    mention.add_argument("--mentions", type=int, default=100)
+    mention.add_argument("--mention-workers", type=int, default=4)
+    mention.add_argument("--channels", type=int, default=8)
+    mention.add_argument("--llm-latency", type=float, default=0.2, help="simulated seconds to first token")
+    mention.add_argument("--llm-tokens-per-second", type=float, default=200.0)
+    mention.add_argument("--slack-latency", type=float, default=0.01, help="simulated seconds per Slack call")
+    mention.add_argument("--no-stream", action="store_true", help="post answers in one message")
+    mention.add_argument("--stream-interval", type=float, default=0.5)
+
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--workdir", help="directory for the corpus and store (kept); a temp dir by default")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary directory")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's progress output")
+    return parser.parse_args(argv)
+
+
+def print_summary(results: dict):
+    for stage, metrics in results["stages"].items():
+        summary = ", ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                            for key, value in metrics.items())
+        print(f"{stage:>20}: {summary}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def _load_trained_size(path: str) -> Optional[int]:
+    """Reads the number of rows an index was built over, saved next to it; None for older indexes."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return int(json.load(f)["trained_size"])
+
+
+def _save_trained_size(path: str, trained_size: int):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"trained_size": trained_size}, f)
+
+
+class AnnIndex(ABC):
+    """
+    Approximate nearest neighbour index over the rows of a NumpyBackend. The index only maps queries
+    to candidate rows; vectors stay in the backend's memory-mapped matrix.
+    """
+
+    @abstractmethod
+    def is_ready(self) -> bool:
+        """False until the index has been built; callers fall back to exact search meanwhile."""
+        pass
+
+    @abstractmethod
+    def build(self, vectors: np.ndarray, rows: np.ndarray):
+        pass
+
+    @abstractmethod
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        pass
+
+    @abstractmethod
+    def remove(self, rows: np.ndarray):
+        pass
+
+    @abstractmethod
+    def search(self, query: np.ndarray, k: int, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (rows, scores) of up to k approximate nearest rows, best first."""
+        pass
+
+    @abstractmethod
+    def needs_rebuild(self, live_rows: int) -> bool:
+        pass
+
+    @abstractmethod
+    def save(self):
+        pass
+
+
+class IVFFlatIndex(AnnIndex):
+    """
+    Inverted-file index in pure NumPy. Rows are clustered by spherical k-means into `nlist` lists;
+    a query scores only the rows of its `nprobe` closest lists. More probes mean higher recall and
+    higher latency. New rows are assigned to their nearest existing centroid; the index asks to be
+    rebuilt once the corpus has grown well past the size it was trained on. Removed and re-added rows
+    leave stale entries in their old lists, which are compacted away once they exceed
+    `max_stale_fraction` of the indexed rows.
+    """
+
+    def __init__(self, directory: str, nprobe: int = 8, nlist: Optional[int] = None, retrain_growth: float = 4.0,
+                 max_stale_fraction: float = 0.2):
+        self.directory = directory
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.retrain_growth = retrain_growth
+        self.max_stale_fraction = max_stale_fraction
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.full(0, -1, dtype=np.int32)  # row -> list id, -1 when not indexed
+        self.trained_size = 0
+        self._indexed = 0  # rows with an assignment
+        self._stale = 0  # list entries whose row was removed or re-added since the lists were built
+        self._lists: List[np.ndarray] = []
+        self._pending: Dict[int, List[int]] = {}
+        self._lists_lock = threading.Lock()
+        self._load()
+
+    @property
+    def _centroids_path(self) -> str:
+        return os.path.join(self.directory, "ivf_centroids.npy")
+
+    @property
+    def _assignments_path(self) -> str:
+        return os.path.join(self.directory, "ivf_assignments.npy")
+
+    @property
+    def _state_path(self) -> str:
+        return os.path.join(self.directory, "ivf_state.json")
+
+    def _load(self):
+        if not os.path.exists(self._centroids_path):
+            return
+        self.centroids = np.load(self._centroids_path)
+        self.assignments = np.load(self._assignments_path)
+        # The growth that triggers retraining counts from the build, not from the last restart.
+        trained_size = _load_trained_size(self._state_path)
+        self.trained_size = int(np.count_nonzero(self.assignments >= 0)) if trained_size is None else trained_size
+        self._rebuild_lists()
+
+    def _rebuild_lists(self):
+        indexed = np.flatnonzero(self.assignments >= 0)
+        order = indexed[np.argsort(self.assignments[indexed], kind="stable")]
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        self._pending = {}
+        self._indexed = len(indexed)
+        self._stale = 0
+
+    def _compact_if_stale(self):
+        if self._stale > self.max_stale_fraction * max(self._indexed, 1):
+            with self._lists_lock:
+                self._rebuild_lists()
+
+    def is_ready(self) -> bool:
+        return self.centroids is not None
+
+    def build(self, vectors: np.ndarray, rows: np.ndarray):
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(rows))))
+        nlist = min(nlist, len(rows))
+        rng = np.random.default_rng(0)
+        sample = rows if len(rows) <= nlist * 64 else rng.choice(rows, nlist * 64, replace=False)
+        sample_vectors = np.asarray(vectors[np.sort(sample)])
+        centroids = sample_vectors[rng.choice(len(sample_vectors), nlist, replace=False)].copy()
+        for _ in range(10):
+            labels = self._nearest(sample_vectors, centroids)
+            order = np.argsort(labels, kind="stable")
+            used, starts = np.unique(labels[order], return_index=True)
+            sums = np.add.reduceat(sample_vectors[order], starts, axis=0)
+            centroids[used] = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+            empty = np.setdiff1d(np.arange(nlist), used)
+            if len(empty):
+                centroids[empty] = sample_vectors[rng.integers(len(sample_vectors), size=len(empty))]
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = np.full(int(rows.max()) + 1, -1, dtype=np.int32)
+        for start in range(0, len(rows), 65536):
+            part = rows[start:start + 65536]
+            self.assignments[part] = self._nearest(np.asarray(vectors[part]), self.centroids)
+        self.trained_size = len(rows)
+        self._rebuild_lists()
+        print(f"IVF index built with {nlist} lists over {len(rows)} vectors.")
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 65536):
+            labels[start:start + 65536] = np.argmax(vectors[start:start + 65536] @ centroids.T, axis=1)
+        return labels
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        if not self.is_ready():
+            return
+        if int(rows.max()) >= len(self.assignments):
+            grown = np.full(max(int(rows.max()) + 1, 2 * len(self.assignments)), -1, dtype=np.int32)
+            grown[:len(self.assignments)] = self.assignments
+            self.assignments = grown
+        labels = self._nearest(vectors, self.centroids)
+        # A re-added row stays in its old list as a stale entry; search drops it there because its
+        # assignment no longer matches (or dedupes it when it lands in the same list again).
+        reassigned = int(np.count_nonzero(self.assignments[rows] >= 0))
+        self._stale += reassigned
+        self._indexed += len(rows) - reassigned
+        self.assignments[rows] = labels
+        with self._lists_lock:
+            for row, label in zip(rows.tolist(), labels.tolist()):
+                self._pending.setdefault(label, []).append(row)
+        self._compact_if_stale()
+
+    def remove(self, rows: np.ndarray):
+        rows = rows[rows < len(self.assignments)]
+        removed = int(np.count_nonzero(self.assignments[rows] >= 0))
+        self._stale += removed
+        self._indexed -= removed
+        self.assignments[rows] = -1
+        self._compact_if_stale()
+
+    def _list(self, list_id: int) -> np.ndarray:
+        with self._lists_lock:
+            pending = self._pending.pop(list_id, None)
+            if pending:
+                self._lists[list_id] = np.concatenate([self._lists[list_id], np.asarray(pending, dtype=np.int64)])
+            return self._lists[list_id]
+
+    def search(self, query: np.ndarray, k: int, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        centroid_scores = self.centroids @ query
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        lists = [self._list(int(list_id)) for list_id in probes]
+        candidates = np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+        list_ids = np.repeat(probes, [len(rows) for rows in lists])
+        # Rows that were removed and re-added can appear twice in a list, hence the unique().
+        candidates = np.unique(candidates[self.assignments[candidates] == list_ids])
+        if not len(candidates):
+            return candidates, np.empty(0, dtype=np.float32)
+        scores = vectors[candidates] @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+    def needs_rebuild(self, live_rows: int) -> bool:
+        return self.trained_size > 0 and live_rows > self.retrain_growth * self.trained_size
+
+    def save(self):
+        if not self.is_ready():
+            return
+        np.save(self._centroids_path, self.centroids)
+        np.save(self._assignments_path, self.assignments)
+        _save_trained_size(self._state_path, self.trained_size)
+
+
+class HNSWIndex(AnnIndex):
+    """
+    HNSW graph backed by the optional `hnswlib` package. `ef_search` trades recall for latency.
+    Deleted rows are marked deleted and revived when their row is reused.
+    """
+
+    def __init__(self, directory: str, dim: Optional[int] = None, ef_search: int = 64, m: int = 16,
+                 ef_construction: int = 200):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("The 'hnsw' ANN index requires the hnswlib package: pip install hnswlib")
+        self._hnswlib = hnswlib
+        self.directory = directory
+        self.dim = dim
+        self.ef_search = ef_search
+        self.m = m
+        self.ef_construction = ef_construction
+        self.index = None
+        self.trained_size = 0
+        if os.path.exists(self._index_path) and dim:
+            self.index = hnswlib.Index(space="ip", dim=dim)
+            self.index.load_index(self._index_path, allow_replace_deleted=False)
+            self.index.set_ef(ef_search)
+            trained_size = _load_trained_size(self._state_path)
+            self.trained_size = self.index.get_current_count() if trained_size is None else trained_size
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.directory, "hnsw.bin")
+
+    @property
+    def _state_path(self) -> str:
+        return os.path.join(self.directory, "hnsw_state.json")
+
+    def is_ready(self) -> bool:
+        return self.index is not None
+
+    def build(self, vectors: np.ndarray, rows: np.ndarray):
+        self.dim = vectors.shape[1]
+        self.index = self._hnswlib.Index(space="ip", dim=self.dim)
+        self.index.init_index(max_elements=max(1024, 2 * len(rows)), ef_construction=self.ef_construction, M=self.m)
+        self.index.set_ef(self.ef_search)
+        for start in range(0, len(rows), 65536):
+            part = rows[start:start + 65536]
+            self.index.add_items(np.asarray(vectors[part]), part)
+        self.trained_size = len(rows)
+        print(f"HNSW index built over {len(rows)} vectors.")
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray):
+        if not self.is_ready():
+            return
+        needed = self.index.get_current_count() + len(rows)
+        if needed > self.index.get_max_elements():
+            self.index.resize_index(2 * needed)
+        self.index.add_items(vectors, rows)
+
+    def remove(self, rows: np.ndarray):
+        if not self.is_ready():
+            return
+        for row in rows.tolist():
+            try:
+                self.index.mark_deleted(row)
+            except RuntimeError:
+                pass  # row was never indexed or is already deleted
+
+    def search(self, query: np.ndarray, k: int, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.index.get_current_count())
+        while k > 0:
+            try:
+                labels, distances = self.index.knn_query(query, k=k)
+                return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+            except RuntimeError:
+                k //= 2  # fewer live (non-deleted) elements than requested
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    def needs_rebuild(self, live_rows: int) -> bool:
+        return False  # the graph is updated in place
+
+    def save(self):
+        if self.is_ready():
+            self.index.save_index(self._index_path)
+            _save_trained_size(self._state_path, self.trained_size)
+
+
+def create_ann_index(kind: Optional[str], directory: str, dim: Optional[int] = None, nprobe: int = 8,
+                     ef_search: int = 64) -> Optional[AnnIndex]:
+    if kind is None:
+        return None
+    if kind == "ivf":
+        return IVFFlatIndex(directory, nprobe=nprobe)
+    if kind == "hnsw":
+        return HNSWIndex(directory, dim=dim, ef_search=ef_search)
+    raise ValueError(f"Unsupported ANN index: {kind}")
+
+
+def recall_report(backend, queries: np.ndarray, k: int = 10) -> Dict[str, float]:
+    """
+    Compares a NumpyBackend's ANN search against exact search on a sample query set and returns
+    recall@k together with p50/p99 latency of both modes.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    exact_latencies, ann_latencies, recalls = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        exact_rows, _ = backend.search_rows(query, k, use_ann=False)
+        exact_latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        ann_rows, _ = backend.search_rows(query, k, use_ann=True)
+        ann_latencies.append(time.perf_counter() - start)
+        if len(exact_rows):
+            recalls.append(len(set(exact_rows.tolist()) & set(ann_rows.tolist())) / len(exact_rows))
+    report = {
+        "queries": len(queries),
+        "k": k,
+        "recall_at_k": float(np.mean(recalls)) if recalls else 0.0,
+        "exact_p50_ms": float(np.percentile(exact_latencies, 50) * 1000),
+        "exact_p99_ms": float(np.percentile(exact_latencies, 99) * 1000),
+        "ann_p50_ms": float(np.percentile(ann_latencies, 50) * 1000),
+        "ann_p99_ms": float(np.percentile(ann_latencies, 99) * 1000),
+    }
+    print(f"ANN recall report: {report}")
+    return report
@@ -0,0 +1,267 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# 16 bands of 8 rows make chunks with a Jaccard similarity of 0.8 candidates with ~95% probability
+# and those below 0.5 rarely; candidates are then checked against the threshold on the full signature.
+NUM_PERM = 128
+BANDS = 16
+SHINGLE_SIZE = 3
+_ROWS = NUM_PERM // BANDS
+_WORD = re.compile(r"\w+")
+# The "[Section > Path]" line the structured chunker puts before a chunk's text; formats of the
+# same document do not always produce it, so it is left out of the comparison.
+_SECTION_HEADER = re.compile(r"^\[[^\n]*\]\n")
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(1, 2 ** 63, size=NUM_PERM, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+_B = _rng.randint(0, 2 ** 63, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_SHINGLE_MULTIPLIERS = np.array([0x9E3779B97F4A7C15 >> shift for shift in range(SHINGLE_SIZE)], dtype=np.uint64)
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature (uint32, NUM_PERM values) of the text's word 3-grams; None for text without words."""
+    words = _WORD.findall(_SECTION_HEADER.sub("", text, count=1).lower())
+    if not words:
+        return None
+    hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+    if len(hashes) >= SHINGLE_SIZE:
+        windows = np.lib.stride_tricks.sliding_window_view(hashes, SHINGLE_SIZE)
+        shingles = np.unique((windows * _SHINGLE_MULTIPLIERS).sum(axis=1))
+    else:
+        shingles = np.array([(hashes * _SHINGLE_MULTIPLIERS[:len(hashes)]).sum()], dtype=np.uint64)
+    # Multiply-shift hashing: (a * x + b) mod 2^64, keeping the high 32 bits.
+    return ((_A[:, None] * shingles[None, :] + _B[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+class DedupIndex:
+    """
+    Finds near-duplicate chunks at ingest time with MinHash signatures and an LSH band index, so
+    the same text exported as .md, .html and .pdf is embedded and stored once.
+
+    Every chunk a file produces is a "ref" (the ID the manifest records for the file); each ref
+    points to a "canonical" chunk, which is what the vector store holds. A ref whose text is at
+    least `threshold` similar (estimated Jaccard over word 3-grams) to a stored or earlier chunk
+    points to that chunk; otherwise it becomes a new canonical, stored under an ID derived from
+    its text. A canonical is deleted when its last ref is released, and its "sources" metadata
+    lists the sources of all its refs.
+
+    Chunks are only merged within one `scope` (e.g. the same team tags), so a metadata filter never
+    drops a chunk that was deduplicated against a copy outside the filter.
+
+    During an ingest run, assignments are claims; commit() turns the claims of a file's refs into
+    refs once the file is complete, and discard() drops the claims of a failed run.
+    """
+
+    def __init__(self, index_path: str, threshold: float = 0.85):
+        self.index_path = index_path
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._loaded = False
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.refs: Dict[str, Dict[str, str]] = {}  # canonical ID -> {ref ID: source}
+        self.aliases: Dict[str, str] = {}  # ref ID -> canonical ID
+        self.scopes: Dict[str, str] = {}  # canonical ID -> scope, when not ""
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self._claims: Dict[str, Tuple[str, str]] = {}  # ref ID -> (canonical ID, source), uncommitted
+        self._claimed = Counter()  # canonical ID -> uncommitted claims
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.index_path):
+                return
+            try:
+                with gzip.open(self.index_path, "rt", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Could not read dedup index '{self.index_path}', it will be rebuilt. Error: {e}")
+                return
+            for canonical_id, entry in data["canonicals"].items():
+                signature = entry["signature"]
+                self._add_signature(canonical_id, np.frombuffer(base64.b64decode(signature), dtype=np.uint32)
+                                    if signature else None)
+                self.refs[canonical_id] = entry["refs"]
+                if entry.get("scope"):
+                    self.scopes[canonical_id] = entry["scope"]
+                for ref_id in entry["refs"]:
+                    self.aliases[ref_id] = canonical_id
+
+    def save(self):
+        with self._lock:
+            data = {"canonicals": {
+                canonical_id: {"signature": base64.b64encode(self.signatures[canonical_id].tobytes()).decode("ascii")
+                               if canonical_id in self.signatures else "", "refs": dict(refs),
+                               "scope": self.scopes.get(canonical_id, "")}
+                for canonical_id, refs in self.refs.items()}}
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        temp_path = f"{self.index_path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.index_path)
+
+    def clear(self):
+        with self._lock:
+            self.signatures.clear()
+            self.refs.clear()
+            self.aliases.clear()
+            self.scopes.clear()
+            self._buckets.clear()
+            self._claims.clear()
+            self._claimed.clear()
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+    def backfill(self, ids: List[str], documents: List[Document], scope: Callable[[dict], str] = lambda metadata: ""):
+        """Registers chunks stored before deduplication was enabled as canonicals of themselves."""
+        with self._lock:
+            for chunk_id, document in zip(ids, documents):
+                if chunk_id in self.refs:
+                    continue
+                self._add_signature(chunk_id, minhash(document.page_content))
+                chunk_scope = scope(document.metadata or {})
+                if chunk_scope:
+                    self.scopes[chunk_id] = chunk_scope
+                self.refs[chunk_id] = {chunk_id: (document.metadata or {}).get("source", "")}
+                self.aliases[chunk_id] = chunk_id
+
+    def _add_signature(self, canonical_id: str, signature: Optional[np.ndarray]):
+        if signature is None:
+            return
+        self.signatures[canonical_id] = signature
+        for band in range(BANDS):
+            key = (band, signature[band * _ROWS:(band + 1) * _ROWS].tobytes())
+            self._buckets.setdefault(key, set()).add(canonical_id)
+
+    def _remove_signature(self, canonical_id: str):
+        signature = self.signatures.pop(canonical_id, None)
+        if signature is None:
+            return
+        for band in range(BANDS):
+            key = (band, signature[band * _ROWS:(band + 1) * _ROWS].tobytes())
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(canonical_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _best_match(self, signature: np.ndarray, replacing: Set[str], scope: str) -> Optional[str]:
+        candidates: Set[str] = set()
+        for band in range(BANDS):
+            candidates.update(self._buckets.get((band, signature[band * _ROWS:(band + 1) * _ROWS].tobytes()), ()))
+        best_id, best_similarity = None, self.threshold
+        for candidate_id in candidates:
+            if self.scopes.get(candidate_id, "") != scope:
+                continue
+            refs = self.refs.get(candidate_id)
+            if refs and not self._claimed[candidate_id] and replacing.issuperset(refs):
+                continue  # only the previous version of the file being ingested: store the edited text
+            similarity = float(np.count_nonzero(self.signatures[candidate_id] == signature)) / NUM_PERM
+            if similarity >= best_similarity:
+                best_id, best_similarity = candidate_id, similarity
+        return best_id
+
+    def assign(self, ref_id: str, text: str, source: str, replacing: Set[str] = frozenset(),
+               scope: str = "") -> Tuple[str, bool]:
+        """
+        Claims a canonical chunk for a new ref. Returns (canonical ID, True) when the text is new
+        and must be embedded and stored under that ID, or (canonical ID, False) for a duplicate.
+        `replacing` holds the refs of the file's previous version, which are not matched against.
+        """
+        signature = minhash(text)
+        with self._lock:
+            match = self._best_match(signature, replacing, scope) if signature is not None else None
+            is_new = match is None
+            if is_new:
+                key = f"dedup\0{scope}\0{text}" if scope else f"dedup\0{text}"
+                match = hashlib.sha1(key.encode("utf-8")).hexdigest()
+                is_new = match not in self.refs and not self._claimed[match]
+                if is_new:
+                    self._add_signature(match, signature)
+                    if scope:
+                        self.scopes[match] = scope
+            self._claims[ref_id] = (match, source)
+            self._claimed[match] += 1
+            return match, is_new
+
+    def _drop_claim(self, ref_id: str) -> Optional[Tuple[str, str]]:
+        claim = self._claims.pop(ref_id, None)
+        if claim is not None:
+            self._claimed[claim[0]] -= 1
+            if not self._claimed[claim[0]]:
+                del self._claimed[claim[0]]
+        return claim
+
+    def _release(self, ref_id: str, deleted: Set[str], updated: Set[str]):
+        canonical_id = self.aliases.pop(ref_id, None)
+        if canonical_id is None:
+            deleted.add(ref_id)  # not tracked: a chunk stored under its own ID
+            return
+        refs = self.refs.get(canonical_id, {})
+        refs.pop(ref_id, None)
+        if refs or self._claimed[canonical_id]:
+            updated.add(canonical_id)
+            return
+        self.refs.pop(canonical_id, None)
+        self.scopes.pop(canonical_id, None)
+        self._remove_signature(canonical_id)
+        deleted.add(canonical_id)
+
+    def commit(self, ref_ids: Iterable[str], released_ids: Iterable[str] = ()) -> Tuple[List[str], List[str]]:
+        """
+        Turns the claims of `ref_ids` into refs and releases `released_ids`. Returns the canonical
+        IDs to delete from the store (no refs left) and those whose sources changed.
+        """
+        deleted: Set[str] = set()
+        updated: Set[str] = set()
+        with self._lock:
+            for ref_id in ref_ids:
+                claim = self._drop_claim(ref_id)
+                if claim is None:
+                    continue
+                canonical_id, source = claim
+                previous = self.aliases.get(ref_id)
+                if previous is not None and previous != canonical_id:
+                    self._release(ref_id, deleted, updated)  # same ID re-ingested with other text
+                self.aliases[ref_id] = canonical_id
+                refs = self.refs.setdefault(canonical_id, {})
+                if refs.get(ref_id) != source:
+                    refs[ref_id] = source
+                    if len(refs) > 1:
+                        updated.add(canonical_id)
+            for ref_id in released_ids:
+                self._release(ref_id, deleted, updated)
+        return sorted(deleted), sorted(updated - deleted)
+
+    def discard(self) -> List[str]:
+        """Drops all uncommitted claims; returns the canonicals nothing refers to any more."""
+        orphans = []
+        with self._lock:
+            for ref_id in list(self._claims):
+                canonical_id, _ = self._drop_claim(ref_id)
+                if not self.refs.get(canonical_id) and not self._claimed[canonical_id]:
+                    self.refs.pop(canonical_id, None)
+                    self.scopes.pop(canonical_id, None)
+                    self._remove_signature(canonical_id)
+                    orphans.append(canonical_id)
+        return orphans
+
+    def sources(self, canonical_id: str) -> List[str]:
+        with self._lock:
+            return sorted(set(self.refs.get(canonical_id, {}).values()))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"canonical_chunks": len(self.refs), "refs": len(self.aliases)}
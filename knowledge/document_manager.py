@@ -1,24 +1,49 @@
+import importlib
 import os
-import glob
-from langchain_community.document_loaders import (
-    TextLoader,
-    UnstructuredMarkdownLoader,
-    UnstructuredHTMLLoader,
-    PyPDFLoader
-)
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
 from langchain_core.documents import Document
-from typing import List, Dict, Type
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple, Type
+
+# Loaders are referenced by import path and imported the first time a file of their type is loaded,
+# so importing this module (or serving queries) never pulls in langchain_community or BeautifulSoup.
+# Markdown is read as is and HTML converted to Markdown-style text, so headings and code blocks
+# survive loading and the chunker can split along them.
+LOADERS: Dict[str, str] = {
+    ".txt": "langchain_community.document_loaders.TextLoader",
+    ".md": "langchain_community.document_loaders.TextLoader",
+    ".html": "knowledge.html_loader.HTMLMarkdownLoader",
+    ".pdf": "langchain_community.document_loaders.PyPDFLoader",
+}
+
+
+@lru_cache(maxsize=None)
+def _resolve_loader(loader_path: str) -> Type:
+    module_name, class_name = loader_path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _load_with(loader_path: str, file_path: str) -> List[Document]:
+    """Runs a loader; module level so it can be shipped to worker processes."""
+    return _resolve_loader(loader_path)(file_path).load()
+
+
+def _lower_priority(niceness: int):
+    """Worker process initializer: lets parsing yield the CPU to the process serving queries."""
+    try:
+        os.nice(niceness)
+    except (AttributeError, OSError):
+        pass
 
 
 class DocumentManager:
-    def __init__(self, source_directory: str):
+    def __init__(self, source_directory: str, max_workers: Optional[int] = None, niceness: int = 0):
         self.source_directory = source_directory
-        self.supported_loaders: Dict[str, Type] = {
-            ".txt": TextLoader,
-            ".md": UnstructuredMarkdownLoader,
-            ".html": UnstructuredHTMLLoader,
-            ".pdf": PyPDFLoader,
-        }
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # With a niceness, files are always parsed in lower-priority worker processes (even with a
+        # single worker) so that background re-ingest does not compete with the bot for the CPU.
+        self.niceness = niceness
+        self.supported_loaders: Dict[str, str] = dict(LOADERS)
         if not os.path.exists(self.source_directory):
             os.makedirs(self.source_directory)
             print(f"Created directory '{self.source_directory}'. Please add your documents there.")
@@ -35,20 +60,90 @@ class DocumentManager:
             f.write("<h1>Sample HTML</h1><p>This is a paragraph in an HTML document.</p>")
         print(f"Added sample files to '{self.source_directory}' for initial testing.")
 
+    def is_supported(self, file_path: str) -> bool:
+        return os.path.splitext(file_path)[1].lower() in self.supported_loaders
+
+    def list_files(self) -> List[str]:
+        """Returns the paths of all supported files under the source directory, recursively, sorted."""
+        file_paths: List[str] = []
+        for root, _, file_names in os.walk(self.source_directory):
+            for file_name in file_names:
+                if self.is_supported(file_name):
+                    file_paths.append(os.path.normpath(os.path.join(root, file_name)))
+        return sorted(file_paths)
+
+    def load_file(self, file_path: str) -> List[Document]:
+        """Loads a single file with the loader registered for its extension."""
+        return self._load_file(file_path) or []
+
+    def _load_file(self, file_path: str) -> Optional[List[Document]]:
+        """Like load_file, but returns None if the file could not be loaded."""
+        ext = os.path.splitext(file_path)[1].lower()
+        loader_path = self.supported_loaders.get(ext)
+        if loader_path is None:
+            print(f"Unsupported file type for {file_path}, skipping.")
+            return []
+        try:
+            print(f"Loading {file_path}...")
+            documents = _load_with(loader_path, file_path)
+            print(f"Loaded {len(documents)} document(s) from {file_path}")
+            return documents
+        except Exception as e:
+            print(f"Error loading {file_path}: {e}")
+            return None
+
+    def iter_loaded_files(self, file_paths: Optional[Iterable[str]] = None
+                          ) -> Iterator[Tuple[str, Optional[List[Document]]]]:
+        """
+        Parses files in a process pool and yields (file_path, documents) as each file finishes.
+        documents is None for a file that failed to load (parser error, crashed worker), which is
+        not the same as a file without content.
+        At most two files per worker are in flight, so memory stays bounded by the worker count
+        rather than by the size of the corpus.
+        """
+        pending_paths = iter(self.list_files() if file_paths is None else file_paths)
+        if self.max_workers <= 1 and not self.niceness:
+            for file_path in pending_paths:
+                yield file_path, self._load_file(file_path)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_lower_priority if self.niceness else None,
+                                 initargs=(self.niceness,) if self.niceness else ()) as executor:
+            in_flight = {}
+
+            def submit_next() -> bool:
+                for file_path in pending_paths:
+                    loader_path = self.supported_loaders.get(os.path.splitext(file_path)[1].lower())
+                    if loader_path is None:
+                        print(f"Unsupported file type for {file_path}, skipping.")
+                        continue
+                    in_flight[executor.submit(_load_with, loader_path, file_path)] = file_path
+                    return True
+                return False
+
+            while len(in_flight) < 2 * self.max_workers and submit_next():
+                pass
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = in_flight.pop(future)
+                    try:
+                        documents = future.result()
+                        print(f"Loaded {len(documents)} document(s) from {file_path}")
+                    except Exception as e:
+                        print(f"Error loading {file_path}: {e}")
+                        documents = None
+                    submit_next()
+                    yield file_path, documents
+
+    def iter_documents(self, file_paths: Optional[Iterable[str]] = None) -> Iterator[Document]:
+        """Yields documents as their files finish parsing. Defaults to every supported file."""
+        for _, documents in self.iter_loaded_files(file_paths):
+            yield from documents or []
+
     def load_documents(self) -> List[Document]:
-        all_documents: List[Document] = []
         print(f"\n--- Loading Documents from '{self.source_directory}' ---")
-        for ext, LoaderClass in self.supported_loaders.items():
-            file_paths = glob.glob(os.path.join(self.source_directory, f"*{ext}"))
-            for file_path in file_paths:
-                try:
-                    print(f"Loading {file_path}...")
-                    loader = LoaderClass(file_path)
-                    documents = loader.load()
-                    all_documents.extend(documents)
-                    print(f"Loaded {len(documents)} document(s) from {file_path}")
-                except Exception as e:
-                    print(f"Error loading {file_path}: {e}")
+        all_documents: List[Document] = list(self.iter_documents())
 
         if not all_documents:
             print(f"No documents found or loaded from '{self.source_directory}'.")
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingDiskStore:
+    """
+    Persistent key -> vector store. Vectors are appended to a flat float32 file that is read
+    through a memory map; a small SQLite table maps each key to its row in that file.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+        found = self._conn.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        self.dim: Optional[int] = found[0] if found else None
+        self._mmap: Optional[np.memmap] = None
+
+    def _row_count(self) -> int:
+        if not self.dim or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self.dim)
+
+    def _vectors(self, min_rows: int) -> np.memmap:
+        """Returns a memory map covering at least min_rows rows, remapping after appends."""
+        if self._mmap is None or self._mmap.shape[0] < min_rows:
+            rows = self._row_count()
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._mmap
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        if not keys or not self.dim:
+            return {}
+        found: Dict[str, int] = {}
+        with self._lock:
+            # SQLite caps the number of bound parameters, so look keys up in slices.
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                found.update(self._conn.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({placeholders})", part).fetchall())
+            if not found:
+                return {}
+            vectors = self._vectors(max(found.values()) + 1)
+            return {key: vectors[row].tolist() for key, row in found.items()}
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        matrix = np.asarray(list(items.values()), dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+                self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (self.dim,))
+            if matrix.shape[1] != self.dim:
+                print(f"Embedding dimension {matrix.shape[1]} does not match cache dimension {self.dim}; not caching.")
+                return
+            first_row = self._row_count()
+            # Vectors are flushed before their keys are committed, so a crash can only leave
+            # unreferenced rows behind, never keys pointing at missing data.
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, row) VALUES (?, ?)",
+                [(key, first_row + i) for i, key in enumerate(items.keys())])
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves previously computed vectors from a persistent disk store and
+    keeps an in-process LRU for hot query strings. Cache keys include the model name, so
+    switching models never returns stale vectors.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, cache_directory: Optional[str] = None,
+                 query_cache_size: int = 1024):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.query_cache_size = query_cache_size
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk_store: Optional[EmbeddingDiskStore] = None
+        if cache_directory:
+            model_dir = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16]
+            self.disk_store = EmbeddingDiskStore(os.path.join(cache_directory, model_dir))
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", text) for text in texts]
+        cached = self.disk_store.get_many(list(set(keys))) if self.disk_store else {}
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            if self.disk_store:
+                self.disk_store.put_many(computed)
+            cached.update(computed)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        with self._lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        vector = self.disk_store.get_many([key]).get(key) if self.disk_store else None
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            if self.disk_store:
+                self.disk_store.put_many({key: vector})
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+
+        with self._lock:
+            self._query_cache[key] = vector
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
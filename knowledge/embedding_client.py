@@ -0,0 +1,233 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.micro_batcher import MicroBatcher
+
+DOCUMENT_TASK = "RETRIEVAL_DOCUMENT"
+QUERY_TASK = "RETRIEVAL_QUERY"
+
+
+class EmbeddingBackend(ABC):
+    """A remote (or local) service that turns one batch of texts into vectors in a single request."""
+
+    @abstractmethod
+    def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        pass
+
+
+class GoogleEmbeddingBackend(EmbeddingBackend):
+    """Gemini embeddings. The client (and langchain_google_genai) is only loaded for the first request."""
+
+    def __init__(self, model_name: str, google_api_key: str):
+        self.model_name = model_name
+        self.google_api_key = google_api_key
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                    self._client = GoogleGenerativeAIEmbeddings(model=self.model_name,
+                                                                google_api_key=self.google_api_key)
+        return self._client
+
+    def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        return self.client.embed_documents(texts, batch_size=len(texts), task_type=task_type)
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic, offline backend for tests and benchmarks. Vectors are a hashed bag of words, so
+    texts sharing words end up close to each other, which keeps retrieval results meaningful.
+    """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available."""
+
+    def __init__(self, rate_per_second: float, capacity: Optional[float] = None):
+        self.rate = rate_per_second
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_second)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_time = (tokens - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """True for rate-limit (429) and server-side (5xx) failures, which are worth retrying."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        for attribute in ("status_code", "code", "http_status"):
+            value = getattr(error, attribute, None)
+            value = value() if callable(value) else value
+            value = getattr(value, "value", value)  # gRPC/HTTP status enums
+            if isinstance(value, int) and (value == 429 or 500 <= value < 600):
+                return True
+        message = str(error).lower()
+        if any(marker in message for marker in ("429", "resource exhausted", "resourceexhausted", "quota",
+                                                "rate limit", "unavailable", "internal error", "deadline exceeded")):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embeddings client that packs texts into batches bounded by count and estimated tokens, sends up to
+    max_concurrency batches in parallel under a requests-per-minute token bucket, and retries 429/5xx
+    failures with jittered exponential backoff.
+    With query_window_seconds > 0, embed_query() calls from concurrent threads are gathered by a
+    MicroBatcher and sent as one request (see MicroBatcher for the window/max-wait/size limits).
+    """
+
+    def __init__(self, backend: EmbeddingBackend, max_batch_size: int = 100, max_batch_tokens: int = 20000,
+                 max_concurrency: int = 4, requests_per_minute: Optional[float] = None, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 30.0, query_window_seconds: float = 0.0,
+                 query_max_wait_seconds: float = 0.01, query_max_batch_size: int = 32):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0) if requests_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._texts_embedded = 0
+        self._requests = 0
+        self._retries = 0
+        self._busy_seconds = 0.0
+        self.query_batcher: Optional[MicroBatcher[str, List[float]]] = None
+        if query_window_seconds > 0:
+            self.query_batcher = MicroBatcher(self.embed_queries, window_seconds=query_window_seconds,
+                                              max_wait_seconds=query_max_wait_seconds,
+                                              max_batch_size=min(query_max_batch_size, max_batch_size),
+                                              max_concurrency=self.max_concurrency, name="query-embedding")
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+    def _make_batches(self, texts: List[str]) -> List[List[str]]:
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for text in texts:
+            tokens = self.estimate_tokens(text)
+            if current and (len(current) >= self.max_batch_size or current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _call_with_retry(self, texts: List[str], task_type: str) -> List[List[float]]:
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            try:
+                vectors = self.backend.embed_batch(texts, task_type)
+                with self._lock:
+                    self._requests += 1
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                # Full jitter keeps parallel workers from retrying in lockstep.
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                print(f"Embedding request failed ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                with self._lock:
+                    self._retries += 1
+                time.sleep(delay)
+                attempt += 1
+
+    def _embed(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if not texts:
+            return []
+        start = time.monotonic()
+        batches = self._make_batches(texts)
+        if len(batches) == 1 or self.max_concurrency == 1:
+            results = [self._call_with_retry(batch, task_type) for batch in batches]
+        else:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                        thread_name_prefix="embedding")
+            results = list(self._executor.map(lambda batch: self._call_with_retry(batch, task_type), batches))
+        with self._lock:
+            self._texts_embedded += len(texts)
+            self._busy_seconds += time.monotonic() - start
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, DOCUMENT_TASK)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_batcher is not None:
+            return self.query_batcher(text)
+        return self._embed([text], QUERY_TASK)[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeds several queries as queries (not documents); a text asked for twice is sent once."""
+        unique = list(dict.fromkeys(texts))
+        vectors = dict(zip(unique, self._embed(unique, QUERY_TASK)))
+        return [vectors[text] for text in texts]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "texts": self._texts_embedded,
+                "requests": self._requests,
+                "retries": self._retries,
+                "chunks_per_second": self._texts_embedded / self._busy_seconds if self._busy_seconds else 0.0,
+            }
@@ -1,29 +1,80 @@
 import os
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from typing import Optional
+
 from langchain_core.embeddings import Embeddings
 
+from knowledge.embedding_cache import CachedEmbeddings
+from knowledge.embedding_client import BatchingEmbeddings, EmbeddingBackend, FakeEmbeddingBackend, \
+    GoogleEmbeddingBackend
+
 
 class EmbeddingManager:
     """
     Manages the initialization of the embedding model.
+    Requests go through a BatchingEmbeddings client (batching, concurrency, rate limiting and retries),
+    which is wrapped in a CachedEmbeddings so repeated texts are never sent to the API twice.
     """
 
-    def __init__(self, model_name: str = "models/embedding-001"):
+    def __init__(self, model_name: str = "models/embedding-001", cache_directory: Optional[str] = None,
+                 query_cache_size: int = 1024, backend: str = "google", max_batch_size: int = 100,
+                 max_concurrency: int = 4, requests_per_minute: Optional[float] = None,
+                 query_window_seconds: float = 0.0, query_max_wait_seconds: float = 0.01,
+                 query_max_batch_size: int = 32):
         self.model_name = model_name
+        self.backend_name = backend
         self.google_api_key = os.getenv("GEMINI_API_KEY")
-        if not self.google_api_key:
+        if backend == "google" and not self.google_api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables. Please set it.")
-        self.embeddings: Embeddings = self._initialize_embeddings()
-        print(f"EmbeddingManager initialized with model: {model_name}")
+        self.client = BatchingEmbeddings(
+            backend=self._initialize_backend(),
+            max_batch_size=max_batch_size,
+            max_concurrency=max_concurrency,
+            requests_per_minute=requests_per_minute,
+            query_window_seconds=query_window_seconds,
+            query_max_wait_seconds=query_max_wait_seconds,
+            query_max_batch_size=query_max_batch_size
+        )
+        self.embeddings: CachedEmbeddings = CachedEmbeddings(
+            underlying=self.client,
+            model_name=f"{backend}:{model_name}",
+            cache_directory=cache_directory,
+            query_cache_size=query_cache_size
+        )
+        print(f"EmbeddingManager initialized with model: {model_name} (backend: {backend}, "
+              f"cache: {cache_directory or 'memory only'})")
 
-    def _initialize_embeddings(self) -> Embeddings:
+    def _initialize_backend(self) -> EmbeddingBackend:
+        if self.backend_name == "fake":
+            print("Using the offline fake embedding backend.")
+            return FakeEmbeddingBackend()
+        if self.backend_name != "google":
+            raise ValueError(f"Unsupported embedding backend: {self.backend_name}")
         try:
-            embeddings_model = GoogleGenerativeAIEmbeddings(model=self.model_name, google_api_key=self.google_api_key)
-            print("Google Generative AI Embeddings initialized successfully.")
-            return embeddings_model
+            backend = GoogleEmbeddingBackend(model_name=self.model_name, google_api_key=self.google_api_key)
+            print("Google Generative AI Embeddings configured; the client is created on first use.")
+            return backend
         except Exception as e:
             print(f"Error initializing Google embeddings: {e}")
             raise
 
     def get_embeddings(self) -> Embeddings:
         return self.embeddings
+
+    def warm_up(self):
+        """
+        Embeds one query straight through the client, bypassing the cache, so the backend client is
+        created and its connection opened before the first real query.
+        """
+        self.client.embed_query("warm up")
+
+    def get_cache_stats(self) -> dict:
+        """Returns embedding cache hit/miss counters; every hit is an API call saved."""
+        return self.embeddings.stats()
+
+    def get_client_stats(self) -> dict:
+        """Returns request, retry and throughput (chunks per second) counters of the embedding client."""
+        return self.client.stats()
+
+    def get_query_batch_stats(self) -> dict:
+        """Returns how many query embeddings were sent per request; empty when batching is off."""
+        return self.client.query_batcher.stats() if self.client.query_batcher else {}
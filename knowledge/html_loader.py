@@ -0,0 +1,82 @@
+from typing import Iterator, List
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_SKIPPED = {"script", "style", "noscript", "template", "head", "nav", "svg"}
+_BLOCKS = {"p", "li", "dt", "dd", "blockquote", "figcaption", "caption", "summary"}
+_CONTAINERS = {"html", "body", "main", "article", "section", "div", "header", "footer", "aside", "ul", "ol", "dl",
+               "table", "thead", "tbody", "tfoot", "figure", "details", "form", "fieldset"}
+
+
+class HTMLMarkdownLoader(BaseLoader):
+    """
+    Loads an HTML file as Markdown-style text: headings become "#" lines, <pre> blocks become fenced
+    code blocks, list items "- " lines and table rows " | "-separated lines. Keeping the structure
+    lets the chunker split on sections and attach the section path to each chunk.
+    """
+
+    def __init__(self, file_path: str, encoding: str = "utf-8"):
+        self.file_path = file_path
+        self.encoding = encoding
+
+    def lazy_load(self) -> Iterator[Document]:
+        from bs4 import BeautifulSoup
+
+        with open(self.file_path, encoding=self.encoding, errors="replace") as f:
+            soup = BeautifulSoup(f.read(), "html.parser")
+        title = soup.title.get_text(" ", strip=True) if soup.title else ""
+        lines: List[str] = []
+        self._render(soup.body or soup, lines)
+        metadata = {"source": self.file_path}
+        if title:
+            metadata["title"] = title
+        yield Document(page_content="\n\n".join(lines), metadata=metadata)
+
+    def _render(self, node, lines: List[str]):
+        inline: List[str] = []
+
+        def flush_inline():
+            text = " ".join("".join(inline).split())
+            if text:
+                lines.append(text)
+            inline.clear()
+
+        for child in node.children:
+            name = getattr(child, "name", None)
+            if name is None:
+                if type(child).__name__ == "NavigableString":
+                    inline.append(str(child))
+                continue
+            if name in _SKIPPED:
+                continue
+            if name in _HEADINGS:
+                flush_inline()
+                text = child.get_text(" ", strip=True)
+                if text:
+                    lines.append(f"{'#' * _HEADINGS[name]} {text}")
+            elif name == "pre":
+                flush_inline()
+                lines.append(f"```\n{child.get_text().strip(chr(10))}\n```")
+            elif name == "tr":
+                flush_inline()
+                cells = [cell.get_text(" ", strip=True) for cell in child.find_all(["td", "th"])]
+                if any(cells):
+                    lines.append(" | ".join(cells))
+            elif name in _BLOCKS:
+                flush_inline()
+                if child.find(list(_HEADINGS) + ["pre", "table", "ul", "ol"]):
+                    self._render(child, lines)
+                    continue
+                text = child.get_text(" ", strip=True)
+                if text:
+                    lines.append(f"- {text}" if name == "li" else text)
+            elif name in _CONTAINERS:
+                flush_inline()
+                self._render(child, lines)
+            elif name == "br":
+                inline.append(" ")
+            else:
+                inline.append(child.get_text(" "))
+        flush_inline()
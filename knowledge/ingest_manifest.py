@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+
+class IngestManifest:
+    """
+    Records, per source file, the hash of its content and the IDs of the chunks it produced.
+    Used to re-ingest only added or changed files and to delete chunks of removed files.
+    `settings` holds the chunking settings the recorded chunks were made with.
+    """
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.files: Dict[str, Dict] = {}
+        self.settings: Optional[Dict] = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            self.files = {}
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.settings = data.get("settings")
+            print(f"Loaded ingest manifest '{self.manifest_path}' tracking {len(self.files)} file(s).")
+        except (OSError, ValueError) as e:
+            print(f"Could not read ingest manifest '{self.manifest_path}', starting from scratch. Error: {e}")
+            self.files = {}
+
+    def save(self):
+        """Writes the manifest atomically so an interrupted save never leaves a truncated file."""
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "settings": self.settings}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def clear(self):
+        self.files = {}
+        self.settings = None
+
+    def get_hash(self, file_path: str) -> Optional[str]:
+        entry = self.files.get(file_path)
+        return entry["hash"] if entry else None
+
+    def get_chunk_ids(self, file_path: str) -> List[str]:
+        entry = self.files.get(file_path)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def record(self, file_path: str, file_hash: str, chunk_ids: List[str]):
+        self.files[file_path] = {"hash": file_hash, "chunk_ids": list(chunk_ids)}
+
+    def remove(self, file_path: str) -> List[str]:
+        """Forgets a file and returns the chunk IDs that belonged to it."""
+        entry = self.files.pop(file_path, None)
+        return list(entry["chunk_ids"]) if entry else []
+
+    def tracked_files(self) -> List[str]:
+        return list(self.files.keys())
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def chunk_id(file_path: str, file_hash: str, index: int) -> str:
+        """
+        Stable chunk ID: the same file content always produces the same IDs, so re-storing
+        a chunk is an upsert rather than a duplicate.
+        """
+        return hashlib.sha1(f"{file_path}\0{file_hash}\0{index}".encode("utf-8")).hexdigest()
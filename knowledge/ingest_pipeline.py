@@ -0,0 +1,370 @@
+import queue
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from knowledge.dedup_index import DedupIndex
+from knowledge.document_manager import DocumentManager
+from knowledge.ingest_manifest import IngestManifest
+from knowledge.metadata_tagger import MetadataTagger
+from knowledge.text_processor import TextProcessor
+from knowledge.vector_store_manager import VectorStoreManager
+from utils import telemetry
+
+_DONE = object()
+
+
+class _Aborted(Exception):
+    pass
+
+
+class _ChunkBatch:
+    def __init__(self):
+        self.ids: List[str] = []  # IDs to store under (the canonical IDs when deduplicating)
+        self.refs: List[str] = []  # the chunks' own IDs, recorded in the manifest
+        self.documents: List[Document] = []
+        self.files: List[str] = []  # source file of each chunk, used to track file completion
+        self.embeddings: Optional[List[List[float]]] = None
+
+
+def release_chunks(vector_store_manager: VectorStoreManager, dedup: Optional[DedupIndex], chunk_ids: Iterable[str]):
+    """Deletes chunks of removed or replaced files; with deduplication, only those nothing else refers to."""
+    if dedup is None:
+        vector_store_manager.delete_documents(list(chunk_ids))
+        return
+    deleted, updated = dedup.commit((), chunk_ids)
+    vector_store_manager.delete_documents(deleted)
+    update_sources(vector_store_manager, dedup, updated)
+
+
+def update_sources(vector_store_manager: VectorStoreManager, dedup: DedupIndex, canonical_ids: List[str]):
+    """
+    Rewrites the "sources" metadata of deduplicated chunks ("; "-separated, as vector store metadata
+    must be scalar). If the chunk's own source is gone, the first remaining one takes its place.
+    """
+    if not canonical_ids:
+        return
+    documents = vector_store_manager.backend.get_by_ids(canonical_ids)
+    metadatas = []
+    for document in documents:
+        metadata = dict(document.metadata or {})
+        sources = dedup.sources(document.id)
+        if sources and metadata.get("source") not in sources:
+            metadata["source"] = sources[0]
+            metadata.pop("page", None)
+        metadata["sources"] = "; ".join(sources)
+        metadatas.append(metadata)
+    vector_store_manager.update_metadata([document.id for document in documents], metadatas)
+
+
+class IngestPipeline:
+    """
+    Streams files through load -> chunk -> embed -> store stages connected by bounded queues.
+    Embedding and storage happen in batches, so only a few batches are ever held in memory.
+    A file is committed to the manifest only after all of its chunks are stored; the manifest is
+    the checkpoint, so an interrupted run resumes with the files that were not committed. A file
+    that fails to load is not committed and keeps its previous chunks.
+
+    With staged=True the new chunks stay hidden from queries while the run is in progress and the
+    whole run is published at the end in one step (removed files included), so a running bot never
+    answers from a half-updated knowledge base. A failed staged run is discarded.
+
+    With a DedupIndex, chunks that nearly duplicate a stored chunk (or one earlier in the run) are
+    not embedded; the file refers to the existing chunk instead, and is committed once that chunk
+    is stored.
+
+    With a MetadataTagger, each file's documents are tagged (path fields, file type, front-matter)
+    before they are chunked, so that queries can filter on the tags.
+    """
+
+    def __init__(self, doc_manager: DocumentManager, text_processor: TextProcessor, embeddings: Embeddings,
+                 vector_store_manager: VectorStoreManager, manifest: IngestManifest,
+                 batch_size: int = 64, embed_workers: int = 2, queue_size: int = 4,
+                 checkpoint_interval: float = 2.0, staged: bool = False, dedup: Optional[DedupIndex] = None,
+                 tagger: Optional[MetadataTagger] = None):
+        self.doc_manager = doc_manager
+        self.text_processor = text_processor
+        self.embeddings = embeddings
+        self.vector_store_manager = vector_store_manager
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.embed_workers = max(1, embed_workers)
+        self.queue_size = queue_size
+        self.checkpoint_interval = checkpoint_interval
+        self.staged = staged
+        self.dedup = dedup
+        self.tagger = tagger
+
+    def run(self, file_hashes: Dict[str, str], removed_files: Sequence[str] = ()) -> Dict[str, float]:
+        """
+        Ingests the given files ({path: content hash}) and drops the chunks of removed_files.
+        Chunks of a file's previous version are deleted once its new version is committed.
+        Returns run statistics.
+        """
+        if removed_files and not self.staged:
+            for file_path in removed_files:
+                release_chunks(self.vector_store_manager, self.dedup, self.manifest.remove(file_path))
+        self._file_hashes = file_hashes
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._pending_chunks: Dict[str, int] = {}
+        self._chunks_done: Dict[str, List[str]] = {}
+        self._last_checkpoint = time.monotonic()
+        self._stats = {"files": 0, "failed_files": 0, "chunks": 0, "batches": 0, "duplicates": 0}
+        self._in_flight: Dict[str, List[Tuple[str, str]]] = {}  # canonical ID -> (file, ref) waiting for it
+        self._stats_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._staged_ids: List[str] = []
+        self._staged_files: List[Tuple[str, List[str]]] = []
+
+        load_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        embed_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        store_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=self._guard, args=(self._load_stage, load_queue), name="ingest-load"),
+            threading.Thread(target=self._guard, args=(self._chunk_stage, load_queue, embed_queue),
+                             name="ingest-chunk"),
+            threading.Thread(target=self._guard, args=(self._store_stage, store_queue), name="ingest-store"),
+        ]
+        threads += [
+            threading.Thread(target=self._guard, args=(self._embed_stage, embed_queue, store_queue),
+                             name=f"ingest-embed-{i}")
+            for i in range(self.embed_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self._stop.set()
+            raise
+        finally:
+            if self.staged:
+                self._finish_staged(removed_files)
+            elif self.dedup is not None:
+                # Chunks stored for files that never completed, and that no committed file refers to.
+                self.vector_store_manager.delete_documents(self.dedup.discard())
+            with self._commit_lock:
+                self._save()
+
+        elapsed = time.monotonic() - start
+        unique_chunks = self._stats["chunks"] + self._stats["duplicates"]
+        stats = dict(self._stats, seconds=elapsed,
+                     chunks_per_second=self._stats["chunks"] / elapsed if elapsed > 0 else 0.0,
+                     dedup_rate=self._stats["duplicates"] / unique_chunks if unique_chunks else 0.0)
+        if self._errors:
+            print(f"Ingest stopped after committing {stats['files']} file(s): {self._errors[0]}")
+            raise self._errors[0]
+        print(f"Ingest finished: {stats['files']} file(s), {stats['chunks']} chunk(s) in {stats['batches']} "
+              f"batch(es), {elapsed:.1f}s ({stats['chunks_per_second']:.1f} chunks/s).")
+        if stats["failed_files"]:
+            print(f"{stats['failed_files']} file(s) failed to load and were left unchanged; they are retried next run.")
+        if self.dedup is not None:
+            print(f"Deduplication: {stats['duplicates']} near-duplicate chunk(s) skipped "
+                  f"({stats['dedup_rate']:.1%} of {unique_chunks}).")
+        return stats
+
+    def _save(self):
+        self.vector_store_manager.flush()
+        if self.dedup is not None:
+            self.dedup.save()
+        self.manifest.save()
+
+    def _guard(self, stage, *queues):
+        try:
+            stage(*queues)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _put(self, q: queue.Queue, item):
+        while True:
+            if self._stop.is_set():
+                raise _Aborted()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while True:
+            if self._stop.is_set():
+                raise _Aborted()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _load_stage(self, load_queue: queue.Queue):
+        for file_path, documents in self.doc_manager.iter_loaded_files(list(self._file_hashes)):
+            self._put(load_queue, (file_path, documents))
+        self._put(load_queue, _DONE)
+
+    def _chunk_stage(self, load_queue: queue.Queue, embed_queue: queue.Queue):
+        batch = _ChunkBatch()
+        while True:
+            item = self._get(load_queue)
+            if item is _DONE:
+                break
+            file_path, documents = item
+            if documents is None:
+                # Not committed: the file keeps its stored chunks and manifest entry, so the next
+                # run retries it instead of treating it as empty.
+                with self._stats_lock:
+                    self._stats["failed_files"] += 1
+                continue
+            if self.tagger is not None:
+                documents = self.tagger.tag(file_path, documents)
+            chunks = self.text_processor.split_documents(documents)
+            file_hash = self._file_hashes[file_path]
+            previous_ids = set(self.manifest.get_chunk_ids(file_path)) if self.dedup is not None else set()
+            with self._stats_lock:
+                self._pending_chunks[file_path] = len(chunks)
+                self._chunks_done[file_path] = []
+            if not chunks:
+                self._commit_file(file_path)
+                continue
+            for index, chunk in enumerate(chunks):
+                ref_id = IngestManifest.chunk_id(file_path, file_hash, index)
+                chunk_id = ref_id
+                if self.dedup is not None:
+                    chunk_id, is_new = self.dedup.assign(ref_id, chunk.page_content,
+                                                         chunk.metadata.get("source", file_path), previous_ids,
+                                                         self.tagger.scope(chunk.metadata) if self.tagger else "")
+                    if not is_new:
+                        self._duplicate(file_path, ref_id, chunk_id)
+                        continue
+                    with self._stats_lock:
+                        self._in_flight[chunk_id] = []
+                batch.ids.append(chunk_id)
+                batch.refs.append(ref_id)
+                batch.documents.append(chunk)
+                batch.files.append(file_path)
+                if len(batch.ids) >= self.batch_size:
+                    self._put(embed_queue, batch)
+                    batch = _ChunkBatch()
+        if batch.ids:
+            self._put(embed_queue, batch)
+        for _ in range(self.embed_workers):
+            self._put(embed_queue, _DONE)
+
+    def _duplicate(self, file_path: str, ref_id: str, canonical_id: str):
+        """Counts a duplicate chunk as done, or as waiting if its canonical chunk is not stored yet."""
+        with self._stats_lock:
+            self._stats["duplicates"] += 1
+            waiting = self._in_flight.get(canonical_id)
+            if waiting is not None:
+                waiting.append((file_path, ref_id))
+                return
+        telemetry.increment("ingest_duplicate_chunks_total")
+        self._chunk_done(file_path, ref_id)
+
+    def _chunk_done(self, file_path: str, ref_id: str):
+        with self._stats_lock:
+            self._chunks_done[file_path].append(ref_id)
+            self._pending_chunks[file_path] -= 1
+            complete = self._pending_chunks[file_path] == 0
+        if complete:
+            self._commit_file(file_path)
+
+    def _embed_stage(self, embed_queue: queue.Queue, store_queue: queue.Queue):
+        while True:
+            batch = self._get(embed_queue)
+            if batch is _DONE:
+                break
+            started = time.perf_counter()
+            batch.embeddings = self.embeddings.embed_documents([doc.page_content for doc in batch.documents])
+            telemetry.observe("ingest_batch_seconds", time.perf_counter() - started, stage="embed")
+            self._put(store_queue, batch)
+        self._put(store_queue, _DONE)
+
+    def _store_stage(self, store_queue: queue.Queue):
+        remaining_embedders = self.embed_workers
+        while remaining_embedders:
+            batch = self._get(store_queue)
+            if batch is _DONE:
+                remaining_embedders -= 1
+                continue
+            started = time.perf_counter()
+            if self.staged:
+                with self._stats_lock:
+                    self._staged_ids.extend(batch.ids)
+            self.vector_store_manager.store_embeddings(batch.documents, batch.embeddings, batch.ids,
+                                                       staged=self.staged)
+            telemetry.observe("ingest_batch_seconds", time.perf_counter() - started, stage="store")
+            telemetry.increment("ingest_chunks_total", len(batch.ids))
+            with self._stats_lock:
+                self._stats["batches"] += 1
+                self._stats["chunks"] += len(batch.ids)
+            for file_path, chunk_id, ref_id in zip(batch.files, batch.ids, batch.refs):
+                waiting = []
+                if self.dedup is not None:
+                    with self._stats_lock:
+                        waiting = self._in_flight.pop(chunk_id, [])
+                self._chunk_done(file_path, ref_id)
+                for waiting_file, waiting_ref in waiting:
+                    telemetry.increment("ingest_duplicate_chunks_total")
+                    self._chunk_done(waiting_file, waiting_ref)
+
+    def _commit_file(self, file_path: str):
+        """Marks a fully stored file as done and drops the chunks of its previous version."""
+        with self._stats_lock:
+            chunk_ids = self._chunks_done.pop(file_path)
+            del self._pending_chunks[file_path]
+            self._stats["files"] += 1
+            if self.staged:
+                self._staged_files.append((file_path, chunk_ids))
+                return
+        with self._commit_lock:
+            stale_ids = set(self.manifest.get_chunk_ids(file_path)) - set(chunk_ids)
+            if self.dedup is None:
+                self.vector_store_manager.delete_documents(sorted(stale_ids))
+            else:
+                deleted, updated = self.dedup.commit(chunk_ids, sorted(stale_ids))
+                self.vector_store_manager.delete_documents(deleted)
+                update_sources(self.vector_store_manager, self.dedup, updated)
+            self.manifest.record(file_path, self._file_hashes[file_path], sorted(chunk_ids))
+            if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                self._save()
+                self._last_checkpoint = time.monotonic()
+
+    def _finish_staged(self, removed_files: Sequence[str]):
+        """Publishes a completed staged run in one step, or discards a failed one."""
+        finished_files = len(self._staged_files) + self._stats["failed_files"]
+        if self._errors or self._stop.is_set() or finished_files < len(self._file_hashes):
+            print(f"Discarding {len(self._staged_ids)} staged chunk(s) of the unfinished update.")
+            if self.dedup is not None:
+                self.dedup.discard()
+            self.vector_store_manager.discard_staged(self._staged_ids)
+            return
+        with self._commit_lock:
+            staged_ids = set(self._staged_ids)
+            retired_ids = set()
+            for file_path, chunk_ids in self._staged_files:
+                retired_ids.update(set(self.manifest.get_chunk_ids(file_path)) - set(chunk_ids))
+            for file_path in removed_files:
+                retired_ids.update(self.manifest.get_chunk_ids(file_path))
+            updated: List[str] = []
+            if self.dedup is not None:
+                committed = [ref_id for _, chunk_ids in self._staged_files for ref_id in chunk_ids]
+                deleted, updated = self.dedup.commit(committed, sorted(retired_ids))
+                retired_ids = set(deleted)
+            self.vector_store_manager.publish(sorted(staged_ids), sorted(retired_ids - staged_ids))
+            if updated:
+                update_sources(self.vector_store_manager, self.dedup, updated)
+            for file_path, chunk_ids in self._staged_files:
+                self.manifest.record(file_path, self._file_hashes[file_path], sorted(chunk_ids))
+            for file_path in removed_files:
+                self.manifest.remove(file_path)
+        print(f"Published {len(self._staged_files)} updated and {len(removed_files)} removed file(s): "
+              f"{len(staged_ids)} chunk(s) added, {len(retired_ids - staged_ids)} retired.")
@@ -0,0 +1,229 @@
+import gzip
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from knowledge.vector_backend import SecondaryIndex
+
+# Keeps service names, error codes and versions ("api-gw", "ERR_502", "v1.2") together.
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound terms are also indexed by their parts so "api-gw" matches "gw"."""
+    tokens: List[str] = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuses ranked ID lists: each ID scores sum(1 / (k + rank)) over the lists it appears in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index(SecondaryIndex):
+    """
+    Inverted index over chunks (term -> {chunk ID: term frequency}) with BM25 scoring.
+    The corpus statistics BM25 needs (chunk count and total length) are kept up to date as chunks
+    are added and removed, and IDF is computed per query term, so a query only walks the postings
+    of its own terms and never rescans the index, even while an ingest is writing to it.
+
+    Persisted as a gzipped JSON snapshot plus an append-only log of the changes made since: a
+    checkpoint only appends what changed, and the snapshot is rewritten once the log has grown to
+    the size of the index, so persisting costs time proportional to the changes. The per-chunk term
+    lists needed for deletes are rebuilt from the postings on load.
+    """
+
+    def __init__(self, index_path: str, k1: float = 1.5, b: float = 0.75):
+        self.index_path = index_path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._total_length = 0
+        self._changes: List[dict] = []  # not yet written to the log, in order
+        self._logged_chunks = 0  # chunk additions and removals in the log
+        self._needs_snapshot = True
+        self.load()
+
+    @property
+    def log_path(self) -> str:
+        return f"{self.index_path}.log"
+
+    def load(self):
+        # Without a snapshot, a leftover log is not replayed: it only holds changes on top of one.
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with gzip.open(self.index_path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read lexical index '{self.index_path}', it will be rebuilt. Error: {e}")
+            return
+        with self._lock:
+            self.postings = data["postings"]
+            self.doc_lengths = data["doc_lengths"]
+            self._doc_terms = {}
+            for term, chunk_tfs in self.postings.items():
+                for chunk_id in chunk_tfs:
+                    self._doc_terms.setdefault(chunk_id, []).append(term)
+            self._total_length = sum(self.doc_lengths.values())
+            self._changes = []
+            self._needs_snapshot = False
+            self._logged_chunks = self._replay_log()
+        print(f"Loaded lexical index '{self.index_path}' with {len(self.doc_lengths)} chunk(s).")
+
+    def _replay_log(self) -> int:
+        """Applies the logged changes to the loaded snapshot; returns the number of chunks they touch."""
+        if not os.path.exists(self.log_path):
+            return 0
+        replayed = 0
+        with open(self.log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    # A checkpoint interrupted while appending; everything before it is complete.
+                    print(f"Ignoring the incomplete end of lexical index log '{self.log_path}'.")
+                    self._needs_snapshot = True
+                    break
+                replayed += self._apply(change)
+        return replayed
+
+    def _apply(self, change: dict) -> int:
+        if "reset" in change:
+            self.postings, self.doc_lengths, self._doc_terms = {}, {}, {}
+            self._total_length = 0
+            return 0
+        if "remove" in change:
+            self._remove(change["remove"])
+            return len(change["remove"])
+        self._remove(list(change["add"]))
+        for chunk_id, term_counts in change["add"].items():
+            self._add(chunk_id, term_counts)
+        return len(change["add"])
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add_chunks(self, ids: List[str], documents: List[Document]):
+        # A chunk ID listed twice keeps its last document, as in the store.
+        added = {chunk_id: dict(Counter(tokenize(document.page_content)))
+                 for chunk_id, document in zip(ids, documents)}
+        change = {"add": added}
+        with self._lock:
+            self._apply(change)
+            self._changes.append(change)
+
+    def remove_chunks(self, ids: List[str]):
+        with self._lock:
+            self._remove(ids)
+            self._changes.append({"remove": list(ids)})
+
+    def _add(self, chunk_id: str, term_counts: Dict[str, int]):
+        for term, tf in term_counts.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        self._doc_terms[chunk_id] = list(term_counts)
+        self.doc_lengths[chunk_id] = sum(term_counts.values())
+        self._total_length += self.doc_lengths[chunk_id]
+
+    def _remove(self, ids: List[str]):
+        for chunk_id in ids:
+            for term in self._doc_terms.pop(chunk_id, []):
+                chunk_tfs = self.postings.get(term)
+                if chunk_tfs is not None:
+                    chunk_tfs.pop(chunk_id, None)
+                    if not chunk_tfs:
+                        del self.postings[term]
+            self._total_length -= self.doc_lengths.pop(chunk_id, 0)
+
+    def reset(self):
+        with self._lock:
+            self._apply({"reset": True})
+            self._changes = []
+            self._needs_snapshot = True
+
+    def search(self, query_text: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Returns the top-k (chunk ID, BM25 score) pairs for the query."""
+        with self._lock:
+            total = len(self.doc_lengths)
+            if not total:
+                return []
+            # Length normalisation is k1 * (1 - b + b * length / average_length), split into a
+            # constant and a per-length factor.
+            norm_base = self.k1 * (1.0 - self.b)
+            norm_per_length = self.k1 * self.b * total / self._total_length if self._total_length else 0.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query_text)):
+                chunk_tfs = self.postings.get(term)
+                if not chunk_tfs:
+                    continue
+                idf = math.log(1.0 + (total - len(chunk_tfs) + 0.5) / (len(chunk_tfs) + 0.5))
+                for chunk_id, tf in chunk_tfs.items():
+                    length_norm = norm_base + norm_per_length * self.doc_lengths[chunk_id]
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + length_norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def flush(self):
+        """
+        Appends the changes since the last flush to the log, or rewrites the snapshot (and empties
+        the log) once the log would hold as many chunk changes as the index holds chunks.
+        """
+        with self._flush_lock:
+            # Only copying happens under the lock; serialising and compressing, the slow part, does
+            # not hold up searches.
+            with self._lock:
+                changes, self._changes = self._changes, []
+                changed_chunks = sum(len(change.get("add", change.get("remove", ()))) for change in changes)
+                snapshot = self._needs_snapshot or self._logged_chunks + changed_chunks >= len(self.doc_lengths)
+                if not changes and not self._needs_snapshot:
+                    return
+                if snapshot:
+                    data = {"postings": {term: dict(chunk_tfs) for term, chunk_tfs in self.postings.items()},
+                            "doc_lengths": dict(self.doc_lengths)}
+            try:
+                if snapshot:
+                    self._write_snapshot(data)
+                    self._logged_chunks = 0
+                    self._needs_snapshot = False
+                else:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        for change in changes:
+                            f.write(json.dumps(change, separators=(",", ":")) + "\n")
+                    self._logged_chunks += changed_chunks
+            except OSError:
+                # The log may now end with a partial change; the next flush writes a full snapshot.
+                with self._lock:
+                    self._needs_snapshot = True
+                raise
+
+    def _write_snapshot(self, data: dict):
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+        # Replaying the old log over the new snapshot would be harmless (it only repeats changes
+        # the snapshot already holds), so a crash before this point loses nothing.
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
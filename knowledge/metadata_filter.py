@@ -0,0 +1,192 @@
+import json
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Operators a condition may use; a bare value means "$eq" and a list means "$in".
+OPERATORS = ("$eq", "$in", "$gt", "$gte", "$lt", "$lte")
+_RANGE_OPERATORS = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}
+
+Conditions = Dict[str, Dict[str, object]]
+
+
+def normalize_filter(filter: Optional[Dict[str, object]]) -> Optional[Conditions]:
+    """
+    Brings a metadata filter into the form {field: {operator: value}}; a chunk matches when every
+    condition holds. {"team": "payments"} is equality, {"file_type": ["md", "pdf"]} membership and
+    {"modified": {"$gte": 1714521600}} a range. {"max_age_days": 90} keeps chunks whose "modified"
+    time is at most 90 days old; the cut-off is rounded down to the minute so that the same filter
+    asked again shortly after is the same filter. Returns None for an empty filter.
+    """
+    if not filter:
+        return None
+    conditions: Conditions = {}
+    for field, condition in filter.items():
+        if field == "max_age_days":
+            cutoff = int(time.time() - float(condition) * 86400) // 60 * 60
+            conditions.setdefault("modified", {})["$gte"] = cutoff
+            continue
+        if isinstance(condition, dict):
+            unknown = set(condition) - set(OPERATORS)
+            if unknown:
+                raise ValueError(f"Unsupported filter operator(s) for '{field}': {sorted(unknown)}")
+            normalized = dict(condition)
+        elif isinstance(condition, (list, tuple, set, frozenset)):
+            normalized = {"$in": condition}
+        else:
+            normalized = {"$eq": condition}
+        if "$in" in normalized:
+            normalized["$in"] = list(normalized["$in"])
+        conditions.setdefault(field, {}).update(normalized)
+    return conditions
+
+
+def filter_key(conditions: Optional[Conditions]) -> str:
+    """A string identifying the filter, e.g. to group queries that share it."""
+    return json.dumps(conditions, sort_keys=True) if conditions else ""
+
+
+def to_chroma_where(conditions: Conditions) -> dict:
+    """The Chroma `where` clause for normalized conditions."""
+    clauses = [{field: {operator: value}} for field, operators in conditions.items()
+               for operator, value in operators.items()]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def matches(metadata: dict, conditions: Conditions) -> bool:
+    """Whether a chunk's metadata satisfies every condition; a missing field satisfies none."""
+    for field, operators in conditions.items():
+        value = metadata.get(field)
+        if value is None:
+            return False
+        for operator, expected in operators.items():
+            try:
+                if operator == "$eq":
+                    ok = value == expected
+                elif operator == "$in":
+                    ok = value in expected
+                else:
+                    ok = bool(_RANGE_OPERATORS[operator](value, expected))
+            except TypeError:
+                ok = False
+            if not ok:
+                return False
+    return True
+
+
+def _is_number(value) -> bool:
+    # Booleans count as numbers: SQLite's json_extract returns JSON true/false as 1/0.
+    return isinstance(value, (int, float, np.number))
+
+
+class MetadataBitmapIndex:
+    """
+    The values of a few metadata fields for every row of a NumpyBackend, laid out so that a filter
+    is resolved before any vector is scored. Each distinct text value of a field has a bitmap of the
+    rows holding it, packed eight rows to a byte, so equality and membership conditions are a few
+    byte-wise ORs and ANDs however many rows match. Numeric values (e.g. "modified") are kept as a
+    float column that range conditions are compared against.
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self._capacity = 0  # rows covered by the bitmaps and columns, a multiple of 8
+        self._bitmaps: Dict[str, Dict[object, np.ndarray]] = {field: {} for field in self.fields}
+        self._numbers: Dict[str, np.ndarray] = {field: np.empty(0) for field in self.fields}
+
+    def _grow(self, rows: int):
+        if rows <= self._capacity:
+            return
+        capacity = (max(rows, 2 * self._capacity, 1024) + 7) // 8 * 8
+        for field in self.fields:
+            for value, bitmap in self._bitmaps[field].items():
+                grown = np.zeros(capacity // 8, dtype=np.uint8)
+                grown[:len(bitmap)] = bitmap
+                self._bitmaps[field][value] = grown
+            grown = np.full(capacity, np.nan)
+            grown[:self._capacity] = self._numbers[field]
+            self._numbers[field] = grown
+        self._capacity = capacity
+
+    @staticmethod
+    def _bits(rows: np.ndarray):
+        return rows >> 3, (np.uint8(128) >> (rows & 7).astype(np.uint8)).astype(np.uint8)
+
+    def set(self, rows: Sequence[int], metadatas: Sequence[dict]):
+        """Records the metadata of (new or rewritten) rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        self._grow(int(rows.max()) + 1)
+        self.clear(rows)
+        byte_positions, bits = self._bits(rows)
+        for field in self.fields:
+            groups: Dict[object, List[int]] = {}
+            for position, metadata in enumerate(metadatas):
+                value = (metadata or {}).get(field)
+                if value is None:
+                    continue
+                if _is_number(value):
+                    self._numbers[field][rows[position]] = float(value)
+                else:
+                    groups.setdefault(value, []).append(position)
+            for value, positions in groups.items():
+                bitmap = self._bitmaps[field].get(value)
+                if bitmap is None:
+                    bitmap = self._bitmaps[field][value] = np.zeros(self._capacity // 8, dtype=np.uint8)
+                np.bitwise_or.at(bitmap, byte_positions[positions], bits[positions])
+
+    def clear(self, rows: Sequence[int]):
+        """Forgets the metadata of deleted rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < self._capacity]
+        if not len(rows):
+            return
+        byte_positions, bits = self._bits(rows)
+        for field in self.fields:
+            for bitmap in self._bitmaps[field].values():
+                np.bitwise_and.at(bitmap, byte_positions, ~bits)
+            self._numbers[field][rows] = np.nan
+
+    def mask(self, conditions: Conditions, size: int) -> Optional[np.ndarray]:
+        """
+        Boolean mask of the first `size` rows matching every condition, or None if a condition is on
+        a field this index does not hold (or compares text by range) and has to be checked otherwise.
+        """
+        packed: Optional[np.ndarray] = None
+        for field, operators in conditions.items():
+            if field not in self._bitmaps:
+                return None
+            for operator, expected in operators.items():
+                bits = self._condition_bits(field, operator, expected, size)
+                if bits is None:
+                    return None
+                packed = bits if packed is None else np.bitwise_and(packed, bits, out=packed)
+        if packed is None:
+            return np.ones(size, dtype=bool)
+        return np.unpackbits(packed, count=size).astype(bool)
+
+    def _condition_bits(self, field: str, operator: str, expected, size: int) -> Optional[np.ndarray]:
+        length = (size + 7) // 8
+        column = self._numbers[field][:size]
+        if len(column) < size:
+            column = np.concatenate([column, np.full(size - len(column), np.nan)])
+        if operator in _RANGE_OPERATORS:
+            if not _is_number(expected):
+                return None
+            with np.errstate(invalid="ignore"):
+                return np.packbits(_RANGE_OPERATORS[operator](column, float(expected)))
+        values = [expected] if operator == "$eq" else list(expected)
+        result = np.zeros(length, dtype=np.uint8)
+        numbers = [float(value) for value in values if _is_number(value)]
+        if numbers:
+            result |= np.packbits(np.isin(column, numbers))
+        for value in values:
+            if _is_number(value):
+                continue
+            bitmap = self._bitmaps[field].get(value)
+            if bitmap is not None:
+                end = min(length, len(bitmap))
+                result[:end] |= bitmap[:end]
+        return result
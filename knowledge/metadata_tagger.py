@@ -0,0 +1,109 @@
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+_FRONT_MATTER = re.compile(r"\A---[ \t]*\r?\n(.*?)\r?\n(?:---|\.\.\.)[ \t]*(?:\r?\n|\Z)", re.DOTALL)
+# Front-matter fields giving the date a document was last updated; the first one present sets "modified".
+_DATE_FIELDS = ("updated", "last_updated", "modified", "date")
+# Metadata set by the loaders and the chunker, which front-matter may not replace.
+_RESERVED_FIELDS = {"source", "sources", "page", "section"}
+
+
+class MetadataTagger:
+    """
+    Adds the metadata queries filter on to a file's documents before they are chunked, so every
+    chunk carries it:
+    - one field per directory level below the source directory, named by `path_fields`: with
+      ("team", "product"), source/payments/checkout/runbook.md gets team="payments" and
+      product="checkout", and a file directly in the source directory gets neither;
+    - "file_type": the file extension without the dot;
+    - "modified": when the document last changed, in seconds since the epoch, from the front-matter's
+      updated/date field if it has one and otherwise from the file's modification time;
+    - with `front_matter`, the fields of a YAML front-matter block ("---" lines) at the top of a text
+      or Markdown file, which is removed from the text. Lists are joined with ", ", nested mappings
+      are skipped, and front-matter values take precedence over the path's.
+
+    `scope_fields` are the fields that near-duplicate chunks must share to be merged (see scope()).
+    """
+
+    FORMAT_FIELDS = ("file_type", "modified")  # differ between copies of a document in other formats
+
+    def __init__(self, source_directory: str, path_fields: Sequence[str] = ("team", "product"),
+                 front_matter: bool = True, scope_fields: Optional[Sequence[str]] = None):
+        self.source_directory = os.path.normpath(source_directory)
+        self.path_fields = tuple(path_fields)
+        self.front_matter = front_matter
+        self.scope_fields = tuple(self.path_fields if scope_fields is None else scope_fields)
+
+    def settings(self) -> Dict[str, object]:
+        """The settings that determine the tags; stored chunks must be re-tagged when they change."""
+        return {"path_fields": list(self.path_fields), "front_matter": self.front_matter}
+
+    def tag(self, file_path: str, documents: List[Document]) -> List[Document]:
+        tags: Dict[str, object] = {}
+        relative = os.path.relpath(os.path.normpath(file_path), self.source_directory)
+        if not relative.startswith(os.pardir):
+            for field, directory in zip(self.path_fields, relative.split(os.sep)[:-1]):
+                tags[field] = directory
+        tags["file_type"] = os.path.splitext(file_path)[1].lstrip(".").lower()
+        try:
+            tags["modified"] = int(os.path.getmtime(file_path))
+        except OSError:
+            pass
+
+        if self.front_matter and documents and file_path.lower().endswith((".md", ".txt")):
+            text, fields = self._split_front_matter(file_path, documents[0].page_content)
+            if fields is not None:
+                tags.update(fields)
+                documents = [Document(page_content=text, metadata=documents[0].metadata)] + documents[1:]
+        return [Document(page_content=document.page_content, metadata=dict(document.metadata, **tags))
+                for document in documents]
+
+    def scope(self, metadata: dict) -> str:
+        """
+        Chunks are only merged as near-duplicates within one scope, so a filter on a scope field
+        (e.g. team) never loses a chunk that was deduplicated against another team's copy.
+        """
+        return "\n".join(f"{field}={metadata[field]}" for field in self.scope_fields if field in metadata)
+
+    @staticmethod
+    def _split_front_matter(file_path: str, text: str):
+        """Returns (text without the front-matter, its fields), or (text, None) if there is none."""
+        match = _FRONT_MATTER.match(text)
+        if not match:
+            return text, None
+        import yaml  # PyYAML comes with langchain
+
+        try:
+            data = yaml.safe_load(match.group(1))
+        except yaml.YAMLError as e:
+            print(f"Ignoring unreadable front-matter in {file_path}: {e}")
+            return text, None
+        if not isinstance(data, dict):
+            return text, None
+        fields: Dict[str, object] = {}
+        for key, value in data.items():
+            key = str(key)
+            if key in _RESERVED_FIELDS or key == "modified" or value is None or isinstance(value, dict):
+                continue
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            elif isinstance(value, (list, tuple)):
+                value = ", ".join(str(item) for item in value)
+            fields[key] = value
+        for key in _DATE_FIELDS:
+            if isinstance(data.get(key), (date, datetime)):
+                fields["modified"] = _epoch_seconds(data[key])
+                break
+        return text[match.end():], fields
+
+
+def _epoch_seconds(value) -> int:
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
@@ -0,0 +1,522 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from knowledge.ann_index import AnnIndex, create_ann_index
+from knowledge.metadata_filter import Conditions, MetadataBitmapIndex, matches
+from knowledge.quantization import Quantizer, create_quantizer
+from knowledge.vector_backend import VectorBackend
+
+# A filter matching less than this share of the rows is searched by scoring only the matching rows.
+_SUBSET_FRACTION = 0.5
+# With an ANN index, filters matching less than this share of the rows are searched exactly over the
+# matching rows; broader filters widen the ANN search and drop the results that do not match.
+_ANN_FILTER_FRACTION = 0.1
+
+
+class NumpyBackend(VectorBackend):
+    """
+    In-process exact search over a contiguous float32 matrix.
+    Normalized vectors live in a memory-mapped .npy file, so opening the store deserializes nothing;
+    chunk text and metadata live in a small SQLite side table that is only read for the top-k rows.
+    Deleted rows are masked out and reused by later inserts.
+    With `ann` set to "ivf" or "hnsw", searches go through an approximate index once the store holds
+    at least `ann_min_size` chunks; smaller stores are searched exactly. The ANN index is saved by
+    flush(); rows written since are recorded in the side table and re-applied when the store opens.
+    With `quantization` set to "int8" or "binary", exact searches scan compact codes kept next to the
+    matrix instead, and rescore the best `k * rescore_factor` rows against the full-precision vectors,
+    so only those rows of the float matrix are read from disk. Scores returned are always exact.
+    Filtered searches are resolved before scoring: `filter_fields` get per-value row bitmaps (built
+    from the side table on the first filtered search, then kept up to date), and a selective filter
+    only scores the rows it matches. Filters on other fields scan the side table's metadata.
+    """
+
+    def __init__(self, db_directory: str, collection_name: str, initial_capacity: int = 1024,
+                 ann: Optional[str] = None, nprobe: int = 8, ef_search: int = 64, ann_min_size: int = 10000,
+                 quantization: Optional[str] = None, rescore_factor: int = 8, filter_fields: Sequence[str] = ()):
+        self.directory = os.path.join(db_directory, f"{collection_name}_numpy")
+        self.initial_capacity = initial_capacity
+        self.ann_kind = ann
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.ann_min_size = ann_min_size
+        self._ann: Optional[AnnIndex] = None
+        self._quantizer: Optional[Quantizer] = create_quantizer(quantization)
+        self.rescore_factor = rescore_factor
+        self.filter_fields = tuple(filter_fields)
+        self._metadata_index: Optional[MetadataBitmapIndex] = None
+        self._scanned_filters: Set[Tuple[str, ...]] = set()
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._valid: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._size = 0  # rows in use, including deleted rows waiting to be reused
+        self._writes = 0  # upserts so far; codes built at a different count are stale
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    @property
+    def _valid_path(self) -> str:
+        return os.path.join(self.directory, "valid.npy")
+
+    @property
+    def _codes_path(self) -> str:
+        return os.path.join(self.directory, f"{self._quantizer.name}_codes.npy")
+
+    @property
+    def _scales_path(self) -> str:
+        return os.path.join(self.directory, f"{self._quantizer.name}_scales.npy")
+
+    def _state(self, name: str, default: int) -> int:
+        found = self._conn.execute("SELECT value FROM state WHERE name = ?", (name,)).fetchone()
+        return found[0] if found else default
+
+    def load(self):
+        with self._lock:
+            if self._conn is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.directory, "meta.sqlite"), check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS chunks "
+                               "(row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, text TEXT, metadata TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value INTEGER)")
+            # Rows written since the ANN index was last saved.
+            self._conn.execute("CREATE TABLE IF NOT EXISTS ann_pending (row INTEGER PRIMARY KEY)")
+            self._conn.commit()
+            self._size = self._state("size", 0)
+            self._writes = self._state("writes", 0)
+            if os.path.exists(self._vectors_path):
+                self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+                self._valid = np.load(self._valid_path, mmap_mode="r+")
+                if self._quantizer:
+                    self._open_codes()
+            self._ann = create_ann_index(self.ann_kind, self.directory,
+                                         dim=self._vectors.shape[1] if self._vectors is not None else None,
+                                         nprobe=self.nprobe, ef_search=self.ef_search)
+            if self._ann:
+                self._catch_up_ann()
+
+    def _catch_up_ann(self):
+        """Applies to the ANN index the writes made after it was last saved, e.g. before a crash."""
+        rows = np.asarray([row for (row,) in self._conn.execute("SELECT row FROM ann_pending").fetchall()],
+                          dtype=np.int64)
+        if not len(rows) or self._vectors is None or not self._ann.is_ready():
+            return
+        rows = rows[rows < self._size]
+        live = rows[self._valid[rows] == 1]
+        self._ann.remove(rows[self._valid[rows] == 0])
+        if len(live):
+            self._ann.add(np.asarray(self._vectors[live]), live)
+        print(f"Caught up the ANN index with {len(rows)} row(s) written after it was last saved.")
+
+    def _open_codes(self):
+        """Opens the quantized codes, (re)building them from the float matrix when missing or stale."""
+        name = self._quantizer.name
+        if os.path.exists(self._codes_path) and self._state(f"{name}_writes", -1) == self._writes:
+            codes = np.load(self._codes_path, mmap_mode="r+")
+            if codes.shape[0] == self._vectors.shape[0]:
+                self._codes = codes
+                self._scales = np.load(self._scales_path, mmap_mode="r+") if self._quantizer.has_scales else None
+                return
+        print(f"Building {name} codes for {self._size} stored vector(s)...")
+        self._codes = self._scales = None
+        self._ensure_capacity(self._vectors.shape[0], self._vectors.shape[1])
+        for start in range(0, self._size, 65536):
+            end = min(start + 65536, self._size)
+            codes, scales = self._quantizer.encode(self._vectors[start:end])
+            self._codes[start:end] = codes
+            if scales is not None:
+                self._scales[start:end] = scales
+        self._flush_codes()
+        self._conn.execute("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", (f"{name}_writes", self._writes))
+        self._conn.commit()
+
+    def _flush_codes(self):
+        self._codes.flush()
+        if self._scales is not None:
+            self._scales.flush()
+
+    def count(self) -> int:
+        with self._lock:
+            self.load()
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _ensure_capacity(self, rows: int, dim: int):
+        """
+        Grows the memory-mapped files (doubling) so that at least `rows` rows fit. Quantized codes
+        that are not open yet are created at the matrix's capacity, to be filled by the caller.
+        """
+        if self._vectors is not None:
+            if self._vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {dim} does not match store dimension {self._vectors.shape[1]}")
+            if self._vectors.shape[0] >= rows and (not self._quantizer or self._codes is not None):
+                return
+        old_capacity = self._vectors.shape[0] if self._vectors is not None else 0
+        capacity = old_capacity if old_capacity >= rows else max(self.initial_capacity, rows, 2 * old_capacity)
+        files = [(self._vectors_path, np.float32, (capacity, dim), self._vectors),
+                 (self._valid_path, np.uint8, (capacity,), self._valid)]
+        if self._quantizer:
+            code_shape, code_dtype = self._quantizer.code_shape(dim)
+            files.append((self._codes_path, code_dtype, (capacity,) + code_shape, self._codes))
+            if self._quantizer.has_scales:
+                files.append((self._scales_path, np.float32, (capacity,), self._scales))
+        if capacity == old_capacity:
+            files = files[2:]  # only the codes are missing
+        grown = []
+        for path, dtype, shape, old in files:
+            array = np.lib.format.open_memmap(f"{path}.tmp", mode="w+", dtype=dtype, shape=shape)
+            if old is not None:
+                array[:old.shape[0]] = old
+            array.flush()
+            grown.append(array)
+        for path, _, _, _ in files:
+            os.replace(f"{path}.tmp", path)
+        if capacity != old_capacity:
+            self._vectors, self._valid = grown[0], grown[1]
+            grown = grown[2:]
+        if self._quantizer:
+            self._codes = grown[0]
+            self._scales = grown[1] if self._quantizer.has_scales else None
+
+    def upsert(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[Document]):
+        if not ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1.0, norms)
+        with self._lock:
+            self.load()
+            rows = self._assign_rows(ids)
+            self._ensure_capacity(self._size, matrix.shape[1])
+            row_array = np.asarray(rows)
+            self._vectors[row_array] = matrix
+            self._valid[row_array] = 1
+            self._vectors.flush()
+            self._valid.flush()
+            self._writes += 1
+            state = [("size", self._size), ("writes", self._writes)]
+            if self._quantizer:
+                codes, scales = self._quantizer.encode(matrix)
+                self._codes[row_array] = codes
+                if scales is not None:
+                    self._scales[row_array] = scales
+                self._flush_codes()
+                state.append((f"{self._quantizer.name}_writes", self._writes))
+            if self._ann:
+                self._ann.add(matrix, row_array)
+                self._conn.executemany("INSERT OR IGNORE INTO ann_pending (row) VALUES (?)", [(row,) for row in rows])
+            if self._metadata_index is not None:
+                self._metadata_index.set(rows, [doc.metadata for doc in documents])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                [(row, chunk_id, doc.page_content, json.dumps(doc.metadata or {}))
+                 for row, chunk_id, doc in zip(rows, ids, documents)])
+            self._conn.executemany("INSERT OR REPLACE INTO state (name, value) VALUES (?, ?)", state)
+            self._conn.commit()
+
+    def _assign_rows(self, ids: List[str]) -> List[int]:
+        """Maps ids to rows: existing ids keep their row, new ids reuse freed rows, then append."""
+        existing = self._rows_for_ids(ids)
+        new_ids = list(dict.fromkeys(chunk_id for chunk_id in ids if chunk_id not in existing))
+        free_rows = [row for (row,) in self._conn.execute(
+            "SELECT row FROM free_rows ORDER BY row LIMIT ?", (len(new_ids),)).fetchall()]
+        if free_rows:
+            self._conn.executemany("DELETE FROM free_rows WHERE row = ?", [(row,) for row in free_rows])
+        for chunk_id in new_ids:
+            if free_rows:
+                existing[chunk_id] = free_rows.pop()
+            else:
+                existing[chunk_id] = self._size
+                self._size += 1
+        return [existing[chunk_id] for chunk_id in ids]
+
+    def _rows_for_ids(self, ids: List[str]) -> Dict[str, int]:
+        found: Dict[str, int] = {}
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            found.update(self._conn.execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({placeholders})", part).fetchall())
+        return found
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self.load()
+            rows = list(self._rows_for_ids(ids).values())
+            if not rows:
+                return
+            self._valid[np.asarray(rows)] = 0
+            self._valid.flush()
+            if self._ann:
+                self._ann.remove(np.asarray(rows))
+                self._conn.executemany("INSERT OR IGNORE INTO ann_pending (row) VALUES (?)", [(row,) for row in rows])
+            if self._metadata_index is not None:
+                self._metadata_index.clear(rows)
+            self._conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._conn.executemany("INSERT OR IGNORE INTO free_rows (row) VALUES (?)", [(row,) for row in rows])
+            self._conn.commit()
+
+    def reset(self):
+        with self._lock:
+            self.load()
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM free_rows")
+            self._conn.execute("DELETE FROM ann_pending")
+            self._conn.execute("DELETE FROM state")
+            self._conn.commit()
+            self._size = 0
+            self._writes = 0
+            self._metadata_index = None
+            if self._valid is not None:
+                self._valid[:] = 0
+                self._valid.flush()
+            if self._ann:
+                for file_name in os.listdir(self.directory):
+                    if file_name.startswith(("ivf_", "hnsw")):
+                        os.remove(os.path.join(self.directory, file_name))
+                self._ann = create_ann_index(self.ann_kind, self.directory, nprobe=self.nprobe,
+                                             ef_search=self.ef_search)
+
+    def flush(self):
+        """Builds the ANN index once the store is large enough (or has outgrown it) and saves it."""
+        with self._lock:
+            self.load()
+            if not self._ann or self._vectors is None:
+                return
+            live_rows = np.flatnonzero(self._valid[:self._size])
+            if len(live_rows) >= self.ann_min_size and (
+                    not self._ann.is_ready() or self._ann.needs_rebuild(len(live_rows))):
+                self._ann.build(self._vectors, live_rows)
+            self._ann.save()
+            self._conn.execute("DELETE FROM ann_pending")
+            self._conn.commit()
+
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], k: int,
+                     filter: Optional[Conditions] = None) -> List[List[Tuple[Document, float]]]:
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        mask = self.filter_mask(filter) if filter else None
+        if self._ann and self._ann.is_ready():
+            results = [self.search_rows(query, k, mask=mask) for query in queries]
+        else:
+            results = self._exact_search(queries, k, mask=mask)
+        return [self._to_documents(rows, scores) for rows, scores in results]
+
+    def search_rows(self, query: Sequence[float], k: int, use_ann: bool = True, use_quantization: bool = True,
+                    rescore: bool = True, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (rows, scores) of the top-k live rows for one query, best first, restricted to the
+        rows set in `mask` if given. The flags select a search mode for comparisons (see
+        ann_index.recall_report and quantization.quantization_report).
+        """
+        query = np.asarray(query, dtype=np.float32)
+        if not (use_ann and self._ann and self._ann.is_ready()):
+            return self._exact_search(query[None, :], k, use_quantization, rescore, mask)[0]
+        fetch_k = k
+        if mask is not None:
+            matching = int(np.count_nonzero(mask))
+            if matching < len(mask) * _ANN_FILTER_FRACTION:
+                return self._exact_search(query[None, :], k, use_quantization, rescore, mask)[0]
+            fetch_k = min(len(mask), 2 * k * len(mask) // max(matching, 1))
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        rows, scores = self._ann.search(query, fetch_k, self._vectors)
+        keep = self._valid[rows] == 1
+        if mask is not None:
+            keep &= self._in_mask(rows, mask)
+            if np.count_nonzero(keep) < min(k, matching):
+                return self._exact_search(query[None, :], k, use_quantization, rescore, mask)[0]
+        return rows[keep][:k], scores[keep][:k]
+
+    @staticmethod
+    def _in_mask(rows: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Rows added after the mask was computed are outside it."""
+        inside = rows < len(mask)
+        inside[inside] = mask[rows[inside]]
+        return inside
+
+    def warm_up(self):
+        with self._lock:
+            self.load()
+            if self._metadata_index is None and self.filter_fields:
+                self._metadata_index = self._build_metadata_index()
+
+    def filter_mask(self, filter: Conditions) -> np.ndarray:
+        """Boolean mask over the rows (deleted ones included) whose metadata matches the filter."""
+        with self._lock:
+            self.load()
+            size = self._size
+            self.warm_up()
+            mask = self._metadata_index.mask(filter, size) if self._metadata_index is not None else None
+            if mask is not None:
+                return mask
+            fields = tuple(sorted(filter))
+            if fields not in self._scanned_filters:
+                self._scanned_filters.add(fields)
+                print(f"Filter on {list(fields)} is not covered by the metadata bitmaps "
+                      f"(filter_fields={list(self.filter_fields)}); scanning the metadata of every chunk.")
+            mask = np.zeros(size, dtype=bool)
+            for row, metadata in self._conn.execute("SELECT row, metadata FROM chunks"):
+                if row < size and matches(json.loads(metadata), filter):
+                    mask[row] = True
+            return mask
+
+    def _build_metadata_index(self) -> MetadataBitmapIndex:
+        index = MetadataBitmapIndex(self.filter_fields)
+        columns = ", ".join("json_extract(metadata, ?)" for _ in self.filter_fields)
+        cursor = self._conn.execute(f"SELECT row, {columns} FROM chunks",
+                                    [f'$."{field}"' for field in self.filter_fields])
+        while True:
+            found = cursor.fetchmany(65536)
+            if not found:
+                break
+            index.set([row for row, *_ in found], [dict(zip(self.filter_fields, values)) for _, *values in found])
+        print(f"Built metadata bitmaps for {list(self.filter_fields)} over {self._size} row(s).")
+        return index
+
+    def _exact_search(self, queries: np.ndarray, k: int, use_quantization: bool = True,
+                      rescore: bool = True, mask: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        self.load()
+        with self._lock:
+            vectors, valid, size = self._vectors, self._valid, self._size
+            codes, scales = self._codes, self._scales
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        if vectors is None or size == 0:
+            return [empty for _ in range(len(queries))]
+
+        live = valid[:size] == 1
+        subset: Optional[np.ndarray] = None  # the rows scored, when not all of them
+        if mask is not None:
+            live[:len(mask)] &= mask[:size]
+            live[len(mask):] = False  # added after the mask was computed
+            matching = np.flatnonzero(live)
+            if len(matching) == 0:
+                return [empty for _ in range(len(queries))]
+            if len(matching) < size * _SUBSET_FRACTION:
+                subset = matching
+
+        def rows_of(positions: np.ndarray) -> np.ndarray:
+            return subset[positions] if subset is not None else positions
+
+        def ranked(scores: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+            if subset is None:
+                scores[:, ~live] = -np.inf
+            return [(rows_of(top), top_scores)
+                    for top, top_scores in (self._top_k(row_scores, top_k) for row_scores in scores)]
+
+        scored = subset if subset is not None else slice(0, size)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if not (use_quantization and codes is not None):
+            return ranked(queries @ vectors[scored].T, k)
+
+        scores = self._quantizer.scores(codes[scored], scales[scored] if scales is not None else None, queries)
+        if not rescore:
+            return ranked(scores, k)
+        results = []
+        for query, (candidates, _) in zip(queries, ranked(scores, k * self.rescore_factor)):
+            candidates = np.sort(candidates)  # reads the memory-mapped float rows in file order
+            top, top_scores = self._top_k(vectors[candidates] @ query, k)
+            results.append((candidates[top], top_scores))
+        return results
+
+    def memory_usage(self) -> Dict[str, object]:
+        """Bytes per stored vector scanned by exact search, full precision vs. the quantized codes."""
+        self.load()
+        dim = self._vectors.shape[1] if self._vectors is not None else 0
+        float_bytes = dim * np.dtype(np.float32).itemsize
+        code_bytes = self._quantizer.bytes_per_vector(dim) if self._quantizer else float_bytes
+        return {
+            "quantization": self._quantizer.name if self._quantizer else None,
+            "vectors": self.count(),
+            "dim": dim,
+            "float_bytes_per_vector": float_bytes,
+            "code_bytes_per_vector": code_bytes,
+            "memory_reduction": float_bytes / code_bytes if code_bytes else 1.0,
+        }
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = top[np.isfinite(scores[top])]
+        return top, scores[top]
+
+    def _to_documents(self, rows: np.ndarray, scores: np.ndarray) -> List[Tuple[Document, float]]:
+        rows = [int(row) for row in rows]
+        documents = self._documents_for_rows(rows)
+        # A row deleted between scoring and lookup is simply dropped from the results.
+        return [(documents[row], float(score)) for row, score in zip(rows, scores) if row in documents]
+
+    def _documents_for_rows(self, rows: List[int]) -> Dict[int, Document]:
+        found = []
+        # In parts, to stay below SQLite's limit on bound parameters.
+        for start in range(0, len(rows), 500):
+            part = rows[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            with self._lock:
+                found += self._conn.execute(
+                    f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({placeholders})", part).fetchall()
+        return {row: Document(id=chunk_id, page_content=text, metadata=json.loads(metadata))
+                for row, chunk_id, text, metadata in found}
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        with self._lock:
+            self.load()
+            if self._metadata_index is not None:
+                rows = self._rows_for_ids(ids)
+                found = [(rows[chunk_id], metadata) for chunk_id, metadata in zip(ids, metadatas) if chunk_id in rows]
+                self._metadata_index.set([row for row, _ in found], [metadata for _, metadata in found])
+            self._conn.executemany("UPDATE chunks SET metadata = ? WHERE id = ?",
+                                   [(json.dumps(metadata or {}), chunk_id) for chunk_id, metadata in zip(ids, metadatas)])
+            self._conn.commit()
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        self.load()
+        with self._lock:
+            rows = list(self._rows_for_ids(ids).values())
+        return list(self._documents_for_rows(rows).values())
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Document]]]:
+        for ids, _, documents in self._iter_rows(batch_size, with_vectors=False):
+            yield ids, documents
+
+    def iter_vectors(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[List[float]], List[Document]]]:
+        """Yields the stored (normalized) vectors with their chunks."""
+        return self._iter_rows(batch_size, with_vectors=True)
+
+    def _iter_rows(self, batch_size: int, with_vectors: bool):
+        self.load()
+        last_row = -1
+        while True:
+            with self._lock:
+                found = self._conn.execute("SELECT row, id, text, metadata FROM chunks WHERE row > ? ORDER BY row "
+                                           "LIMIT ?", (last_row, batch_size)).fetchall()
+                vectors = np.array(self._vectors[[row for row, _, _, _ in found]]) if with_vectors and found else None
+            if not found:
+                return
+            last_row = found[-1][0]
+            yield [chunk_id for _, chunk_id, _, _ in found], vectors, [
+                Document(id=chunk_id, page_content=text, metadata=json.loads(metadata))
+                for _, chunk_id, text, metadata in found]
+
+    def drop(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._vectors = self._valid = self._codes = self._scales = None
+            self._ann = None
+            self._metadata_index = None
+            shutil.rmtree(self.directory, ignore_errors=True)
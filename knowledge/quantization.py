@@ -0,0 +1,153 @@
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+_BLOCK_ROWS = 4096  # rows scored at a time; a block's widened copy stays in the CPU cache
+
+
+class Quantizer(ABC):
+    """
+    Compact codes for the normalized rows of a NumpyBackend. Searches scan the codes to shortlist
+    candidates, which are then rescored against the full-precision vectors; the float matrix stays
+    on disk and only the shortlisted rows are read from it.
+    """
+
+    name: str
+    has_scales: bool = False
+
+    @abstractmethod
+    def code_shape(self, dim: int) -> Tuple[Tuple[int, ...], np.dtype]:
+        """(shape of one row's code, dtype) for vectors of dimension `dim`."""
+        pass
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Returns (codes, per-row scales or None) for a block of normalized vectors."""
+        pass
+
+    @abstractmethod
+    def scores(self, codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """Approximate similarities, shape (queries, rows); higher is more similar."""
+        pass
+
+    def bytes_per_vector(self, dim: int) -> int:
+        shape, dtype = self.code_shape(dim)
+        return int(np.prod(shape)) * np.dtype(dtype).itemsize + (4 if self.has_scales else 0)
+
+
+class Int8Quantizer(Quantizer):
+    """
+    Scalar quantization: each row is scaled so its largest component maps to ±127 and rounded to
+    int8, with the scale kept per row. Needs no training, so rows can be added at any time.
+    Queries stay in float (asymmetric scoring), which keeps the ranking error to the rows' rounding.
+    """
+
+    name = "int8"
+    has_scales = True
+
+    def code_shape(self, dim: int) -> Tuple[Tuple[int, ...], np.dtype]:
+        return (dim,), np.int8
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def scores(self, codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        # Integer codes are widened block by block so the product runs in BLAS; NumPy's own integer
+        # matmul is several times slower, and int8 values are exact in float32.
+        result = np.empty((len(codes), len(queries)), dtype=np.float32)
+        widened = np.empty((min(_BLOCK_ROWS, len(codes)), codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = codes[start:start + _BLOCK_ROWS]
+            buffer = widened[:len(block)]
+            buffer[...] = block
+            np.matmul(buffer, queries.T, out=result[start:start + len(block)])
+        result *= scales[:, None]
+        return result.T
+
+
+class BinaryQuantizer(Quantizer):
+    """
+    Sign-bit quantization: one bit per dimension, packed eight to a byte (1/32 of float32).
+    Rows are ranked by Hamming distance to the query's sign bits, counted with popcount; the
+    ranking is coarse, so it relies on a larger rescoring shortlist than int8.
+    """
+
+    name = "binary"
+
+    def code_shape(self, dim: int) -> Tuple[Tuple[int, ...], np.dtype]:
+        return ((dim + 7) // 8,), np.uint8
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        return np.packbits(np.asarray(vectors) > 0, axis=1), None
+
+    def scores(self, codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        query_bits = np.packbits(queries > 0, axis=1)
+        result = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            block = np.asarray(codes[start:start + _BLOCK_ROWS])
+            for i, bits in enumerate(query_bits):
+                distances = _popcount(np.bitwise_xor(block, bits)).sum(axis=1, dtype=np.int32)
+                result[i, start:start + len(block)] = -distances
+        return result
+
+
+if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+    def _popcount(values: np.ndarray) -> np.ndarray:
+        return _POPCOUNT_TABLE[values]
+
+
+def create_quantizer(kind: Optional[str]) -> Optional[Quantizer]:
+    if kind is None:
+        return None
+    if kind == "int8":
+        return Int8Quantizer()
+    if kind == "binary":
+        return BinaryQuantizer()
+    raise ValueError(f"Unsupported quantization: {kind}")
+
+
+def quantization_report(backend, queries: np.ndarray, k: int = 10) -> Dict[str, float]:
+    """
+    Compares a quantized NumpyBackend against exact full-precision search on a sample query set and
+    returns the memory per vector, recall@k with and without rescoring, and p50/p99 latency.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    exact_latencies, quantized_latencies, recalls, shortlist_recalls = [], [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        exact_rows, _ = backend.search_rows(query, k, use_ann=False, use_quantization=False)
+        exact_latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        quantized_rows, _ = backend.search_rows(query, k, use_ann=False)
+        quantized_latencies.append(time.perf_counter() - start)
+        unrescored_rows, _ = backend.search_rows(query, k, use_ann=False, rescore=False)
+        if len(exact_rows):
+            exact = set(exact_rows.tolist())
+            recalls.append(len(exact & set(quantized_rows.tolist())) / len(exact_rows))
+            shortlist_recalls.append(len(exact & set(unrescored_rows.tolist())) / len(exact_rows))
+    memory = backend.memory_usage()
+    report = {
+        "queries": len(queries),
+        "k": k,
+        "quantization": memory["quantization"],
+        "float_bytes_per_vector": memory["float_bytes_per_vector"],
+        "code_bytes_per_vector": memory["code_bytes_per_vector"],
+        "memory_reduction": memory["memory_reduction"],
+        "recall_at_k": float(np.mean(recalls)) if recalls else 0.0,
+        "recall_at_k_without_rescoring": float(np.mean(shortlist_recalls)) if shortlist_recalls else 0.0,
+        "exact_p50_ms": float(np.percentile(exact_latencies, 50) * 1000),
+        "exact_p99_ms": float(np.percentile(exact_latencies, 99) * 1000),
+        "quantized_p50_ms": float(np.percentile(quantized_latencies, 50) * 1000),
+        "quantized_p99_ms": float(np.percentile(quantized_latencies, 99) * 1000),
+    }
+    print(f"Quantization report: {report}")
+    return report
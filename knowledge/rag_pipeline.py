@@ -1,9 +1,24 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
 from dotenv import load_dotenv
+from langchain_core.documents import Document
 
 from knowledge.document_manager import DocumentManager
 from knowledge.text_processor import TextProcessor
 from knowledge.embedding_manager import EmbeddingManager
+from knowledge.ingest_manifest import IngestManifest
+from knowledge.dedup_index import DedupIndex
+from knowledge.ingest_pipeline import IngestPipeline, release_chunks
+from knowledge.lexical_index import BM25Index, reciprocal_rank_fusion
+from knowledge.metadata_filter import Conditions, filter_key, matches, normalize_filter
+from knowledge.metadata_tagger import MetadataTagger
+from knowledge.reranker import create_reranker
 from knowledge.vector_store_manager import VectorStoreManager
+from utils import telemetry
+from utils.micro_batcher import MicroBatcher
 
 
 class RAGPipeline:
@@ -13,20 +28,85 @@ class RAGPipeline:
 
     def __init__(self, source_dir: str, chroma_dir: str, collection_name: str,
                  chunk_size: int = 1000, chunk_overlap: int = 200,
-                 embedding_model_name: str = "models/embedding-001"):
+                 embedding_model_name: str = "models/embedding-001", embedding_cache_dir: Optional[str] = None,
+                 loader_workers: Optional[int] = None, ingest_batch_size: int = 64, embed_workers: int = 2,
+                 embedding_backend: str = "google", embedding_concurrency: int = 4,
+                 embedding_requests_per_minute: Optional[float] = None, vector_store_backend: str = "chroma",
+                 ann_index: Optional[str] = None, ann_nprobe: int = 8, ann_ef_search: int = 64,
+                 quantization: Optional[str] = None, rescore_factor: int = 8,
+                 retrieval_mode: str = "vector", reranker: Optional[str] = None, rerank_fetch_k: int = 50,
+                 rerank_budget_ms: Optional[float] = 150, refresh_workers: int = 1, refresh_niceness: int = 10,
+                 chunking: str = "recursive", chunk_tokens: int = 512, chunk_overlap_tokens: int = 64,
+                 chunking_workers: Optional[int] = None, query_batch_window_ms: float = 0,
+                 query_batch_max_wait_ms: float = 10, query_batch_max_size: int = 32,
+                 dedup_chunks: bool = False, dedup_threshold: float = 0.85,
+                 metadata_path_fields: Sequence[str] = ("team", "product"), metadata_front_matter: bool = True,
+                 metadata_filter_fields: Sequence[str] = ("team", "product", "file_type", "modified"),
+                 vector_store_shards: int = 1, shard_partition: str = "hash", shard_timeout_ms: float = 500):
         load_dotenv()  # Ensure API keys are loaded
 
-        self.doc_manager = DocumentManager(source_directory=source_dir)
-        self.text_processor = TextProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.doc_manager = DocumentManager(source_directory=source_dir, max_workers=loader_workers)
+        self.text_processor = TextProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap, strategy=chunking,
+                                            chunk_tokens=chunk_tokens, chunk_overlap_tokens=chunk_overlap_tokens,
+                                            workers=chunking_workers)
+        self.tagger = MetadataTagger(source_dir, path_fields=metadata_path_fields, front_matter=metadata_front_matter,
+                                     scope_fields=[field for field in metadata_filter_fields
+                                                   if field not in MetadataTagger.FORMAT_FIELDS])
+        self.ingest_batch_size = ingest_batch_size
+        self.embed_workers = embed_workers
+        self.retrieval_mode = retrieval_mode
+        self.reranker = create_reranker(reranker)
+        self.rerank_fetch_k = rerank_fetch_k
+        self.rerank_budget_ms = rerank_budget_ms
+        self.manifest = IngestManifest(os.path.join(chroma_dir, f"{collection_name}_manifest.json"))
+        self.dedup = DedupIndex(os.path.join(chroma_dir, f"{collection_name}_dedup.json.gz"),
+                                threshold=dedup_threshold) if dedup_chunks else None
+        self.refresh_doc_manager = DocumentManager(source_directory=source_dir, max_workers=refresh_workers,
+                                                   niceness=refresh_niceness)
+        self._refresh_lock = threading.Lock()
 
         try:
-            self.embedding_manager = EmbeddingManager(model_name=embedding_model_name)
+            self.embedding_manager = EmbeddingManager(model_name=embedding_model_name,
+                                                     cache_directory=embedding_cache_dir,
+                                                     backend=embedding_backend,
+                                                     max_concurrency=embedding_concurrency,
+                                                     requests_per_minute=embedding_requests_per_minute,
+                                                     query_window_seconds=query_batch_window_ms / 1000.0,
+                                                     query_max_wait_seconds=query_batch_max_wait_ms / 1000.0,
+                                                     query_max_batch_size=query_batch_max_size)
             self.embeddings = self.embedding_manager.get_embeddings()
             self.vector_store_manager = VectorStoreManager(
                 embedding_function=self.embeddings,
                 db_directory=chroma_dir,
-                collection_name=collection_name
+                collection_name=collection_name,
+                backend=vector_store_backend,
+                ann_index=ann_index,
+                ann_nprobe=ann_nprobe,
+                ann_ef_search=ann_ef_search,
+                quantization=quantization,
+                rescore_factor=rescore_factor,
+                filter_fields=metadata_filter_fields,
+                shards=vector_store_shards,
+                shard_partition=shard_partition,
+                shard_timeout_seconds=shard_timeout_ms / 1000.0
             )
+            # Concurrent queries are searched together: one backend call (a single matrix multiply with
+            # the numpy backend) per group of query embeddings.
+            self.search_batcher: Optional[MicroBatcher[Tuple[List[float], int, Optional[Conditions]], list]] = None
+            if query_batch_window_ms > 0:
+                self.search_batcher = MicroBatcher(self._search_batch, window_seconds=query_batch_window_ms / 1000.0,
+                                                   max_wait_seconds=query_batch_max_wait_ms / 1000.0,
+                                                   max_batch_size=query_batch_max_size, name="vector-search")
+            # Only hybrid retrieval reads the BM25 index; vector-only deployments skip loading and
+            # maintaining it. An index left from an earlier hybrid deployment would miss the chunks
+            # written meanwhile, so it is dropped and backfilled if hybrid retrieval is enabled again.
+            self.lexical_index: Optional[BM25Index] = None
+            lexical_index_path = os.path.join(chroma_dir, f"{collection_name}_bm25.json.gz")
+            if retrieval_mode == "hybrid":
+                self.lexical_index = BM25Index(lexical_index_path)
+                self.vector_store_manager.add_secondary_index(self.lexical_index)
+            elif os.path.exists(lexical_index_path):
+                os.remove(lexical_index_path)
         except ValueError as e:  # Handles missing API key from EmbeddingManager
             print(f"Failed to initialize RAG Pipeline: {e}")
             raise  # Re-raise to stop execution if critical components fail
@@ -34,34 +114,276 @@ class RAGPipeline:
             print(f"An unexpected error occurred during RAGPipeline initialization: {e}")
             raise
 
+    def open_vector_store(self) -> int:
+        """
+        Opens the existing store for serving queries. Nothing is loaded, embedded or deleted, so this
+        is fast however large the source directory is; the store is built and updated separately by
+        setup_vector_store(). Returns the number of stored chunks.
+        """
+        self.vector_store_manager.load_existing_store()
+        count = self.vector_store_manager.get_collection_count()
+        if count == 0:
+            print("Vector store is empty. Build it with `python main.py --ingest` before serving.")
+        return count
+
+    def warm_up(self):
+        """
+        Pays one-off costs before the first query: creating the embedding client and opening its
+        connection, building the vector store's filter bitmaps, and running the reranker once.
+        """
+        self.embedding_manager.warm_up()
+        self.vector_store_manager.backend.warm_up()
+        if self.reranker is not None:
+            self.reranker.rerank("warm up", [Document(page_content="warm up")], top_n=1)
+
     def setup_vector_store(self, force_recreate: bool = False):
         """
-        Loads documents, chunks them, and stores them in the vector store.
-        If force_recreate is False, it will try to load an existing store first.
+        Brings the vector store in sync with the source directory.
+        Only files that were added or whose content changed since the last run are loaded, chunked
+        and embedded; chunks of removed files are deleted. If force_recreate is True, the collection
+        is wiped and every file is re-processed.
         """
-        if not force_recreate:
-            self.vector_store_manager.load_existing_store()
-            if self.vector_store_manager.get_collection_count() > 0:
-                print(
-                    f"Vector store already exists and contains {self.vector_store_manager.get_collection_count()} items. Skipping document processing.")
-                return
-
-        print("\n--- Starting Document Processing and Vector Store Setup ---")
-        # 1. Load documents
-        raw_documents = self.doc_manager.load_documents()
-        if not raw_documents:
-            return
+        self.vector_store_manager.load_existing_store()
+        if force_recreate:
+            print("Force recreate requested. Dropping existing collection and manifest.")
+            self.vector_store_manager.reset_collection()
+            self.manifest.clear()
+            self._clear_dedup()
+        elif self.manifest.tracked_files() and self.vector_store_manager.get_collection_count() == 0:
+            print("Manifest is present but the collection is empty. Re-processing all files.")
+            self.manifest.clear()
+            self._clear_dedup()
+        self._open_dedup()
+
+        print("\n--- Starting Incremental Document Processing and Vector Store Setup ---")
+        rechunk = self._chunking_changed()
+        current_hashes = {path: IngestManifest.hash_file(path) for path in self.doc_manager.list_files()}
+        removed = [path for path in self.manifest.tracked_files() if path not in current_hashes]
+        changed = [path for path, file_hash in current_hashes.items()
+                   if rechunk or self.manifest.get_hash(path) != file_hash]
+        print(f"Files: {len(current_hashes)} found, {len(changed)} added or changed, {len(removed)} removed.")
+
+        for file_path in removed:
+            release_chunks(self.vector_store_manager, self.dedup, self.manifest.remove(file_path))
+        if removed:
+            self.vector_store_manager.flush()
+            if self.dedup is not None:
+                self.dedup.save()
+            self.manifest.save()
+
+        if changed:
+            IngestPipeline(
+                doc_manager=self.doc_manager,
+                text_processor=self.text_processor,
+                embeddings=self.embeddings,
+                vector_store_manager=self.vector_store_manager,
+                manifest=self.manifest,
+                batch_size=self.ingest_batch_size,
+                embed_workers=self.embed_workers,
+                dedup=self.dedup,
+                tagger=self.tagger
+            ).run({path: current_hashes[path] for path in changed})
+        self.manifest.settings = self._ingest_settings()
+        self.manifest.save()
+
+        if not changed and not removed:
+            print(
+                f"Vector store is up to date with {self.vector_store_manager.get_collection_count()} items. Nothing to embed.")
+        print(f"Embedding cache stats: {self.embedding_manager.get_cache_stats()}")
+        print(f"Embedding client stats: {self.embedding_manager.get_client_stats()}")
+
+    def refresh(self, file_paths: Optional[Iterable[str]] = None) -> Optional[Dict[str, float]]:
+        """
+        Re-ingests the given source files (default: all of them) while the pipeline keeps serving.
+        Only files that were added, changed or removed since they were last ingested are processed.
+        The update is staged and published in one step when it completes, so concurrent queries see
+        either the old or the new content. Parsing runs in low-priority worker processes and a single
+        embedding worker is used, to leave CPU and rate limit to the queries being answered.
+        Returns the ingest statistics, or None if nothing had changed.
+        """
+        with self._refresh_lock:
+            self._open_dedup()
+            rechunk = self._chunking_changed()
+            if file_paths is None or rechunk:
+                candidates = set(self.doc_manager.list_files()) | set(self.manifest.tracked_files())
+            else:
+                candidates = {os.path.normpath(path) for path in file_paths}
+            current_hashes: Dict[str, str] = {}
+            removed: List[str] = []
+            for path in sorted(candidates):
+                if os.path.isfile(path) and self.doc_manager.is_supported(path):
+                    try:
+                        current_hashes[path] = IngestManifest.hash_file(path)
+                        continue
+                    except OSError:
+                        pass  # deleted (or unreadable) since it was listed
+                if self.manifest.get_hash(path) is not None:
+                    removed.append(path)
+            changed = {path: file_hash for path, file_hash in current_hashes.items()
+                       if rechunk or self.manifest.get_hash(path) != file_hash}
+            if not changed and not removed:
+                return None
+
+            print(f"Refreshing knowledge base: {len(changed)} added or changed, {len(removed)} removed file(s).")
+            stats = IngestPipeline(
+                doc_manager=self.refresh_doc_manager,
+                text_processor=self.text_processor,
+                embeddings=self.embeddings,
+                vector_store_manager=self.vector_store_manager,
+                manifest=self.manifest,
+                batch_size=self.ingest_batch_size,
+                embed_workers=1,
+                staged=True,
+                dedup=self.dedup,
+                tagger=self.tagger
+            ).run(changed, removed_files=removed)
+            self.manifest.settings = self._ingest_settings()
+            self.manifest.save()
+            return stats
 
-        # 2. Chunk documents
-        chunked_documents = self.text_processor.split_documents(raw_documents)
-        if not chunked_documents:
+    def _open_dedup(self):
+        """Loads the dedup index; chunks stored before deduplication was enabled are registered first."""
+        if self.dedup is None:
             return
+        self.dedup.load()
+        if len(self.dedup) == 0 and self.vector_store_manager.get_collection_count() > 0:
+            print("Registering stored chunks in the dedup index.")
+            for ids, documents in self.vector_store_manager.backend.iter_documents():
+                self.dedup.backfill(ids, documents, scope=self.tagger.scope)
+            self.dedup.save()
+
+    def _clear_dedup(self):
+        if self.dedup is not None:
+            self.dedup.load()
+            self.dedup.clear()
+            self.dedup.save()
+
+    def get_dedup_stats(self) -> Dict[str, int]:
+        return self.dedup.stats() if self.dedup is not None else {}
+
+    def _ingest_settings(self) -> Dict[str, object]:
+        return dict(self.text_processor.settings(), metadata=self.tagger.settings())
+
+    def _chunking_changed(self) -> bool:
+        """True if the stored chunks were made with other chunking or tagging settings and must all be rebuilt."""
+        settings = self._ingest_settings()
+        previous = self.manifest.settings
+        if previous is None:
+            # Stores ingested before settings were recorded were chunked by the character splitter.
+            if not self.manifest.tracked_files() or settings["strategy"] == "recursive":
+                return False
+            previous = {"strategy": "recursive"}
+        if previous == settings:
+            return False
+        print(f"Ingest settings changed from {previous} to {settings}. Re-chunking all files.")
+        return True
+
+    def embed_query(self, query_text: str) -> List[float]:
+        return self.embeddings.embed_query(query_text)
 
-        # 3. Store in VectorDB
-        self.vector_store_manager.store_documents(chunked_documents)
+    def _search_batch(self, requests: List[Tuple[List[float], int, Optional[Conditions]]]) -> list:
+        """Searches a group of (query embedding, k, filter) requests, one backend call per distinct filter."""
+        groups: Dict[str, List[int]] = {}
+        for index, (_, _, conditions) in enumerate(requests):
+            groups.setdefault(filter_key(conditions), []).append(index)
+        results: list = [None] * len(requests)
+        for indexes in groups.values():
+            found = self.vector_store_manager.query_batch_with_scores(
+                [requests[index][0] for index in indexes], k=max(requests[index][1] for index in indexes),
+                filter=requests[indexes[0]][2])
+            if found is not None:
+                for index, matches_found in zip(indexes, found):
+                    results[index] = matches_found[:requests[index][1]]
+        return results
 
-    def query(self, query_text: str, k: int = 2):
+    def _search(self, query_embedding: List[float], k: int, conditions: Optional[Conditions] = None):
+        if self.search_batcher is not None:
+            return self.search_batcher((query_embedding, k, conditions))
+        return self.vector_store_manager.query_with_scores(query_embedding, k=k, filter=conditions)
+
+    def query(self, query_text: str, k: int = 2, mode: Optional[str] = None,
+              query_embedding: Optional[List[float]] = None, rerank: Optional[bool] = None,
+              fetch_k: Optional[int] = None, rerank_budget_ms: Optional[float] = None,
+              filter: Optional[Dict[str, object]] = None):
         """
-        Queries the vector store.
+        Queries the knowledge base. mode "vector" uses embedding similarity only; "hybrid" also runs
+        a BM25 lookup over the inverted index and fuses both rankings with reciprocal rank fusion,
+        which helps with exact identifiers (service names, error codes, acronyms).
+        Pass query_embedding when the query was already embedded to avoid embedding it again.
+
+        With a reranker configured (or rerank=True), fetch_k candidates (default rerank_fetch_k) are
+        retrieved and rescored and the best k are returned. If reranking takes longer than
+        rerank_budget_ms, the top k candidates in retrieval order are returned instead.
+
+        `filter` restricts retrieval to chunks whose metadata matches, e.g. {"team": "payments",
+        "file_type": ["md", "pdf"], "max_age_days": 365} (see metadata_filter.normalize_filter).
         """
-        return self.vector_store_manager.query_documents(query_text, k=k)
+        conditions = normalize_filter(filter)
+        rerank = self.reranker is not None if rerank is None else rerank
+        if not rerank or self.reranker is None:
+            return self._retrieve(query_text, k, mode, query_embedding, conditions)
+
+        fetch_k = max(fetch_k or self.rerank_fetch_k, k)
+        candidates = self._retrieve(query_text, fetch_k, mode, query_embedding, conditions)
+        if not candidates:
+            return candidates
+        budget_ms = self.rerank_budget_ms if rerank_budget_ms is None else rerank_budget_ms
+        started = time.perf_counter()
+        with telemetry.span("retrieval.rerank", candidates=len(candidates)) as span:
+            reranked = self.reranker.rerank(query_text, candidates, top_n=k,
+                                            budget_seconds=budget_ms / 1000.0 if budget_ms else None)
+            span.set_attribute("within_budget", reranked is not None)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        if reranked is None:
+            print(f"Reranking exceeded its {budget_ms:.0f} ms budget, returning retrieval order.")
+            telemetry.increment("rerank_budget_exceeded_total")
+            return candidates[:k]
+        print(f"Reranked {len(candidates)} candidate(s) in {elapsed_ms:.1f} ms, returning top {len(reranked)}")
+        return [doc for doc, _ in reranked]
+
+    def _retrieve(self, query_text: str, k: int, mode: Optional[str], query_embedding: Optional[List[float]],
+                  conditions: Optional[Conditions] = None):
+        mode = mode or self.retrieval_mode
+        if mode == "vector":
+            if query_embedding is None:
+                return self.vector_store_manager.query_documents(query_text, k=k, filter=conditions)
+            with telemetry.span("retrieval.vector"):
+                results = self._search(query_embedding, k, conditions)
+            return [doc for doc, _ in results] if results is not None else None
+        if mode != "hybrid":
+            raise ValueError(f"Unsupported retrieval mode: {mode}")
+        if self.lexical_index is None:
+            raise ValueError("Hybrid retrieval needs the BM25 index, which is only kept with retrieval_mode='hybrid'")
+
+        if query_embedding is None:
+            query_embedding = self.embed_query(query_text)
+        fetch_k = max(20, 4 * k)
+        with telemetry.span("retrieval.vector"):
+            vector_results = self._search(query_embedding, fetch_k, conditions) or []
+        documents = {doc.id: doc for doc, _ in vector_results}
+        with telemetry.span("retrieval.lexical"):
+            if conditions is None:
+                lexical_results = [(chunk_id, score) for chunk_id, score in
+                                   self.lexical_index.search(query_text, k=fetch_k)
+                                   if self.vector_store_manager.is_visible(chunk_id)]
+            else:
+                # The lexical index holds no metadata: more candidates are fetched and those outside
+                # the filter dropped once their documents are read.
+                lexical_results = self.lexical_index.search(query_text, k=4 * fetch_k)
+                documents.update({doc.id: doc for doc in self.vector_store_manager.get_documents(
+                    [chunk_id for chunk_id, _ in lexical_results if chunk_id not in documents])})
+                lexical_results = [(chunk_id, score) for chunk_id, score in lexical_results
+                                   if chunk_id in documents and matches(documents[chunk_id].metadata, conditions)]
+                lexical_results = lexical_results[:fetch_k]
+        fused = reciprocal_rank_fusion([
+            [doc.id for doc, _ in vector_results],
+            [chunk_id for chunk_id, _ in lexical_results],
+        ])[:k]
+
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in documents]
+        if missing:
+            documents.update({doc.id: doc for doc in self.vector_store_manager.get_documents(missing)})
+        retrieved_docs = [documents[chunk_id] for chunk_id, _ in fused if chunk_id in documents]
+        print(f"Hybrid results for query: '{query_text}': {len(vector_results)} vector and "
+              f"{len(lexical_results)} lexical candidate(s), returning top {len(retrieved_docs)}")
+        return retrieved_docs
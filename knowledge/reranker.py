@@ -0,0 +1,154 @@
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from knowledge.lexical_index import tokenize
+
+
+class Reranker(ABC):
+    """
+    Rescores retrieval candidates against the query. Candidates are scored in batches of
+    `batch_size`; if `budget_seconds` runs out before, between or after the batches (scoring
+    included), rerank() gives up and returns None so the caller can fall back to the retrieval order.
+    """
+
+    batch_size = 16
+
+    @abstractmethod
+    def score_batch(self, query: str, texts: List[str]):
+        """Scores (or extracts features for) one batch of candidate texts."""
+
+    @abstractmethod
+    def combine(self, query: str, batches: list) -> np.ndarray:
+        """Turns the per-batch results into one relevance score per candidate, higher is better."""
+
+    def rerank(self, query: str, documents: Sequence[Document], top_n: int,
+               budget_seconds: Optional[float] = None) -> Optional[List[Tuple[Document, float]]]:
+        if not documents:
+            return []
+        deadline = time.monotonic() + budget_seconds if budget_seconds else None
+
+        def expired() -> bool:
+            return deadline is not None and time.monotonic() > deadline
+
+        texts = [doc.page_content for doc in documents]
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            if expired():
+                return None
+            batches.append(self.score_batch(query, texts[start:start + self.batch_size]))
+        if expired():
+            return None
+        scores = self.combine(query, batches)
+        if expired():
+            return None
+        order = np.argsort(-scores, kind="stable")[:top_n]
+        return [(documents[i], float(scores[i])) for i in order]
+
+
+class LexicalReranker(Reranker):
+    """
+    CPU-only reranker based on query/term overlap. Each candidate is tokenised once; term counts,
+    lengths and adjacent query-term pairs (phrase matches) are collected per batch as arrays, and
+    the candidates are then scored together with BM25 over the candidate set plus a phrase bonus.
+    The lexical score is blended with the retrieval rank (`rank_weight`) so that candidates the
+    embedding search ranked highly are not discarded for lacking exact word matches.
+    """
+
+    batch_size = 32
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, phrase_weight: float = 0.5, rank_weight: float = 0.3):
+        self.k1 = k1
+        self.b = b
+        self.phrase_weight = phrase_weight
+        self.rank_weight = rank_weight
+
+    @staticmethod
+    def _query_terms(query: str) -> Tuple[dict, np.ndarray]:
+        terms = {}
+        sequence = []
+        for token in tokenize(query):
+            sequence.append(terms.setdefault(token, len(terms)))
+        pairs = np.array(sequence, dtype=np.int64)
+        bigrams = np.unique(pairs[:-1] * len(terms) + pairs[1:]) if len(pairs) > 1 else np.empty(0, dtype=np.int64)
+        return terms, bigrams
+
+    def score_batch(self, query: str, texts: List[str]):
+        terms, bigrams = self._query_terms(query)
+        counts = np.zeros((len(texts), max(len(terms), 1)), dtype=np.float32)
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        phrases = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[row] = len(tokens)
+            ids = np.fromiter((terms.get(token, -1) for token in tokens), dtype=np.int64, count=len(tokens))
+            matched = ids[ids >= 0]
+            if matched.size:
+                counts[row, :len(terms)] = np.bincount(matched, minlength=len(terms))
+            if bigrams.size and ids.size > 1:
+                both = (ids[:-1] >= 0) & (ids[1:] >= 0)
+                codes = ids[:-1][both] * len(terms) + ids[1:][both]
+                phrases[row] = np.isin(codes, bigrams).sum()
+        return counts, lengths, phrases
+
+    def combine(self, query: str, batches: list) -> np.ndarray:
+        counts = np.vstack([batch[0] for batch in batches])
+        lengths = np.concatenate([batch[1] for batch in batches])
+        phrases = np.concatenate([batch[2] for batch in batches])
+        n = len(lengths)
+
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log1p((n - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = max(float(lengths.mean()), 1.0)
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / average_length)
+        lexical = (idf * counts * (self.k1 + 1.0) / (counts + norm[:, None])).sum(axis=1)
+        lexical += self.phrase_weight * np.log1p(phrases)
+
+        spread = float(lexical.max() - lexical.min())
+        lexical = (lexical - lexical.min()) / spread if spread > 0 else np.zeros(n, dtype=np.float32)
+        rank_prior = 1.0 - np.arange(n, dtype=np.float32) / n
+        return (1.0 - self.rank_weight) * lexical + self.rank_weight * rank_prior
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Scores (query, chunk) pairs with a small local cross-encoder from sentence-transformers.
+    The model is loaded when the reranker is created; pairs are scored in batches on the CPU.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size: int = 16,
+                 max_length: int = 512):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "The cross-encoder reranker requires the 'sentence-transformers' package. "
+                "Install it with `pip install sentence-transformers`.") from e
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+    def score_batch(self, query: str, texts: List[str]):
+        return np.asarray(self._model.predict([(query, text) for text in texts], batch_size=self.batch_size),
+                          dtype=np.float32)
+
+    def combine(self, query: str, batches: list) -> np.ndarray:
+        return np.concatenate(batches)
+
+
+def create_reranker(kind: Optional[str]) -> Optional[Reranker]:
+    """Builds the reranker named in the configuration: None, "lexical" or "cross-encoder"."""
+    if kind is None:
+        return None
+    if kind == "lexical":
+        return LexicalReranker()
+    if kind == "cross-encoder":
+        try:
+            return CrossEncoderReranker()
+        except (ImportError, OSError) as e:
+            print(f"Could not load the cross-encoder reranker: {e} Falling back to the lexical reranker.")
+            return LexicalReranker()
+    raise ValueError(f"Unsupported reranker: {kind}")
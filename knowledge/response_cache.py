@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from knowledge.vector_backend import SecondaryIndex
+
+
+class _CachedResponse:
+    def __init__(self, embedding: np.ndarray, chunk_ids: List[str], answer: str, scope: str = ""):
+        self.embedding = embedding
+        self.chunk_ids = chunk_ids
+        self.answer = answer
+        self.scope = scope
+        self.created_at = time.monotonic()
+
+
+class SemanticResponseCache(SecondaryIndex):
+    """
+    Caches answers by query embedding. A new query whose embedding has cosine similarity of at least
+    `similarity_threshold` with a cached one gets the cached answer, skipping vector search and the
+    LLM call. Entries expire after `ttl_seconds`, the least recently used entry is evicted beyond
+    `max_entries`, and an entry is dropped as soon as ingest deletes or rewrites one of the chunks
+    it was answered from (the cache is registered as a secondary index of the vector store).
+    An answer is only reused within its `scope` (e.g. the retrieval filter it was answered with).
+    """
+
+    requires_backfill = False
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600.0, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[int, _CachedResponse]" = OrderedDict()
+        self._entries_by_chunk: Dict[str, set] = {}
+        self._next_key = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+        self._matrix_scopes: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, query_embedding: Sequence[float], scope: str = "") -> Optional[str]:
+        query = self._normalize(query_embedding)
+        with self._lock:
+            self._expire()
+            if self._entries and self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.vstack([self._entries[key].embedding for key in self._matrix_keys])
+                self._matrix_scopes = np.array([self._entries[key].scope for key in self._matrix_keys], dtype=object)
+            if self._matrix is not None:
+                similarities = np.where(self._matrix_scopes == scope, self._matrix @ query, -np.inf)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key = self._matrix_keys[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key].answer
+            self.misses += 1
+            return None
+
+    def store(self, query_embedding: Sequence[float], chunk_ids: List[str], answer: str, scope: str = ""):
+        entry = _CachedResponse(self._normalize(query_embedding), list(chunk_ids), answer, scope)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = entry
+            for chunk_id in entry.chunk_ids:
+                self._entries_by_chunk.setdefault(chunk_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            self._matrix = None
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _expire(self):
+        now = time.monotonic()
+        # Entries are in LRU order, not creation order, so every entry has to be checked.
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            self._drop(key)
+
+    def _drop(self, key: int):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for chunk_id in entry.chunk_ids:
+            keys = self._entries_by_chunk.get(chunk_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._entries_by_chunk[chunk_id]
+        self._matrix = None
+
+    def _invalidate(self, ids: List[str]):
+        with self._lock:
+            for chunk_id in ids:
+                for key in list(self._entries_by_chunk.get(chunk_id, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def add_chunks(self, ids: List[str], documents: List[Document]):
+        self._invalidate(ids)
+
+    def remove_chunks(self, ids: List[str]):
+        self._invalidate(ids)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._entries_by_chunk.clear()
+            self._matrix = None
+
+    def flush(self):
+        pass  # answers are only cached in memory
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
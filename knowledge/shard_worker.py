@@ -0,0 +1,76 @@
+"""
+Worker process serving one shard of a ShardedBackend. ShardedBackend starts it in a fresh
+interpreter as `python -m knowledge.shard_worker <address>`, with the connection's auth key on
+stdin, and then sends it the (picklable) backend factory and the shard's collection name.
+"""
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client
+from typing import Dict, Iterator
+
+# Requests that change a shard's store; they run one at a time, in the order they arrive.
+# Searches and reads run alongside them on a few threads.
+_WRITES = {"load", "upsert", "delete", "reset", "update_metadata", "flush", "warm_up", "drop"}
+_READ_THREADS = 4
+
+
+def serve(conn):
+    """
+    Receives (sequence number, method, arguments) requests for the shard's backend and answers each
+    with (sequence number, ok, result or error message), until told to stop or the coordinator is gone.
+    """
+    create_backend, collection_name = conn.recv()
+    backend = create_backend(collection_name)
+    cursors: Dict[str, Iterator] = {}
+    send_lock = threading.Lock()
+    writer = ThreadPoolExecutor(max_workers=1)
+    readers = ThreadPoolExecutor(max_workers=_READ_THREADS)
+
+    def run(seq: int, op: str, args: tuple):
+        try:
+            if op == "next":
+                cursor_id, method, batch_size = args
+                cursor = cursors.get(cursor_id)
+                if cursor is None:
+                    cursor = cursors[cursor_id] = getattr(backend, method)(batch_size)
+                result = next(cursor, None)
+                if result is None:
+                    cursors.pop(cursor_id, None)
+            elif op == "close":
+                result = cursors.pop(args[0], None) is not None
+            else:
+                result = getattr(backend, op)(*args)
+            reply = (seq, True, result)
+        except Exception as e:
+            reply = (seq, False, f"{type(e).__name__}: {e}")
+        with send_lock:
+            try:
+                conn.send(reply)
+            except OSError:
+                pass  # the coordinator is gone
+
+    while True:
+        try:
+            seq, op, args = conn.recv()
+        except (EOFError, OSError):
+            break  # the coordinator exited
+        if op == "stop":
+            break
+        (writer if op in _WRITES else readers).submit(run, seq, op, args)
+    writer.shutdown(wait=True)
+    readers.shutdown(wait=True)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C stops the coordinator, which stops the workers
+    authkey = bytes.fromhex(sys.stdin.readline().strip())
+    with Client(argv[0], authkey=authkey) as conn:
+        serve(conn)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,499 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future, wait
+from multiprocessing.connection import Listener
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from knowledge.metadata_filter import Conditions
+from knowledge.vector_backend import VectorBackend
+from utils import telemetry
+
+PARTITIONS = ("hash", "source")
+_COPY_BATCH = 1000  # chunks per request when a shard is copied into a new store
+_START_TIMEOUT_SECONDS = 60  # longest a new worker may take to connect
+_ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _worker_environment() -> Dict[str, str]:
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, [_ROOT_DIRECTORY, environment.get("PYTHONPATH")]))
+    return environment
+
+
+class _ShardWorker:
+    """
+    The coordinator's end of one shard: the worker process serving the shard's store and the pipe
+    to it. Requests are multiplexed over the pipe by sequence number and a reader thread resolves
+    each request's future when its reply arrives, so a request that timed out never holds up the
+    next one.
+    """
+
+    def __init__(self, index: int, collection_name: str, create_backend: Callable[[str], VectorBackend]):
+        self.index = index
+        self.collection_name = collection_name
+        self.create_backend = create_backend
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        self._conn = None
+        self._process = None
+        self._pending: Dict[int, Future] = {}
+        self._seq = 0
+
+    def start(self) -> Future:
+        """
+        Starts the worker in a fresh interpreter and hands it the backend factory; returns the future
+        of the backend's load(). Nothing of this (multi-threaded) process is inherited, and the bot's
+        main module is not imported again, as it would be by multiprocessing's spawn start method.
+        """
+        authkey = os.urandom(32)
+        listener = Listener(authkey=authkey)
+        try:
+            process = subprocess.Popen([sys.executable, "-m", "knowledge.shard_worker", str(listener.address)],
+                                       stdin=subprocess.PIPE, env=_worker_environment())
+            process.stdin.write(authkey.hex().encode("ascii") + b"\n")
+            process.stdin.close()
+            conn = self._accept(listener, process)
+        finally:
+            listener.close()
+        conn.send((self.create_backend, self.collection_name))
+        pending: Dict[int, Future] = {}
+        with self._lock:
+            self._conn, self._process, self._pending = conn, process, pending
+        threading.Thread(target=self._read, args=(conn, pending), name=f"vector-shard-{self.index}-reader",
+                         daemon=True).start()
+        return self.call("load")
+
+    def _accept(self, listener: Listener, process: subprocess.Popen):
+        accepted: Future = Future()
+
+        def accept():
+            try:
+                accepted.set_result(listener.accept())
+            except Exception as e:
+                accepted.set_exception(e)
+
+        threading.Thread(target=accept, name=f"vector-shard-{self.index}-accept", daemon=True).start()
+        deadline = time.monotonic() + _START_TIMEOUT_SECONDS
+        while not accepted.done():
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise ConnectionError(f"Shard {self.index} worker did not start (exit code {process.poll()})")
+            wait([accepted], timeout=0.1)
+        return accepted.result()
+
+    def is_alive(self) -> bool:
+        return self._conn is not None and self._process is not None and self._process.poll() is None
+
+    def call(self, op: str, *args) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._conn is None:
+                raise ConnectionError(f"Shard {self.index} worker is not running")
+            self._seq += 1
+            self._pending[self._seq] = future
+            try:
+                self._conn.send((self._seq, op, args))
+            except (OSError, ValueError) as e:
+                self._pending.pop(self._seq, None)
+                raise ConnectionError(f"Shard {self.index} worker is not reachable: {e}") from e
+        return future
+
+    def _read(self, conn, pending: Dict[int, Future]):
+        while True:
+            try:
+                seq, ok, result = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = pending.pop(seq, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(f"Shard {self.index}: {result}"))
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+            failed = list(pending.values())
+            pending.clear()
+        for future in failed:
+            future.set_exception(ConnectionError(f"Shard {self.index} worker exited"))
+
+    def ensure_running(self, background: bool = False):
+        """Restarts the worker if it exited; its store is on disk, so it comes back with its chunks."""
+        if self.is_alive():
+            return
+        if background:
+            if not self._restart_lock.locked():
+                threading.Thread(target=self.ensure_running, name=f"vector-shard-{self.index}-restart",
+                                 daemon=True).start()
+            return
+        with self._restart_lock:
+            if self.is_alive():
+                return
+            print(f"Shard {self.index} worker is not running; restarting it.")
+            telemetry.increment("vector_shard_restarts_total", shard=str(self.index))
+            self.stop()
+            self.start().result()
+
+    def drain(self, timeout: float):
+        """Waits (up to `timeout` seconds) for the requests in flight to be answered."""
+        with self._lock:
+            in_flight = list(self._pending.values())
+        wait(in_flight, timeout=timeout)
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            conn, process = self._conn, self._process
+            self._conn = None
+        if conn is not None:
+            try:
+                conn.send((0, "stop", ()))
+            except (OSError, ValueError):
+                pass
+        if process is not None:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        if conn is not None:
+            conn.close()
+
+
+class ShardedBackend(VectorBackend):
+    """
+    Splits the chunks across `shards` stores, each served by its own worker process (which creates
+    it by calling `create_backend`, a picklable factory, with the shard's collection name), so
+    searches use several cores and writes to different shards run in parallel.
+    - partition="hash" places a chunk by its ID; "source" keeps all chunks of a file on one shard
+      (by their "source" metadata), so re-ingesting a file writes to a single shard.
+    - A search is sent to every shard at once and the shards' top-k lists are merged by score.
+      Shards that have not answered after `timeout_seconds` are left out of the result, so a slow
+      or restarting shard costs recall rather than latency.
+    - A worker that exits is restarted from its store on disk.
+    - rebuild_shard() copies a shard into a new store and swaps it in; the old store keeps
+      answering searches until then.
+    The layout (partition and the shards' stores) is recorded next to the stores; opening them with
+    another shard count or partition redistributes the chunks once.
+    """
+
+    def __init__(self, create_backend: Callable[[str], VectorBackend], db_directory: str, collection_name: str,
+                 shards: int = 2, partition: str = "hash", timeout_seconds: float = 0.5):
+        if partition not in PARTITIONS:
+            raise ValueError(f"Unsupported shard partition: {partition}")
+        self.create_backend = create_backend
+        self.db_directory = db_directory
+        self.collection_name = collection_name
+        self.shards = max(1, shards)
+        self.partition = partition
+        self.timeout_seconds = timeout_seconds
+        self.layout_path = os.path.join(db_directory, f"{collection_name}_shards.json")
+        # Replaced as a whole (never mutated) when a shard is swapped, so a search reads one set.
+        self._workers: Optional[List[_ShardWorker]] = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writes = 0
+        self._count: Optional[int] = None
+        self._partial_searches = 0
+
+    def _read_layout(self) -> Optional[dict]:
+        if not os.path.exists(self.layout_path):
+            return None
+        with open(self.layout_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_layout(self, stores: List[str], generation: int):
+        os.makedirs(self.db_directory, exist_ok=True)
+        temp_path = f"{self.layout_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"partition": self.partition, "stores": stores, "generation": generation}, f, indent=2)
+        os.replace(temp_path, self.layout_path)
+
+    def _start_workers(self, stores: List[str]) -> List[_ShardWorker]:
+        workers = [_ShardWorker(index, store, self.create_backend) for index, store in enumerate(stores)]
+        loads = [worker.start() for worker in workers]
+        for load in loads:
+            load.result()
+        return workers
+
+    def load(self):
+        self._open()
+
+    def shard_count(self) -> int:
+        return len(self._open())
+
+    def _open(self) -> List[_ShardWorker]:
+        workers = self._workers
+        if workers is not None:
+            return workers
+        with self._lock:
+            if self._workers is None:
+                layout = self._read_layout()
+                if layout is None:
+                    stores = [f"{self.collection_name}_shard{index}" for index in range(self.shards)]
+                    self._workers = self._start_workers(stores)
+                    self._write_layout(stores, 0)
+                else:
+                    self._workers = self._start_workers(layout["stores"])
+                    if layout["partition"] != self.partition or len(layout["stores"]) != self.shards:
+                        self._workers = self._redistribute(self._workers, layout)
+                print(f"Opened {len(self._workers)} vector store shard(s) ({self.partition} partition).")
+            return self._workers
+
+    def _redistribute(self, workers: List[_ShardWorker], layout: dict) -> List[_ShardWorker]:
+        generation = layout.get("generation", 0) + 1
+        print(f"Shard layout changed from {len(layout['stores'])} {layout['partition']} shard(s) to {self.shards} "
+              f"{self.partition} shard(s). Redistributing the stored chunks...")
+        stores = [f"{self.collection_name}_shard{index}_g{generation}" for index in range(self.shards)]
+        replacements = self._start_workers(stores)
+        self._copy(workers, replacements)
+        self._write_layout(stores, generation)
+        for worker in workers:
+            self._retire(worker)
+        return replacements
+
+    def _copy(self, sources: List[_ShardWorker], targets: List[_ShardWorker]):
+        copied = 0
+        for ids, embeddings, documents in self._iter("iter_vectors", _COPY_BATCH, sources):
+            self._wait_all(self._send_upserts(targets, ids, np.asarray(embeddings, dtype=np.float32), documents))
+            copied += len(ids)
+        self._wait_all([self._call(target, "flush") for target in targets])
+        print(f"Copied {copied} chunk(s) into {len(targets)} shard store(s).")
+
+    def _retire(self, worker: _ShardWorker):
+        """Stops a replaced worker once its searches in flight are answered, and deletes its store."""
+        worker.drain(self.timeout_seconds)
+        try:
+            worker.call("drop").result()
+        except Exception as e:
+            print(f"Could not delete the store '{worker.collection_name}' of a replaced shard. Error: {e}")
+        worker.stop()
+
+    def close(self):
+        """Stops the shard workers."""
+        with self._lock:
+            workers, self._workers = self._workers, None
+        for worker in workers or []:
+            worker.stop()
+
+    @staticmethod
+    def _shard_for(key: str, shards: int) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big") % shards
+
+    def _route_ids(self, ids: Sequence[str], shards: int) -> Optional[List[List[int]]]:
+        """Positions of the IDs per shard, or None if IDs do not determine the shard (source partition)."""
+        if self.partition != "hash":
+            return None
+        groups: List[List[int]] = [[] for _ in range(shards)]
+        for position, chunk_id in enumerate(ids):
+            groups[self._shard_for(chunk_id, shards)].append(position)
+        return groups
+
+    def _call(self, worker: _ShardWorker, op: str, *args) -> Future:
+        worker.ensure_running()
+        return worker.call(op, *args)
+
+    @staticmethod
+    def _wait_all(futures: List[Future]) -> list:
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def _send_upserts(self, workers: List[_ShardWorker], ids: List[str], embeddings: np.ndarray,
+                      documents: List[Document]) -> List[Future]:
+        groups = self._route_ids(ids, len(workers))
+        if groups is None:
+            groups = [[] for _ in workers]
+            for position, (chunk_id, document) in enumerate(zip(ids, documents)):
+                key = (document.metadata or {}).get("source") or chunk_id
+                groups[self._shard_for(key, len(workers))].append(position)
+        futures = []
+        for worker, positions in zip(workers, groups):
+            if positions:
+                futures.append(self._call(worker, "upsert", [ids[position] for position in positions],
+                                          embeddings[positions], [documents[position] for position in positions]))
+            if self.partition == "source" and len(positions) < len(ids):
+                # A chunk whose source changed would otherwise also stay on its previous shard.
+                placed = set(positions)
+                elsewhere = [chunk_id for position, chunk_id in enumerate(ids) if position not in placed]
+                futures.append(self._call(worker, "delete", elsewhere))
+        return futures
+
+    def _write(self, futures_for: Callable[[List[_ShardWorker]], List[Future]]) -> list:
+        with self._write_lock:
+            try:
+                return self._wait_all(futures_for(self._open()))
+            finally:
+                self._writes += 1
+                self._count = None
+
+    def _by_id(self, op: str, ids: List[str], *columns: List) -> Callable[[List[_ShardWorker]], List[Future]]:
+        """Requests sending each ID (and its items of `columns`) to its shard, or to every shard if unknown."""
+        def futures_for(workers: List[_ShardWorker]) -> List[Future]:
+            groups = self._route_ids(ids, len(workers))
+            if groups is None:
+                return [self._call(worker, op, ids, *columns) for worker in workers]
+            return [self._call(worker, op, [ids[position] for position in positions],
+                               *[[column[position] for position in positions] for column in columns])
+                    for worker, positions in zip(workers, groups) if positions]
+        return futures_for
+
+    def count(self) -> int:
+        count = self._count
+        if count is not None:
+            return count
+        writes = self._writes
+        count = sum(self._wait_all([self._call(worker, "count") for worker in self._open()]))
+        if writes == self._writes:
+            self._count = count
+        return count
+
+    def upsert(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[Document]):
+        if not ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        self._write(lambda workers: self._send_upserts(workers, ids, matrix, documents))
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self._write(self._by_id("delete", ids))
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        if ids:
+            self._write(self._by_id("update_metadata", ids, metadatas))
+
+    def reset(self):
+        self._write(lambda workers: [self._call(worker, "reset") for worker in workers])
+
+    def flush(self):
+        self._write(lambda workers: [self._call(worker, "flush") for worker in workers])
+
+    def warm_up(self):
+        self._wait_all([self._call(worker, "warm_up") for worker in self._open()])
+
+    def drop(self):
+        with self._write_lock:
+            self._wait_all([self._call(worker, "drop") for worker in self._open()])
+            self.close()
+            if os.path.exists(self.layout_path):
+                os.remove(self.layout_path)
+            self._count = None
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        if not ids:
+            return []
+        batches = self._wait_all(self._by_id("get_by_ids", ids)(self._open()))
+        return [document for documents in batches for document in documents]
+
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], k: int,
+                     filter: Optional[Conditions] = None) -> List[List[Tuple[Document, float]]]:
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        workers = self._open()
+        started = time.monotonic()
+        futures: Dict[int, Future] = {}
+        missing: List[int] = []
+        for worker in workers:
+            if not worker.is_alive():
+                worker.ensure_running(background=True)
+                missing.append(worker.index)
+                continue
+            try:
+                futures[worker.index] = future = worker.call("search_batch", queries, k, filter)
+            except ConnectionError:
+                missing.append(worker.index)
+                continue
+            future.add_done_callback(lambda _, index=worker.index: telemetry.observe(
+                "vector_shard_search_seconds", time.monotonic() - started, shard=str(index)))
+        done, _ = wait(futures.values(), timeout=self.timeout_seconds)
+
+        merged: List[List[Tuple[Document, float]]] = [[] for _ in range(len(queries))]
+        for index, future in futures.items():
+            if future not in done:
+                telemetry.increment("vector_shard_timeouts_total", shard=str(index))
+                missing.append(index)
+                continue
+            try:
+                batches = future.result()
+            except Exception as e:
+                print(f"Search on shard {index} failed: {e}")
+                missing.append(index)
+                continue
+            for results, shard_results in zip(merged, batches):
+                results.extend(shard_results)
+        if missing:
+            self._partial_searches += 1
+            if len(missing) == len(workers):
+                raise TimeoutError(f"No vector store shard answered within {self.timeout_seconds * 1000:.0f} ms")
+            print(f"Searched {len(workers) - len(missing)} of {len(workers)} shards; shard(s) {sorted(missing)} "
+                  f"did not answer (timeout {self.timeout_seconds * 1000:.0f} ms).")
+        return [sorted(results, key=lambda pair: pair[1], reverse=True)[:k] for results in merged]
+
+    def _iter(self, method: str, batch_size: int, workers: Optional[List[_ShardWorker]] = None) -> Iterator:
+        """Yields the batches of the backends' `method` (iter_documents or iter_vectors), shard after shard."""
+        for worker in workers if workers is not None else self._open():
+            cursor_id = uuid.uuid4().hex
+            batch = None
+            try:
+                while True:
+                    batch = self._call(worker, "next", cursor_id, method, batch_size).result()
+                    if batch is None:
+                        break
+                    yield batch
+            finally:
+                if batch is not None:  # abandoned before the end
+                    try:
+                        worker.call("close", cursor_id)
+                    except ConnectionError:
+                        pass
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Document]]]:
+        return self._iter("iter_documents", batch_size)
+
+    def iter_vectors(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[List[float]], List[Document]]]:
+        return self._iter("iter_vectors", batch_size)
+
+    def rebuild_shard(self, index: int):
+        """
+        Rebuilds one shard: its chunks are copied into a new store (dropping deleted rows and
+        rebuilding the ANN index and quantized codes from scratch), which then replaces the old
+        one. Searches keep being answered by the old store meanwhile; writes wait for the swap.
+        """
+        with self._write_lock:
+            workers = self._open()
+            if not 0 <= index < len(workers):
+                raise ValueError(f"No shard {index}; there are {len(workers)}")
+            started = time.perf_counter()
+            generation = (self._read_layout() or {}).get("generation", 0) + 1
+            store = f"{self.collection_name}_shard{index}_g{generation}"
+            print(f"Rebuilding shard {index} into '{store}'...")
+            replacement = _ShardWorker(index, store, self.create_backend)
+            replacement.start().result()
+            try:
+                self._copy([workers[index]], [replacement])
+            except Exception:
+                self._retire(replacement)
+                raise
+            stores = [worker.collection_name for worker in workers]
+            stores[index] = store
+            self._write_layout(stores, generation)
+            self._workers = workers[:index] + [replacement] + workers[index + 1:]
+            self._retire(workers[index])
+            print(f"Shard {index} rebuilt in {time.perf_counter() - started:.1f}s.")
+
+    def stats(self) -> Dict[str, int]:
+        workers = self._workers or []
+        return {
+            "shards": len(workers),
+            "running": sum(worker.is_alive() for worker in workers),
+            "partial_searches": self._partial_searches,
+        }
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class SourceWatcher:
+    """
+    Watches the source directory and calls `on_change` with the paths that changed, or with None
+    when a whole directory was moved and everything should be rescanned.
+    Uses watchdog (inotify on Linux, FSEvents/ReadDirectoryChangesW elsewhere) when it is installed
+    and falls back to polling file modification times otherwise.
+
+    Changes are debounced: `on_change` runs once no further change has been seen for
+    `debounce_seconds` (or at the latest `max_delay_seconds` after the first one), so saving a file
+    several times or copying a folder of documents results in a single re-ingest. Calls are made
+    from one background thread, one at a time; changes seen during a call are collected for the
+    next one.
+    """
+
+    def __init__(self, directory: str, on_change: Callable[[Optional[List[str]]], None],
+                 is_relevant: Optional[Callable[[str], bool]] = None, debounce_seconds: float = 2.0,
+                 max_delay_seconds: float = 30.0, poll_interval: float = 5.0, use_native: bool = True):
+        self.directory = directory
+        self.on_change = on_change
+        self.is_relevant = is_relevant or (lambda path: True)
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max(max_delay_seconds, debounce_seconds)
+        self.poll_interval = poll_interval
+        self.use_native = use_native
+        self.mode: Optional[str] = None
+        self._pending: Set[str] = set()
+        self._full_scan = False
+        self._first_change_at: Optional[float] = None
+        self._last_change_at = 0.0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._observer = None
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self.use_native and self._start_native():
+            self.mode = "native"
+        else:
+            self.mode = "polling"
+            self._threads.append(threading.Thread(target=self._poll_loop, name="source-watcher-poll", daemon=True))
+        self._threads.append(threading.Thread(target=self._dispatch_loop, name="source-watcher", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        print(f"Watching '{self.directory}' for changes ({self.mode}, debounce {self.debounce_seconds:.1f}s).")
+
+    def stop(self):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def notify(self, paths: Iterable[str], full_scan: bool = False):
+        """Records changed paths; also the entry point for the native and polling watchers."""
+        paths = {os.path.normpath(path) for path in paths if self.is_relevant(path)}
+        if not paths and not full_scan:
+            return
+        with self._condition:
+            now = time.monotonic()
+            if not self._pending and not self._full_scan:
+                self._first_change_at = now
+            self._pending.update(paths)
+            self._full_scan = self._full_scan or full_scan
+            self._last_change_at = now
+            self._condition.notify_all()
+
+    def _start_native(self) -> bool:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print("watchdog is not installed; polling the source directory for changes instead.")
+            return False
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    if event.event_type == "moved":
+                        watcher.notify([], full_scan=True)
+                    return
+                watcher.notify([event.src_path] + ([event.dest_path] if getattr(event, "dest_path", "") else []))
+
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_Handler(), self.directory, recursive=True)
+            self._observer.start()
+            return True
+        except OSError as e:  # e.g. the inotify watch limit is reached
+            print(f"Could not watch '{self.directory}' natively ({e}); polling instead.")
+            self._observer = None
+            return False
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for root, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = os.path.normpath(os.path.join(root, file_name))
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _poll_loop(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            changed = [path for path, signature in current.items() if previous.get(path) != signature]
+            changed += [path for path in previous if path not in current]
+            previous = current
+            self.notify(changed)
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            with self._condition:
+                while not self._pending and not self._full_scan and not self._stop.is_set():
+                    self._condition.wait()
+                if self._stop.is_set():
+                    return
+                now = time.monotonic()
+                ready_at = min(self._last_change_at + self.debounce_seconds,
+                               self._first_change_at + self.max_delay_seconds)
+                if now < ready_at:
+                    self._condition.wait(ready_at - now)
+                    continue
+                paths = None if self._full_scan else sorted(self._pending)
+                self._pending.clear()
+                self._full_scan = False
+            try:
+                self.on_change(paths)
+            except Exception as e:
+                print(f"Re-ingest after source changes failed: {e}. Retrying in {self.max_delay_seconds:.0f}s.")
+                if not self._stop.wait(self.max_delay_seconds):
+                    self.notify(paths or [], full_scan=paths is None)
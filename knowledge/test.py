@@ -1,6 +1,14 @@
 from rag_pipeline import RAGPipeline
 from utils.constant import SOURCE_DIRECTORY, CHROMA_DB_DIRECTORY, COLLECTION_NAME, CHUNK_SIZE, CHUNK_OVERLAP, \
-    EMBEDDING_MODEL_NAME, FORCE_RECREATE_STORE
+    CHUNKING_STRATEGY, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNKING_WORKERS, \
+    EMBEDDING_MODEL_NAME, FORCE_RECREATE_STORE, EMBEDDING_CACHE_DIRECTORY, \
+    LOADER_WORKERS, INGEST_BATCH_SIZE, EMBEDDING_CONCURRENCY, \
+    EMBEDDING_BACKEND, EMBEDDING_REQUEST_CONCURRENCY, EMBEDDING_REQUESTS_PER_MINUTE, \
+    VECTOR_STORE_BACKEND, ANN_INDEX, ANN_NPROBE, ANN_EF_SEARCH, RETRIEVAL_MODE, \
+    VECTOR_QUANTIZATION, QUANTIZATION_RESCORE_FACTOR, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_WAIT_MS, \
+    QUERY_BATCH_MAX_SIZE, DEDUP_CHUNKS, DEDUP_THRESHOLD, \
+    METADATA_PATH_FIELDS, METADATA_FRONT_MATTER, METADATA_FILTER_FIELDS, \
+    RERANKER, RERANK_FETCH_K, RERANK_BUDGET_MS
 
 if __name__ == "__main__":
     print("Initializing RAG Pipeline...")
@@ -11,7 +19,36 @@ if __name__ == "__main__":
             collection_name=COLLECTION_NAME,
             chunk_size=CHUNK_SIZE,
             chunk_overlap=CHUNK_OVERLAP,
-            embedding_model_name=EMBEDDING_MODEL_NAME
+            embedding_model_name=EMBEDDING_MODEL_NAME,
+            embedding_cache_dir=EMBEDDING_CACHE_DIRECTORY,
+            loader_workers=LOADER_WORKERS,
+            ingest_batch_size=INGEST_BATCH_SIZE,
+            embed_workers=EMBEDDING_CONCURRENCY,
+            embedding_backend=EMBEDDING_BACKEND,
+            embedding_concurrency=EMBEDDING_REQUEST_CONCURRENCY,
+            embedding_requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+            vector_store_backend=VECTOR_STORE_BACKEND,
+            ann_index=ANN_INDEX,
+            ann_nprobe=ANN_NPROBE,
+            ann_ef_search=ANN_EF_SEARCH,
+            quantization=VECTOR_QUANTIZATION,
+            rescore_factor=QUANTIZATION_RESCORE_FACTOR,
+            query_batch_window_ms=QUERY_BATCH_WINDOW_MS,
+            query_batch_max_wait_ms=QUERY_BATCH_MAX_WAIT_MS,
+            query_batch_max_size=QUERY_BATCH_MAX_SIZE,
+            dedup_chunks=DEDUP_CHUNKS,
+            dedup_threshold=DEDUP_THRESHOLD,
+            metadata_path_fields=METADATA_PATH_FIELDS,
+            metadata_front_matter=METADATA_FRONT_MATTER,
+            metadata_filter_fields=METADATA_FILTER_FIELDS,
+            retrieval_mode=RETRIEVAL_MODE,
+            reranker=RERANKER,
+            rerank_fetch_k=RERANK_FETCH_K,
+            rerank_budget_ms=RERANK_BUDGET_MS,
+            chunking=CHUNKING_STRATEGY,
+            chunk_tokens=CHUNK_TOKENS,
+            chunk_overlap_tokens=CHUNK_OVERLAP_TOKENS,
+            chunking_workers=CHUNKING_WORKERS
         )
 
         print(f"\nSetting up Vector Store (force_recreate={FORCE_RECREATE_STORE})...")
@@ -26,6 +63,9 @@ if __name__ == "__main__":
             print("\n💡 Example Usage: Querying with a different query")
             sample_query = "What is API Gateway?"
             pipeline.query(sample_query, k=2)
+
+            print("\n💡 Example Usage: Querying only the Markdown and text files")
+            pipeline.query(sample_query, k=2, filter={"file_type": ["md", "txt"]})
         else:
             print("\nVector store is empty. Skipping example query.")
 
@@ -1,22 +1,87 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.documents import Document
-from typing import List
+from typing import Dict, List, Optional, Tuple
+
+from utils.token_counter import TokenCounter, get_token_counter
+
+_ATX_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# A paragraph that is a single bold line ("**Why it's used:**") acts as a heading below the current one.
+_BOLD_HEADING = re.compile(r"^\*\*([^*\n]{1,120}?)\*\*:?\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_SECTION_SEPARATOR = " > "
+_BLOCK_SEPARATOR_TOKENS = 1  # the blank line between blocks
+
+
+class _Block:
+    """A unit the structured splitter never cuts unless it is larger than a chunk on its own."""
+
+    __slots__ = ("text", "section", "tokens", "is_heading")
+
+    def __init__(self, text: str, section: Tuple[str, ...], tokens: int, is_heading: bool = False):
+        self.text = text
+        self.section = section
+        self.tokens = tokens
+        self.is_heading = is_heading
 
 
 class TextProcessor:
     """
     Handles splitting/chunking of documents.
+
+    strategy="structured" splits along the document's structure: Markdown headings (also produced
+    by the HTML loader) and bold pseudo-headings open sections, paragraphs and fenced code blocks
+    are kept whole, and chunks are packed up to `chunk_tokens` tokens with about
+    `chunk_overlap_tokens` of trailing paragraphs repeated in the next chunk of the same section.
+    Each chunk records its section path in the "section" metadata and, unless it starts with its
+    own heading, begins with that path so the text says what it is about. Each paragraph is
+    tokenised once; documents (e.g. the pages of a PDF) are split in parallel threads, as tiktoken
+    releases the GIL.
+
+    strategy="recursive" is the character-based RecursiveCharacterTextSplitter with
+    chunk_size/chunk_overlap in characters.
     """
 
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, strategy: str = "recursive",
+                 chunk_tokens: int = 512, chunk_overlap_tokens: int = 64, workers: Optional[int] = None,
+                 counter: Optional[TokenCounter] = None):
+        if strategy not in ("recursive", "structured"):
+            raise ValueError(f"Unsupported chunking strategy: {strategy}")
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len
-        )
-        print(f"TextProcessor initialized with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
+        self.strategy = strategy
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap_tokens = min(chunk_overlap_tokens, chunk_tokens // 2)
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.counter = counter or get_token_counter()
+        self._splitter = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if strategy == "structured":
+            print(f"TextProcessor initialized with structured chunking, chunk_tokens={chunk_tokens}, "
+                  f"chunk_overlap_tokens={self.chunk_overlap_tokens}")
+        else:
+            print(f"TextProcessor initialized with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
+
+    @property
+    def splitter(self):
+        """The text splitter, created (and langchain's splitters imported) on first use."""
+        if self._splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len
+            )
+        return self._splitter
+
+    def settings(self) -> Dict[str, object]:
+        """The settings that determine the chunks; stored chunks must be rebuilt when they change."""
+        if self.strategy == "structured":
+            return {"strategy": self.strategy, "chunk_tokens": self.chunk_tokens,
+                    "chunk_overlap_tokens": self.chunk_overlap_tokens, "encoding": self.counter.encoding_name}
+        return {"strategy": self.strategy, "chunk_size": self.chunk_size, "chunk_overlap": self.chunk_overlap}
 
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """
@@ -27,8 +92,162 @@ class TextProcessor:
             return []
 
         print("\n--- Chunking Documents ---")
-        chunked_documents = self.splitter.split_documents(documents)
+        if self.strategy == "recursive":
+            chunked_documents = self.splitter.split_documents(documents)
+        elif len(documents) == 1 or self.workers <= 1:
+            chunked_documents = [chunk for document in documents for chunk in self._split_structured(document)]
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="chunking")
+            chunked_documents = [chunk for chunks in self._executor.map(self._split_structured, documents)
+                                 for chunk in chunks]
         print(f"Total chunks created: {len(chunked_documents)}")
         if not chunked_documents:
             print("No chunks were created. Check your documents and chunking parameters.")
-        return chunked_documents
\ No newline at end of file
+        return chunked_documents
+
+    def _count(self, text: str) -> int:
+        return self.counter.count(text, cache=False)
+
+    def _parse_blocks(self, text: str) -> List[_Block]:
+        """Splits text into headings, paragraphs and code blocks, each tagged with its section path."""
+        blocks: List[_Block] = []
+        headings: List[Tuple[int, str]] = []  # (level, title) of the enclosing headings
+        paragraph: List[str] = []
+        fence: Optional[str] = None
+
+        def section() -> Tuple[str, ...]:
+            return tuple(title for _, title in headings)
+
+        def flush():
+            if paragraph:
+                body = "\n".join(paragraph).strip()
+                if body:
+                    blocks.append(_Block(body, section(), self._count(body)))
+                paragraph.clear()
+
+        def open_section(level: int, title: str, line: str):
+            flush()
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, title))
+            blocks.append(_Block(line, section(), self._count(line), is_heading=True))
+
+        for line in text.splitlines():
+            fence_match = _FENCE.match(line)
+            if fence is not None:
+                paragraph.append(line)
+                if fence_match and fence_match.group(1) == fence:
+                    fence = None
+                    flush()
+                continue
+            if fence_match:
+                flush()
+                fence = fence_match.group(1)
+                paragraph.append(line)
+                continue
+            heading = _ATX_HEADING.match(line)
+            if heading:
+                open_section(len(heading.group(1)), heading.group(2).strip(), line.strip())
+                continue
+            if not line.strip():
+                flush()
+                continue
+            bold = _BOLD_HEADING.match(line.strip()) if not paragraph else None
+            if bold:
+                # Level 7: below every Markdown heading, and each bold heading replaces the previous one.
+                open_section(7, bold.group(1).strip().rstrip(":"), line.strip())
+                continue
+            paragraph.append(line)
+        flush()
+        return blocks
+
+    def _split_oversized(self, block: _Block, limit: int) -> List[_Block]:
+        """Cuts a block larger than `limit` tokens at line, then sentence, then token boundaries."""
+        lines = block.text.split("\n")
+        if len(lines) > 2 and _FENCE.match(lines[0]) and _FENCE.match(lines[-1]):
+            # Code is cut at lines and every piece is fenced again, so each one stays a code block.
+            fence = lines[0].strip()
+            fence_tokens = self._count(f"{fence}\n{fence}")
+            inner = _Block("\n".join(lines[1:-1]), block.section, block.tokens - fence_tokens)
+            return [_Block(f"{fence}\n{piece.text}\n{fence}", block.section, piece.tokens + fence_tokens)
+                    for piece in self._split_oversized(inner, max(1, limit - fence_tokens))]
+        pieces = lines if len(lines) > 1 else _SENTENCE_END.split(block.text)
+        if len(pieces) == 1:
+            return [_Block(window, block.section, self._count(window))
+                    for window in self.counter.windows(block.text, limit, self.chunk_overlap_tokens)]
+        separator = "\n" if len(lines) > 1 else " "
+        result: List[_Block] = []
+        current: List[str] = []
+        current_tokens = 0
+        for piece in pieces:
+            piece_tokens = self._count(piece)
+            if current and current_tokens + piece_tokens > limit:
+                result.append(_Block(separator.join(current), block.section, current_tokens))
+                current, current_tokens = [], 0
+            if piece_tokens > limit:
+                result.extend(self._split_oversized(_Block(piece, block.section, piece_tokens), limit))
+                continue
+            current.append(piece)
+            current_tokens += piece_tokens
+        if current:
+            result.append(_Block(separator.join(current), block.section, current_tokens))
+        return result
+
+    def _split_structured(self, document: Document) -> List[Document]:
+        header_tokens: Dict[Tuple[str, ...], int] = {(): 0}
+
+        def header_cost(section: Tuple[str, ...]) -> int:
+            """Tokens of the "[section path]" line a chunk of this section may start with."""
+            if section not in header_tokens:
+                header_tokens[section] = self._count(f"[{_SECTION_SEPARATOR.join(section)}]") + _BLOCK_SEPARATOR_TOKENS
+            return header_tokens[section]
+
+        blocks: List[_Block] = []
+        for block in self._parse_blocks(document.page_content):
+            limit = self.chunk_tokens - header_cost(block.section) - _BLOCK_SEPARATOR_TOKENS
+            blocks.extend(self._split_oversized(block, limit) if block.tokens > limit else [block])
+
+        chunks: List[Document] = []
+        current: List[_Block] = []
+        # Chunks are cut at headings once they are at least this full, so sections start new chunks
+        # without a document full of short sections turning into a lot of tiny chunks.
+        min_tokens = self.chunk_tokens // 4
+
+        def size(chunk_blocks: List[_Block]) -> int:
+            return sum(block.tokens + _BLOCK_SEPARATOR_TOKENS for block in chunk_blocks)
+
+        def emit() -> List[_Block]:
+            section = current[0].section
+            parts = [block.text for block in current]
+            if section and not current[0].is_heading:
+                parts.insert(0, f"[{_SECTION_SEPARATOR.join(section)}]")
+            metadata = dict(document.metadata)
+            if section:
+                metadata["section"] = _SECTION_SEPARATOR.join(section)
+            chunks.append(Document(page_content="\n\n".join(parts), metadata=metadata))
+            # Trailing paragraphs of the same section are repeated at the start of the next chunk.
+            overlap: List[_Block] = []
+            overlap_tokens = 0
+            for block in reversed(current[1:]):
+                if block.is_heading or block.section != current[-1].section or \
+                        overlap_tokens + block.tokens > self.chunk_overlap_tokens:
+                    break
+                overlap.insert(0, block)
+                overlap_tokens += block.tokens
+            return overlap
+
+        for block in blocks:
+            needed = block.tokens + _BLOCK_SEPARATOR_TOKENS + header_cost(block.section)
+            if current and block.is_heading and size(current) >= min_tokens:
+                emit()
+                current = []  # a new section does not carry the previous one's paragraphs over
+            elif current and size(current) + needed > self.chunk_tokens and \
+                    not all(b.is_heading for b in current):  # headings always stay with what follows them
+                current = emit()
+                if size(current) + needed > self.chunk_tokens:
+                    current = []
+            current.append(block)
+        if current:
+            emit()
+        return chunks
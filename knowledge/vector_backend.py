@@ -0,0 +1,207 @@
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from knowledge.metadata_filter import Conditions, to_chroma_where
+
+
+class SecondaryIndex(ABC):
+    """
+    An index kept alongside the vector store (e.g. a lexical index). VectorStoreManager forwards
+    every write to it so it never drifts from the stored chunks.
+    """
+
+    # Whether an empty index must be filled from the existing store when it is registered.
+    requires_backfill = True
+
+    @abstractmethod
+    def add_chunks(self, ids: List[str], documents: List[Document]):
+        pass
+
+    @abstractmethod
+    def remove_chunks(self, ids: List[str]):
+        pass
+
+    @abstractmethod
+    def reset(self):
+        pass
+
+    @abstractmethod
+    def flush(self):
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class VectorBackend(ABC):
+    """
+    Storage and similarity search for embedded chunks. Scores returned by search methods are
+    "higher is more similar" regardless of the underlying distance metric.
+    """
+
+    @abstractmethod
+    def load(self):
+        """Opens existing state (creating an empty store if there is none)."""
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[Document]):
+        pass
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        pass
+
+    @abstractmethod
+    def reset(self):
+        """Drops every stored chunk."""
+        pass
+
+    @abstractmethod
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], k: int,
+                     filter: Optional[Conditions] = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Runs several queries at once and returns the top-k (document, score) pairs for each. With a
+        filter (see metadata_filter.normalize_filter), only chunks whose metadata matches are searched.
+        """
+        pass
+
+    @abstractmethod
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        """Replaces the metadata of stored chunks, keeping their text and vectors."""
+        pass
+
+    @abstractmethod
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        pass
+
+    @abstractmethod
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Document]]]:
+        """Yields (ids, documents) batches covering every stored chunk."""
+        pass
+
+    @abstractmethod
+    def iter_vectors(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[List[float]], List[Document]]]:
+        """Yields (ids, embeddings, documents) batches covering every stored chunk, e.g. to copy the store."""
+        pass
+
+    def flush(self):
+        """Persists any state held in memory (e.g. ANN structures). Called at ingest checkpoints."""
+        pass
+
+    def drop(self):
+        """Deletes the store itself (files or collection), not only its chunks."""
+        self.reset()
+
+    def warm_up(self):
+        """Builds in-memory structures that would otherwise be built by the first query."""
+        pass
+
+    def search(self, query_embedding: Sequence[float], k: int,
+               filter: Optional[Conditions] = None) -> List[Tuple[Document, float]]:
+        return self.search_batch([query_embedding], k, filter)[0]
+
+
+class ChromaBackend(VectorBackend):
+    """Persistent ChromaDB collection. chromadb is only imported when the collection is first opened."""
+
+    def __init__(self, embedding_function: Embeddings, db_directory: str, collection_name: str):
+        self.embedding_function = embedding_function
+        self.db_directory = db_directory
+        self.collection_name = collection_name
+        self.db = None
+
+    def load(self):
+        if not self.db:
+            from langchain_chroma import Chroma
+            self.db = Chroma(
+                persist_directory=self.db_directory,
+                embedding_function=self.embedding_function,
+                collection_name=self.collection_name
+            )
+
+    def count(self) -> int:
+        if self.db and self.db._collection:
+            return self.db._collection.count()
+        return 0
+
+    def upsert(self, ids: List[str], embeddings: Sequence[Sequence[float]], documents: List[Document]):
+        self.load()
+        self.db._collection.upsert(
+            ids=ids,
+            embeddings=[list(vector) for vector in embeddings],
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata or None for doc in documents]
+        )
+
+    def delete(self, ids: List[str]):
+        self.load()
+        self.db.delete(ids=ids)
+
+    def reset(self):
+        self.load()
+        self.db.reset_collection()
+
+    def search_batch(self, query_embeddings: Sequence[Sequence[float]], k: int,
+                     filter: Optional[Conditions] = None) -> List[List[Tuple[Document, float]]]:
+        self.load()
+        result = self.db._collection.query(
+            query_embeddings=[list(vector) for vector in query_embeddings],
+            n_results=k,
+            where=to_chroma_where(filter) if filter else None,
+            include=["documents", "metadatas", "distances"]
+        )
+        batches = []
+        for ids, texts, metadatas, distances in zip(result["ids"], result["documents"], result["metadatas"],
+                                                    result["distances"]):
+            batches.append([
+                (Document(id=chunk_id, page_content=text, metadata=metadata or {}), -distance)
+                for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+            ])
+        return batches
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        self.load()
+        self.db._collection.update(ids=ids, metadatas=metadatas)
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        self.load()
+        return self.db.get_by_ids(ids)
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Document]]]:
+        self.load()
+        offset = 0
+        while True:
+            result = self.db._collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+            if not result["ids"]:
+                return
+            yield result["ids"], [Document(id=chunk_id, page_content=text, metadata=metadata or {})
+                                  for chunk_id, text, metadata in
+                                  zip(result["ids"], result["documents"], result["metadatas"])]
+            offset += len(result["ids"])
+
+    def iter_vectors(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[List[float]], List[Document]]]:
+        self.load()
+        offset = 0
+        while True:
+            result = self.db._collection.get(limit=batch_size, offset=offset,
+                                             include=["embeddings", "documents", "metadatas"])
+            if not result["ids"]:
+                return
+            yield result["ids"], [list(vector) for vector in result["embeddings"]], [
+                Document(id=chunk_id, page_content=text, metadata=metadata or {})
+                for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])]
+            offset += len(result["ids"])
+
+    def drop(self):
+        self.load()
+        self.db.delete_collection()
+        self.db = None
@@ -1,88 +1,304 @@
-from langchain_chroma import Chroma
+import threading
+from functools import partial
+
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
-from typing import List, Optional
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from knowledge.metadata_filter import normalize_filter
+from knowledge.vector_backend import VectorBackend, ChromaBackend, SecondaryIndex
+from knowledge.numpy_backend import NumpyBackend
+from knowledge.sharded_backend import ShardedBackend
+
+
+def create_store(backend: str, db_directory: str, collection_name: str, embedding_function: Optional[Embeddings] = None,
+                 ann_index: Optional[str] = None, ann_nprobe: int = 8, ann_ef_search: int = 64,
+                 quantization: Optional[str] = None, rescore_factor: int = 8,
+                 filter_fields: Sequence[str] = ()) -> VectorBackend:
+    """
+    Creates one store. A module-level function, so that a partial of it can be pickled and sent to
+    the worker process serving a shard. ChromaBackend never embeds text itself (vectors are always
+    passed in), so shards are created without an embedding function.
+    """
+    if backend == "chroma":
+        return ChromaBackend(embedding_function, db_directory, collection_name)
+    return NumpyBackend(db_directory, collection_name, ann=ann_index, nprobe=ann_nprobe, ef_search=ann_ef_search,
+                        quantization=quantization, rescore_factor=rescore_factor, filter_fields=filter_fields)
 
 
 class VectorStoreManager:
-    def __init__(self, embedding_function: Embeddings, db_directory: str, collection_name: str):
+    def __init__(self, embedding_function: Embeddings, db_directory: str, collection_name: str,
+                 backend: str = "chroma", ann_index: Optional[str] = None, ann_nprobe: int = 8,
+                 ann_ef_search: int = 64, quantization: Optional[str] = None, rescore_factor: int = 8,
+                 filter_fields: Sequence[str] = (), shards: int = 1, shard_partition: str = "hash",
+                 shard_timeout_seconds: float = 0.5):
         self.embedding_function = embedding_function
         self.db_directory = db_directory
         self.collection_name = collection_name
-        self.db: Optional[Chroma] = None
-        print(f"💾 VectorStoreManager initialized for directory '{db_directory}' and collection '{collection_name}'.")
+        self.backend_name = backend
+        self.ann_index = ann_index
+        self.ann_nprobe = ann_nprobe
+        self.ann_ef_search = ann_ef_search
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.filter_fields = tuple(filter_fields)
+        self.shards = shards
+        self.shard_partition = shard_partition
+        self.shard_timeout_seconds = shard_timeout_seconds
+        self.backend: VectorBackend = self._create_backend(backend)
+        self.secondary_indexes: List[SecondaryIndex] = []
+        # Chunks stored but not visible to queries: staged chunks of an unpublished update, and
+        # retired chunks that an update replaced and that are about to be deleted. Replaced as a whole
+        # (never mutated) so a query reads one consistent set without locking.
+        self._hidden: FrozenSet[str] = frozenset()
+        self._visibility_lock = threading.Lock()
+        # Chunk count, cached for queries; every write through this manager invalidates it.
+        self._count: Optional[int] = None
+        self._writes = 0
+        print(f"💾 VectorStoreManager initialized for directory '{db_directory}' and collection '{collection_name}' "
+              f"({backend} backend{f', {shards} shards' if shards > 1 else ''}).")
 
-    def store_documents(self, documents: List[Document]):
+    def _create_backend(self, backend: str) -> VectorBackend:
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unsupported vector store backend: {backend}")
+        if backend == "chroma":
+            if self.ann_index:
+                print("Chroma maintains its own HNSW index; the ann_index setting only applies to the numpy backend.")
+            if self.quantization:
+                print("Chroma stores full-precision vectors; the quantization setting only applies to the numpy backend.")
+        create = partial(create_store, backend, self.db_directory, ann_index=self.ann_index,
+                         ann_nprobe=self.ann_nprobe, ann_ef_search=self.ann_ef_search, quantization=self.quantization,
+                         rescore_factor=self.rescore_factor, filter_fields=self.filter_fields)
+        if self.shards > 1:
+            # Each shard is a store of its own, served by a worker process.
+            return ShardedBackend(create, self.db_directory, self.collection_name, shards=self.shards,
+                                  partition=self.shard_partition, timeout_seconds=self.shard_timeout_seconds)
+        return create(self.collection_name, embedding_function=self.embedding_function)
+
+    def add_secondary_index(self, index: SecondaryIndex):
+        """
+        Registers an index that must mirror the stored chunks. If it is empty while the store is not
+        (first run after enabling it, or a lost index file), it is backfilled from the store.
+        """
+        self.secondary_indexes.append(index)
+        if index.requires_backfill and len(index) == 0 and self.get_collection_count() > 0:
+            print(f"Backfilling {type(index).__name__} from {self.get_collection_count()} stored chunk(s)...")
+            for ids, documents in self.backend.iter_documents():
+                index.add_chunks(ids, documents)
+            index.flush()
+
+    def store_documents(self, documents: List[Document], ids: Optional[List[str]] = None):
+        """
+        Embeds and upserts documents into the collection. When stable IDs are given, storing a
+        chunk that already exists overwrites it instead of adding a duplicate.
+        """
         if not documents:
             print("No documents provided to store.")
             return
 
-        print("\n--- Storing Chunks in ChromaDB ---")
+        print(f"\n--- Storing Chunks in {self.backend_name} vector store ---")
+        ids = ids or [doc.id for doc in documents]
+        if any(chunk_id is None for chunk_id in ids):
+            raise ValueError("store_documents requires an ID for every document.")
+        embeddings = self.embedding_function.embed_documents([doc.page_content for doc in documents])
+        self.store_embeddings(documents, embeddings, ids)
+        print(f"{len(documents)} chunk(s) embedded and upserted into collection '{self.collection_name}'.")
+        print(f"Number of items in collection: {self.get_collection_count()}")
+
+    def store_embeddings(self, documents: List[Document], embeddings: List[List[float]], ids: List[str],
+                         staged: bool = False):
+        """
+        Upserts chunks whose embeddings were already computed, so no embedding call is made here.
+        Staged chunks are hidden from queries until publish() makes them visible.
+        """
+        if not documents:
+            return
+        if staged:
+            self._set_hidden(self._hidden | set(ids))
+        try:
+            self.backend.upsert(ids, embeddings, documents)
+        except Exception as e:
+            print(f"Error storing embeddings in {self.backend_name} vector store: {e}")
+            raise
+        finally:
+            self._invalidate_count()
+        for index in self.secondary_indexes:
+            index.add_chunks(ids, documents)
+
+    def delete_documents(self, ids: List[str]):
+        """Deletes chunks by ID. Unknown IDs are ignored."""
+        if not ids:
+            return
         try:
-            self.db = Chroma.from_documents(
-                documents=documents,
-                embedding=self.embedding_function,
-                collection_name=self.collection_name,
-                persist_directory=self.db_directory
-            )
-            print(
-                f"Chunks embedded and stored in ChromaDB collection '{self.collection_name}' at '{self.db_directory}'.")
-            print(f"Number of items in collection: {self.get_collection_count()}")
+            self.backend.delete(ids)
+            for index in self.secondary_indexes:
+                index.remove_chunks(ids)
+            print(f"Deleted {len(ids)} chunk(s) from collection '{self.collection_name}'.")
         except Exception as e:
-            print(f"Error storing documents in Chroma: {e}")
+            print(f"Error deleting documents from {self.backend_name} vector store: {e}")
             raise
+        finally:
+            self._invalidate_count()
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        """Replaces the metadata of stored chunks without re-embedding them."""
+        if not ids:
+            return
+        self.backend.update_metadata(ids, metadatas)
+
+    def _set_hidden(self, hidden: Iterable[str]):
+        with self._visibility_lock:
+            self._hidden = frozenset(hidden)
+
+    def publish(self, staged_ids: Sequence[str], retired_ids: Sequence[str]):
+        """
+        Swaps an update in: in one step the staged chunks become visible and the chunks they replace
+        are hidden, so a query sees either the old or the new version of the knowledge base, never a
+        mix. The retired chunks are deleted afterwards.
+        """
+        with self._visibility_lock:
+            self._hidden = (self._hidden - set(staged_ids)) | set(retired_ids)
+        try:
+            self.delete_documents(list(retired_ids))
+        finally:
+            with self._visibility_lock:
+                self._hidden = self._hidden - set(retired_ids)
+
+    def discard_staged(self, staged_ids: Sequence[str]):
+        """Deletes the chunks of an update that will not be published."""
+        try:
+            self.delete_documents(list(staged_ids))
+        finally:
+            with self._visibility_lock:
+                self._hidden = self._hidden - set(staged_ids)
+
+    def is_visible(self, chunk_id: str) -> bool:
+        return chunk_id not in self._hidden
+
+    def reset_collection(self):
+        """Drops every chunk in the collection."""
+        try:
+            self.backend.reset()
+        finally:
+            self._invalidate_count()
+        for index in self.secondary_indexes:
+            index.reset()
+        print(f"Collection '{self.collection_name}' has been reset.")
+
+    def flush(self):
+        """Persists in-memory index state; called at ingest checkpoints."""
+        self.backend.flush()
+        for index in self.secondary_indexes:
+            index.flush()
+
+    def rebuild_shard(self, index: int):
+        """
+        Rebuilds one shard of a sharded store into a fresh store and swaps it in; queries keep being
+        answered meanwhile (see ShardedBackend.rebuild_shard).
+        """
+        if not isinstance(self.backend, ShardedBackend):
+            raise ValueError("rebuild_shard requires a sharded vector store (shards > 1)")
+        self.backend.rebuild_shard(index)
+
+    def rebuild_shards(self):
+        """Rebuilds every shard of a sharded store in turn, so at most one is being copied at a time."""
+        if not isinstance(self.backend, ShardedBackend):
+            raise ValueError("rebuild_shards requires a sharded vector store (shards > 1)")
+        for index in range(self.backend.shard_count()):
+            self.backend.rebuild_shard(index)
 
     def load_existing_store(self):
-        """Loads an existing ChromaDB store if it exists."""
+        """Opens the existing store, creating an empty one if there is none yet."""
         try:
-            self.db = Chroma(
-                persist_directory=self.db_directory,
-                embedding_function=self.embedding_function,
-                collection_name=self.collection_name
-            )
+            self.backend.load()
+            self._invalidate_count()
             print(
-                f"Successfully loaded existing ChromaDB from '{self.db_directory}' for collection '{self.collection_name}'.")
+                f"Successfully loaded existing {self.backend_name} store from '{self.db_directory}' for collection '{self.collection_name}'.")
             print(f"Number of items in collection: {self.get_collection_count()}")
-        except Exception as e:  # Broad exception, Chroma can raise various errors if dir/collection doesn't exist as expected
+        except Exception as e:
             print(
-                f"Could not load existing ChromaDB from '{self.db_directory}' for collection '{self.collection_name}'. A new one may be created on store_documents. Error: {e}")
-            self.db = None
+                f"Could not load existing {self.backend_name} store from '{self.db_directory}' for collection '{self.collection_name}'. Error: {e}")
 
-    def query_documents(self, query_text: str, k: int = 2) -> Optional[List[Document]]:
+    def query_documents(self, query_text: str, k: int = 2,
+                        filter: Optional[Dict[str, object]] = None) -> Optional[List[Document]]:
         """
-        Queries the vector store for similar documents.
+        Queries the vector store for similar documents, among those matching the metadata filter if given.
         """
-        if not self.db:
-            print("Vector store not initialized or loaded. Cannot query.")
-            self.load_existing_store()  # Attempt to load before failing
-            if not self.db:
-                print("Still unable to query. Please store documents first.")
-                return None
+        results = self.query_with_scores(self.embedding_function.embed_query(query_text), k=k, filter=filter)
+        if results is None:
+            return None
+        retrieved_docs = [doc for doc, _ in results]
+        if retrieved_docs:
+            print(f"Results for query: '{query_text}' (top {k})")
+            for i, doc in enumerate(retrieved_docs):
+                print(f"\n--- Result {i + 1} ---")
+                print(f"Source: {doc.metadata.get('source', 'N/A')}")
+                print(f"Content snippet: {doc.page_content[:10]}...")
+        else:
+            print("No results found for the query.")
+        return retrieved_docs
 
+    def query_with_scores(self, query_embedding: Sequence[float], k: int = 2,
+                          filter: Optional[Dict[str, object]] = None) -> Optional[List[Tuple[Document, float]]]:
+        """Returns the top-k (document, score) pairs for an already embedded query; higher scores are better."""
+        batch = self.query_batch_with_scores([query_embedding], k=k, filter=filter)
+        return batch[0] if batch is not None else None
+
+    def query_batch_with_scores(self, query_embeddings: Sequence[Sequence[float]], k: int = 2,
+                                filter: Optional[Dict[str, object]] = None) -> Optional[List[List[Tuple[Document, float]]]]:
+        """
+        Searches several embedded queries in one backend call. With a metadata filter (see
+        metadata_filter.normalize_filter) only matching chunks are searched.
+        """
         if self.get_collection_count() == 0:
             print("Collection is empty. Cannot query.")
             return None
 
         print(f"\n--- Querying Collection ---")
-        try:
-            retrieved_docs = self.db.similarity_search(query_text, k=k)
-            if retrieved_docs:
-                print(f"Results for query: '{query_text}' (top {k})")
-                for i, doc in enumerate(retrieved_docs):
-                    print(f"\n--- Result {i + 1} ---")
-                    print(f"Source: {doc.metadata.get('source', 'N/A')}")
-                    print(f"Content snippet: {doc.page_content[:10]}...")
-            else:
-                print("No results found for the query.")
-            return retrieved_docs
-        except Exception as e:
-            print(f"Error during query: {e}")
-            return None
+        hidden = self._hidden
+        conditions = normalize_filter(filter)
+        # Hidden chunks can take at most len(hidden) of the top places. Rather than always fetching
+        # that many more (tens of thousands during a large staged update), up to 2k are fetched and
+        # the fetch is widened only for queries left with fewer than k visible results.
+        fetch_k = k + min(len(hidden), k)
+        pending = list(range(len(query_embeddings)))
+        visible: List[Optional[List[Tuple[Document, float]]]] = [None] * len(query_embeddings)
+        while pending:
+            try:
+                batches = self.backend.search_batch([query_embeddings[i] for i in pending], fetch_k, conditions)
+            except Exception as e:
+                print(f"Error during query: {e}")
+                return None
+            if not hidden:
+                return batches
+            short = []
+            for i, results in zip(pending, batches):
+                visible[i] = [(doc, score) for doc, score in results if doc.id not in hidden][:k]
+                if len(visible[i]) < k and len(results) >= fetch_k:
+                    short.append(i)  # hidden chunks crowded out visible ones that may exist
+            if not short or fetch_k >= k + len(hidden):
+                break
+            pending, fetch_k = short, min(4 * fetch_k, k + len(hidden))
+        return visible
+
+    def get_documents(self, ids: List[str]) -> List[Document]:
+        hidden = self._hidden
+        return [doc for doc in self.backend.get_by_ids(ids) if doc.id not in hidden]
+
+    def _invalidate_count(self):
+        self._writes += 1
+        self._count = None
 
     def get_collection_count(self) -> int:
         """
-        Returns the number of items in the collection.
+        Returns the number of items in the collection. Cached between writes, as every query checks it.
         """
-        if self.db and self.db._collection:
-            return self.db._collection.count()
-        return 0
+        count = self._count
+        if count is not None:
+            return count
+        writes = self._writes
+        self.backend.load()
+        count = self.backend.count()
+        if writes == self._writes:
+            self._count = count
+        return count
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Iterator
 
 
 # AIModel is an abstract base class for AI models.
@@ -17,6 +18,27 @@ class AIModel(ABC):
         """
         pass
 
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        Generate content as a stream of text fragments, in order.
+        Models without native streaming yield the complete response as a single fragment.
+
+        Args:
+            prompt (str): The input text to generate content from.
+            **kwargs: Additional parameters for the generation process.
+
+        Returns:
+            Iterator[str]: The generated content, fragment by fragment.
+        """
+        yield self.generate(prompt, **kwargs)
+
+    def warm_up(self):
+        """
+        Opens the connection to the provider ahead of the first request, with a cheap metadata call
+        where the provider has one. Models without a remote endpoint do nothing.
+        """
+        pass
+
     @abstractmethod
     def get_model(self):
         """
@@ -28,9 +50,11 @@ class AIModel(ABC):
         pass
 
 
-import google.generativeai as genai
-import openai
 import os
+import random
+import re
+import time
+import zlib
 
 
 class GenAIModel(AIModel):
@@ -48,7 +72,9 @@ class GenAIModel(AIModel):
 
         if not os.getenv("GEMINI_API_KEY"):
             raise ValueError("GEMINI_API_KEY environment variable is not set.")
+        import google.generativeai as genai
         genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self._genai = genai
         self._model_name = model_name
         self._model = genai.GenerativeModel(model_name)
 
@@ -69,6 +95,27 @@ class GenAIModel(AIModel):
         except Exception as e:
             raise RuntimeError(f"Failed to generate content: {str(e)}")
 
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        Streams content generated for the prompt as it is produced.
+
+        Args:
+            prompt (str): The input text to generate content from.
+            **kwargs: Additional parameters for the generation process.
+
+        Returns:
+            Iterator[str]: Text fragments in order.
+        """
+        try:
+            for chunk in self._model.generate_content(prompt, stream=True, **kwargs):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            raise RuntimeError(f"Failed to stream content: {str(e)}")
+
+    def warm_up(self):
+        self._genai.get_model(f"models/{self._model_name}")
+
     def get_model(self):
         """
         Returns the initialized generative model.
@@ -97,6 +144,7 @@ class OpenAIModel(AIModel):
         if not os.getenv("OPENAI_API_KEY"):
             raise ValueError("OPENAI_API_KEY environment variable is not set.")
         self._api_key = os.getenv("OPENAI_API_KEY")
+        import openai
         openai.api_key = self._api_key
         self._model_name = model_name
         self._client = openai.OpenAI(api_key=self._api_key)
@@ -120,8 +168,34 @@ class OpenAIModel(AIModel):
             )
             return response.choices[0].message.content
         except Exception as e:
-            print(f"Error generating text with OpenAIModel: {e}")
-            return f"Error: {e}"
+            raise RuntimeError(f"Failed to generate content from OpenAI: {str(e)}")
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        Streams text from the OpenAI API as it is generated.
+
+        Args:
+            prompt (str): The input prompt.
+            **kwargs: Additional parameters for OpenAI (e.g., `temperature`, `max_tokens`).
+
+        Returns:
+            Iterator[str]: Text fragments in order.
+        """
+        try:
+            response = self._client.chat.completions.create(
+                model=self._model_name,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                **kwargs
+            )
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise RuntimeError(f"Failed to stream content from OpenAI: {str(e)}")
+
+    def warm_up(self):
+        self._client.models.retrieve(self._model_name)
 
     def get_model(self):
         """
@@ -136,13 +210,54 @@ class OpenAIModel(AIModel):
         }
 
 
+class FakeAIModel(AIModel):
+    """
+        Offline model for benchmarks and tests. Answers are built deterministically from the prompt's
+        words after `latency` seconds; stream() then yields them one word at a time at
+        `tokens_per_second`, so time to first token and total time can be simulated separately.
+    """
+
+    def __init__(self, model_name: str = "fake", latency: float = 0.0, tokens_per_second: float = 0.0,
+                 answer_words: int = 60):
+        self._model_name = model_name
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_words = answer_words
+
+    def _answer_words(self, prompt: str) -> list:
+        words = re.findall(r"\w+", prompt) or ["ok"]
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+        return [rng.choice(words) for _ in range(self.answer_words)]
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.tokens_per_second:
+            time.sleep(self.answer_words / self.tokens_per_second)
+        return " ".join(self._answer_words(prompt))
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        for i, word in enumerate(self._answer_words(prompt)):
+            if self.tokens_per_second:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield word if i == 0 else f" {word}"
+
+    def get_model(self):
+        return {
+            "model_name": self._model_name,
+            "model_instance": None
+        }
+
+
 # factory function to create AIModel instances
 def get_ai_model(model_type: str = "gemini", model_name: str = "gemini-2.0-flash") -> AIModel:
     """
     Factory function to create an instance of AIModel based on the specified type.
 
     Args:
-        model_type (str): The type of AI model to create ('gemini' or 'openai').
+        model_type (str): The type of AI model to create ('gemini', 'openai' or 'fake').
         model_name (str): The name of the model to use.
 
     Returns:
@@ -152,5 +267,7 @@ def get_ai_model(model_type: str = "gemini", model_name: str = "gemini-2.0-flash
         return GenAIModel(model_name)
     elif model_type == "openai":
         return OpenAIModel(model_name)
+    elif model_type == "fake":
+        return FakeAIModel(model_name)
     else:
         raise ValueError(f"Unsupported model type: {model_type}")
@@ -1,20 +1,101 @@
 # this class uses chain of responsibility pattern to chain multiple AI models together
 # if one fails, it will try the next one
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait
+from typing import Dict, Iterator, List, Optional
+
 from llm.ai_model import get_ai_model
+from llm.model_health import ModelHealth
+from utils import telemetry
+from utils.constant import LLM_TIMEOUT_SECONDS, LLM_HEDGE_REQUESTS
+
+
+class _Attempt:
+    """One call to one model. Settled exactly once, either by its result or by its timeout."""
+
+    def __init__(self, model, name: str, timeout: float):
+        self.model = model
+        self.name = name
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def settle(self) -> bool:
+        with self._lock:
+            if self._settled:
+                return False
+            self._settled = True
+            return True
+
+
+def _close(fragments: Iterator[str]):
+    """Closes a model's stream so its HTTP response is released."""
+    close = getattr(fragments, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        pass  # e.g. still executing in an abandoned next(); closed again once that returns
+
 
 class AIModelChain:
-    def __init__(self, models):
+    def __init__(self, models, timeouts: Optional[Dict[str, float]] = None, default_timeout: float = 30.0,
+                 hedge: bool = True, hedge_min_samples: int = 20, failure_threshold: int = 5,
+                 reset_seconds: float = 30.0, max_workers: int = 16):
         """
         Initializes the AIModelChain with a list of AI models.
 
         Args:
-            models (list): A list of AIModel instances to be used in the chain.
+            models (list): A list of AIModel instances to be used in the chain, in order of preference.
+            timeouts (dict): Per-model timeouts in seconds, keyed by model name.
+            default_timeout (float): Timeout for models without an entry in `timeouts`.
+            hedge (bool): Send the prompt to the next model too once a model is slower than its p95 latency.
+            hedge_min_samples (int): Successful calls needed before a model's p95 is trusted for hedging.
+            failure_threshold (int): Consecutive failures after which a model is skipped for a while.
+            reset_seconds (float): How long a failing model is skipped before it is tried again.
+            max_workers (int): Threads running model calls for all concurrent requests.
         """
         self.models = models
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.health = {self._name(model): ModelHealth(failure_threshold=failure_threshold, reset_seconds=reset_seconds)
+                       for model in models}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+
+    @staticmethod
+    def _name(model) -> str:
+        return model.get_model()["model_name"]
+
+    def _timeout(self, name: str) -> float:
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _call(self, attempt: _Attempt, prompt: str, kwargs: dict) -> str:
+        health = self.health[attempt.name]
+        try:
+            result = attempt.model.generate(prompt, **kwargs)
+        except Exception:
+            if attempt.settle():
+                health.record_failure()
+                telemetry.increment("llm_calls_total", model=attempt.name, outcome="error")
+            raise
+        latency = time.monotonic() - attempt.started_at
+        if attempt.settle():
+            health.record_success(latency)
+            telemetry.increment("llm_calls_total", model=attempt.name, outcome="success")
+        telemetry.observe("llm_latency_seconds", latency, model=attempt.name)
+        return result
 
     def generate(self, prompt: str, **kwargs) -> str:
         """
         Generate content by passing the prompt through the chain of AI models.
+        Models whose circuit breaker is open are skipped. A model that fails or exceeds its timeout
+        hands over to the next one; with hedging, the next model is also started once the current
+        one is slower than its own p95 latency, and whichever answers first wins.
 
         Args:
             prompt (str): The input text to generate content from.
@@ -23,22 +104,175 @@ class AIModelChain:
         Returns:
             str: The generated content from the first successful model.
         """
-        for model in self.models:
+        remaining = list(self.models)
+        pending = {}
+        hedge_at = None
+
+        def launch() -> bool:
+            nonlocal hedge_at
+            while remaining:
+                model = remaining.pop(0)
+                name = self._name(model)
+                if not self.health[name].allow():
+                    print(f"Model {name} skipped: circuit breaker is open")
+                    telemetry.increment("llm_calls_total", model=name, outcome="skipped")
+                    continue
+                attempt = _Attempt(model, name, self._timeout(name))
+                pending[self._executor.submit(self._call, attempt, prompt, kwargs)] = attempt
+                p95 = self.health[name].latency_percentile(95, self.hedge_min_samples) if self.hedge else None
+                hedge_at = attempt.started_at + p95 if p95 is not None else None
+                return True
+            return False
+
+        launch()
+        while pending:
+            deadlines = [attempt.deadline for attempt in pending.values()]
+            if hedge_at is not None and remaining:
+                deadlines.append(hedge_at)
+            done, _ = wait(pending, timeout=max(0.0, min(deadlines) - time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Model {attempt.name} failed with error: {e}")
+                    continue
+                telemetry.current_span().set_attribute("model", attempt.name)
+                return result
+
+            now = time.monotonic()
+            for future, attempt in list(pending.items()):
+                if now >= attempt.deadline:
+                    # The call cannot be interrupted; it finishes in the background and is ignored.
+                    del pending[future]
+                    if attempt.settle():
+                        self.health[attempt.name].record_failure()
+                        telemetry.increment("llm_calls_total", model=attempt.name, outcome="timeout")
+                    print(f"Model {attempt.name} timed out after {self._timeout(attempt.name):.1f}s")
+
+            if not pending:
+                if remaining:
+                    telemetry.increment("llm_fallbacks_total")
+                launch()
+            elif hedge_at is not None and now >= hedge_at and remaining:
+                print(f"Hedging: {', '.join(a.name for a in pending.values())} slower than p95, starting next model")
+                telemetry.increment("llm_hedges_total")
+                launch()
+        raise RuntimeError("All models in the chain failed to generate content.")
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        Stream content from the first model that produces a first fragment within its timeout.
+        A model that fails before its first fragment is skipped; once fragments have been yielded
+        the response cannot be restarted on another model, so later failures are raised. Every
+        fragment must arrive within the model's timeout of the previous one; a stream that stalls
+        raises TimeoutError. Abandoned streams are closed.
+
+        Args:
+            prompt (str): The input text to generate content from.
+            **kwargs: Additional parameters for the generation process.
+
+        Returns:
+            Iterator[str]: Text fragments from the first successful model.
+        """
+        for position, model in enumerate(self.models):
+            name = self._name(model)
+            health = self.health[name]
+            if not health.allow():
+                print(f"Model {name} skipped: circuit breaker is open")
+                telemetry.increment("llm_calls_total", model=name, outcome="skipped")
+                continue
+            started = time.monotonic()
+            fragments = model.stream(prompt, **kwargs)
             try:
-                return model.generate(prompt, **kwargs)
+                first = self._next_fragment(fragments, self._timeout(name))
+            except FuturesTimeoutError:
+                health.record_failure()
+                telemetry.increment("llm_calls_total", model=name, outcome="timeout")
+                print(f"Model {name} timed out before streaming after {self._timeout(name):.1f}s")
+                continue
             except Exception as e:
-                print(f"Model {model.get_model()} failed with error: {e}")
+                health.record_failure()
+                telemetry.increment("llm_calls_total", model=name, outcome="error")
+                print(f"Model {name} failed before streaming with error: {e}")
+                continue
+            # Streaming time is not comparable with generate() latency, so it stays out of the percentiles.
+            health.record_success()
+            telemetry.increment("llm_calls_total", model=name, outcome="success")
+            telemetry.observe("llm_time_to_first_token_seconds", time.monotonic() - started, model=name)
+            span = telemetry.current_span()
+            span.set_attribute("model", name)
+            if position:
+                span.set_attribute("fallbacks", position)
+                telemetry.increment("llm_fallbacks_total", position)
+            try:
+                fragment = first
+                while fragment is not None:
+                    yield fragment
+                    fragment = self._next_fragment(fragments, self._timeout(name))
+            except FuturesTimeoutError:
+                health.record_failure()
+                telemetry.increment("llm_calls_total", model=name, outcome="timeout")
+                raise TimeoutError(f"Model {name} stalled for {self._timeout(name):.1f}s while streaming")
+            except Exception:
+                health.record_failure()
+                raise
+            finally:
+                _close(fragments)
+            return
         raise RuntimeError("All models in the chain failed to generate content.")
 
+    def _next_fragment(self, fragments: Iterator[str], timeout: float) -> Optional[str]:
+        """
+        Pulls the next fragment on the executor, so a stalled stream cannot block the caller for
+        longer than `timeout`. Returns None at the end of the stream.
+        """
+        future = self._executor.submit(next, fragments, None)
+        try:
+            return future.result(timeout=timeout)
+        except FuturesTimeoutError:
+            # The pending next() cannot be interrupted; the stream is closed once it returns.
+            future.add_done_callback(lambda _: _close(fragments))
+            raise
+
+    def warm_up(self):
+        """
+        Opens every model's connection in parallel so the first request does not pay for the TLS
+        handshakes. Failures are only reported: the model is still tried when a request comes in.
+        """
+        futures = {self._executor.submit(model.warm_up): self._name(model) for model in self.models}
+        for future, name in futures.items():
+            try:
+                future.result(timeout=self._timeout(name))
+            except Exception as e:
+                print(f"Model {name} warm-up failed: {e!r}")
+
+    def model_names(self) -> List[str]:
+        """Names of the models in the chain, in order of preference."""
+        return [self._name(model) for model in self.models]
+
+    def stats(self) -> Dict[str, dict]:
+        """Rolling latency/error statistics and breaker state per model."""
+        return {name: health.stats() for name, health in self.health.items()}
+
+
+_default_chain: Optional[AIModelChain] = None
+_default_chain_lock = threading.Lock()
+
 
 def get_default_ai_model_chain() -> AIModelChain:
     """
-    Returns the list of AI models in the chain.
+    Returns the shared default chain. Model clients are created on the first call and reused, so
+    their HTTP connection pools and the chain's latency statistics survive across requests.
 
     Returns:
-        list: The list of AIModel instances.
+        AIModelChain: The default chain of AI models.
     """
-    return AIModelChain([
-        get_ai_model("gemini", "gemini-2.0-flash"),
-        get_ai_model("openai", "gpt-3.5-turbo")
-    ])
+    global _default_chain
+    with _default_chain_lock:
+        if _default_chain is None:
+            _default_chain = AIModelChain([
+                get_ai_model("gemini", "gemini-2.0-flash"),
+                get_ai_model("openai", "gpt-3.5-turbo")
+            ], default_timeout=LLM_TIMEOUT_SECONDS, hedge=LLM_HEDGE_REQUESTS)
+        return _default_chain
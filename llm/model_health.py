@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ModelHealth:
+    """
+    Rolling latency/error statistics and a circuit breaker for one model.
+    - The last `window` calls are kept; p95 latency is computed over the successful ones.
+    - After `failure_threshold` consecutive failures the breaker opens and the model is skipped for
+      `reset_seconds`. Then one trial call is let through (half-open): success closes the breaker,
+      failure opens it again.
+    """
+
+    def __init__(self, window: int = 100, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now. In half-open state only one trial call is allowed."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency: Optional[float] = None):
+        """Records a successful call; `latency` (seconds) feeds the percentiles when given."""
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            self._outcomes.append(True)
+            self._consecutive_failures = 0
+            self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def latency_percentile(self, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """Latency (seconds) at the given percentile, or None with fewer than `min_samples` successes."""
+        with self._lock:
+            if len(self._latencies) < max(min_samples, 1):
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(percentile / 100.0 * len(ordered)))]
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def stats(self) -> Dict[str, float]:
+        p50, p95 = self.latency_percentile(50), self.latency_percentile(95)
+        with self._lock:
+            calls = len(self._outcomes)
+            errors = calls - sum(self._outcomes)
+            return {
+                "state": self._state,
+                "calls": calls,
+                "error_rate": errors / calls if calls else 0.0,
+                "p50_seconds": p50,
+                "p95_seconds": p95,
+            }
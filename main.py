@@ -1,16 +1,44 @@
+import time
+
+_process_started = time.perf_counter()
+
+import argparse
 import logging
 import os
+import signal
+import threading
 
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from dotenv import load_dotenv
-from slack_sdk.errors import SlackApiError
 from llm.ai_model_chain import get_default_ai_model_chain
 
 from knowledge.rag_pipeline import RAGPipeline
+from knowledge.response_cache import SemanticResponseCache
+from knowledge.sharded_backend import ShardedBackend
+from knowledge.source_watcher import SourceWatcher
 from utils.constant import SOURCE_DIRECTORY, CHROMA_DB_DIRECTORY, COLLECTION_NAME, CHUNK_SIZE, CHUNK_OVERLAP, \
-    EMBEDDING_MODEL_NAME, FORCE_RECREATE_STORE
-from utils.slack_utils import build_prompt_with_context
+    CHUNKING_STRATEGY, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNKING_WORKERS, \
+    EMBEDDING_MODEL_NAME, FORCE_RECREATE_STORE, INGEST_ON_STARTUP, WARM_UP_ON_STARTUP, EMBEDDING_CACHE_DIRECTORY, \
+    WATCH_SOURCE_DIRECTORY, WATCH_DEBOUNCE_SECONDS, WATCH_POLL_INTERVAL_SECONDS, \
+    LOADER_WORKERS, INGEST_BATCH_SIZE, EMBEDDING_CONCURRENCY, \
+    EMBEDDING_BACKEND, EMBEDDING_REQUEST_CONCURRENCY, EMBEDDING_REQUESTS_PER_MINUTE, \
+    VECTOR_STORE_BACKEND, ANN_INDEX, ANN_NPROBE, ANN_EF_SEARCH, RETRIEVAL_MODE, \
+    VECTOR_QUANTIZATION, QUANTIZATION_RESCORE_FACTOR, VECTOR_STORE_SHARDS, SHARD_PARTITION, SHARD_TIMEOUT_MS, \
+    QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_WAIT_MS, \
+    QUERY_BATCH_MAX_SIZE, DEDUP_CHUNKS, DEDUP_THRESHOLD, \
+    METADATA_PATH_FIELDS, METADATA_FRONT_MATTER, METADATA_FILTER_FIELDS, CHANNEL_METADATA_FILTERS, \
+    RERANKER, RERANK_FETCH_K, RERANK_BUDGET_MS, RETRIEVAL_TOP_K, \
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_SIMILARITY, \
+    MENTION_WORKERS, MENTION_QUEUE_SIZE, MENTION_PER_CHANNEL_LIMIT, STREAM_RESPONSES, STREAM_UPDATE_INTERVAL_SECONDS, \
+    SLACK_USER_CACHE_SIZE, SLACK_USER_CACHE_TTL_SECONDS, SLACK_THREAD_CACHE_SIZE, SLACK_THREAD_CACHE_TTL_SECONDS, \
+    TELEMETRY_ENABLED, TELEMETRY_OPENTELEMETRY, METRICS_PORT
+from utils.mention_dispatcher import MentionDispatcher, BUSY, DUPLICATE
+from utils.mention_handler import MentionHandler
+from utils import telemetry
+from utils.slack_cache import SlackMetadataCache
+from utils.startup import StartupTimer
+from utils.token_counter import get_token_counter
 
 load_dotenv()
 
@@ -19,17 +47,86 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = App(token=os.getenv("SLACK_BOT_TOKEN"))
+startup = StartupTimer(started_at=_process_started)
 MAX_MESSAGE_PER_THREAD = 10
 
-BOT_NAME = "Intellibot"
-
-user_name_cache = {}
+BUSY_MESSAGE = "I'm answering a lot of questions right now. Please ask me again in a minute."
 
 # Initialize RAG Pipeline
 rag_pipeline = None
+response_cache = SemanticResponseCache(
+    max_entries=RESPONSE_CACHE_SIZE,
+    ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+    similarity_threshold=RESPONSE_CACHE_SIMILARITY
+)
+slack_cache = SlackMetadataCache(
+    user_ttl_seconds=SLACK_USER_CACHE_TTL_SECONDS,
+    max_users=SLACK_USER_CACHE_SIZE,
+    thread_ttl_seconds=SLACK_THREAD_CACHE_TTL_SECONDS,
+    max_threads=SLACK_THREAD_CACHE_SIZE
+)
+mention_handler = MentionHandler(
+    rag_pipeline=None,
+    response_cache=response_cache,
+    model_chain_factory=get_default_ai_model_chain,
+    max_messages_per_thread=MAX_MESSAGE_PER_THREAD,
+    stream_responses=STREAM_RESPONSES,
+    stream_update_interval=STREAM_UPDATE_INTERVAL_SECONDS,
+    top_k=RETRIEVAL_TOP_K,
+    slack_cache=slack_cache,
+    channel_filters=CHANNEL_METADATA_FILTERS
+)
+dispatcher = MentionDispatcher(
+    workers=MENTION_WORKERS,
+    max_queue=MENTION_QUEUE_SIZE,
+    per_channel_limit=MENTION_PER_CHANNEL_LIMIT
+)
+
+
+def collect_metrics():
+    """Gauges read from the caches, the dispatcher and the model chain on every metrics scrape."""
+    for key, value in dispatcher.stats().items():
+        yield "mention_dispatcher", {"stat": key}, value
+    for key, value in response_cache.stats().items():
+        yield "response_cache", {"stat": key}, value
+    for key, value in slack_cache.stats().items():
+        yield "slack_cache", {"stat": key}, value
+    if rag_pipeline is not None:
+        for key, value in rag_pipeline.embedding_manager.get_cache_stats().items():
+            yield "embedding_cache", {"stat": key}, value
+        yield "vector_store_chunks", {}, rag_pipeline.vector_store_manager.get_collection_count()
+        if isinstance(rag_pipeline.vector_store_manager.backend, ShardedBackend):
+            for key, value in rag_pipeline.vector_store_manager.backend.stats().items():
+                yield "vector_store_shards", {"stat": key}, value
+        for key, value in rag_pipeline.embedding_manager.get_query_batch_stats().items():
+            yield "query_embedding_batches", {"stat": key}, value
+        if rag_pipeline.search_batcher is not None:
+            for key, value in rag_pipeline.search_batcher.stats().items():
+                yield "vector_search_batches", {"stat": key}, value
+    for model, stats in get_default_ai_model_chain().stats().items():
+        yield "llm_breaker_open", {"model": model}, stats["state"] != "closed"
+        yield "llm_error_rate", {"model": model}, stats["error_rate"]
+        if stats["p95_seconds"] is not None:
+            yield "llm_p95_seconds", {"model": model}, stats["p95_seconds"]
+    for phase, seconds in startup.phases.items():
+        yield "startup_phase_seconds", {"phase": phase}, seconds
 
 
-def initialize_rag():
+def initialize_telemetry():
+    telemetry.configure(enabled=TELEMETRY_ENABLED, opentelemetry=TELEMETRY_OPENTELEMETRY)
+    if not TELEMETRY_ENABLED:
+        return
+    telemetry.registry.register_collector(collect_metrics)
+    if METRICS_PORT:
+        telemetry.start_metrics_server(METRICS_PORT)
+
+
+def initialize_rag(ingest: bool = False):
+    """
+    Creates the RAG pipeline. With ingest=True the store is first brought in sync with the source
+    directory (the slow part: loading, chunking and embedding changed files); otherwise the existing
+    store is only opened, which is what the bot does when it starts serving.
+    """
     global rag_pipeline
     try:
         logger.info("Initializing RAG Pipeline...")
@@ -39,110 +136,184 @@ def initialize_rag():
             collection_name=COLLECTION_NAME,
             chunk_size=CHUNK_SIZE,
             chunk_overlap=CHUNK_OVERLAP,
-            embedding_model_name=EMBEDDING_MODEL_NAME
+            embedding_model_name=EMBEDDING_MODEL_NAME,
+            embedding_cache_dir=EMBEDDING_CACHE_DIRECTORY,
+            loader_workers=LOADER_WORKERS,
+            ingest_batch_size=INGEST_BATCH_SIZE,
+            embed_workers=EMBEDDING_CONCURRENCY,
+            embedding_backend=EMBEDDING_BACKEND,
+            embedding_concurrency=EMBEDDING_REQUEST_CONCURRENCY,
+            embedding_requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+            vector_store_backend=VECTOR_STORE_BACKEND,
+            ann_index=ANN_INDEX,
+            ann_nprobe=ANN_NPROBE,
+            ann_ef_search=ANN_EF_SEARCH,
+            quantization=VECTOR_QUANTIZATION,
+            rescore_factor=QUANTIZATION_RESCORE_FACTOR,
+            vector_store_shards=VECTOR_STORE_SHARDS,
+            shard_partition=SHARD_PARTITION,
+            shard_timeout_ms=SHARD_TIMEOUT_MS,
+            query_batch_window_ms=QUERY_BATCH_WINDOW_MS,
+            query_batch_max_wait_ms=QUERY_BATCH_MAX_WAIT_MS,
+            query_batch_max_size=QUERY_BATCH_MAX_SIZE,
+            dedup_chunks=DEDUP_CHUNKS,
+            dedup_threshold=DEDUP_THRESHOLD,
+            metadata_path_fields=METADATA_PATH_FIELDS,
+            metadata_front_matter=METADATA_FRONT_MATTER,
+            metadata_filter_fields=METADATA_FILTER_FIELDS,
+            retrieval_mode=RETRIEVAL_MODE,
+            reranker=RERANKER,
+            rerank_fetch_k=RERANK_FETCH_K,
+            rerank_budget_ms=RERANK_BUDGET_MS,
+            chunking=CHUNKING_STRATEGY,
+            chunk_tokens=CHUNK_TOKENS,
+            chunk_overlap_tokens=CHUNK_OVERLAP_TOKENS,
+            chunking_workers=CHUNKING_WORKERS
         )
-        logger.info("Setting up Vector Store...")
-        rag_pipeline.setup_vector_store(force_recreate=FORCE_RECREATE_STORE)
+        # Ingest invalidates cached answers whose chunks it deletes or rewrites.
+        rag_pipeline.vector_store_manager.add_secondary_index(response_cache)
+        if ingest:
+            logger.info("Setting up Vector Store...")
+            rag_pipeline.setup_vector_store(force_recreate=FORCE_RECREATE_STORE)
+        else:
+            logger.info("Opening Vector Store...")
+            rag_pipeline.open_vector_store()
+        mention_handler.rag_pipeline = rag_pipeline
         logger.info("RAG Pipeline initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize RAG Pipeline: {e}")
         raise
 
 
-# --- Slack Message Handler ---
-# This decorator registers a function to handle 'app_mention' events.
-# The bot will only respond when explicitly mentioned in a channel.
-@app.event("app_mention")
-def handle_app_mention(body, say):
+def warm_up():
     """
-    Handles incoming Slack 'app_mention' events, extracts the user's query,
-    sends it to the LLM using google-generativeai, and posts the response.
+    Runs after the bot is connected: creates the model and embedding clients and opens their
+    connections, loads the tokenizer and primes the Slack user cache, so the first mentions do not
+    pay for any of it. Each step is independent; a failure is logged and the step is retried lazily
+    by the first request that needs it.
     """
-    # The 'text' field in an app_mention event includes the bot's mention,
-    # so we need to remove it to get the actual user query.
-    # The bot's user ID is usually the first part of the text.
-    event = body["event"]
+    steps = [
+        ("warm_up_embeddings", lambda: rag_pipeline.warm_up()),
+        ("warm_up_llm", lambda: get_default_ai_model_chain().warm_up()),
+        ("warm_up_tokenizer", lambda: get_token_counter().count("warm up")),
+        ("warm_up_slack_cache", lambda: slack_cache.prime(app.client)),
+    ]
+    for name, step in steps:
+        try:
+            with startup.phase(name):
+                step()
+        except Exception as e:
+            logger.warning(f"[Startup] {name} failed: {e}")
+    startup.report("warm-up finished")
 
-    text = event["text"]
-    user_id = event["user"]
-    channel_id = event["channel"]
-    thread_ts = event.get("thread_ts", event["ts"])
 
-    # Remove the bot's mention from the text to get the clean query
-    # Example: "<@U0123ABC> What is the weather like?" -> "What is the weather like?"
-    bot_user_id = app.client.auth_test()["user_id"]
-    user_query = text.replace(f"<@{bot_user_id}>", "").strip()
-
-    logger.info(f"[Slack] Received app_mention from user {user_id} in channel {channel_id} with query: {user_query}")
-
-    # build context for the LLM
-    messages = app.client.conversations_replies(channel=channel_id, limit=MAX_MESSAGE_PER_THREAD, ts=thread_ts)[
-        "messages"]
-    conversation_context = build_conversation_context(messages)
-
-    # Get relevant documents using RAG
-    if rag_pipeline and rag_pipeline.vector_store_manager.get_collection_count() > 0:
-        relevant_docs = rag_pipeline.query(user_query, k=2)
-    else:
-        relevant_docs = []
-        logger.warning("RAG Pipeline not initialized or empty vector store")
-
-    prompt = build_prompt_with_context(
-        query=user_query,
-        conversation_history=conversation_context,
-        relevant_docs=relevant_docs,
+def start_source_watcher() -> SourceWatcher:
+    """Re-ingests changed source files in the background; queries keep being answered meanwhile."""
+    watcher = SourceWatcher(
+        SOURCE_DIRECTORY,
+        on_change=rag_pipeline.refresh,
+        is_relevant=rag_pipeline.doc_manager.is_supported,
+        debounce_seconds=WATCH_DEBOUNCE_SECONDS,
+        poll_interval=WATCH_POLL_INTERVAL_SECONDS
     )
+    watcher.start()
+    return watcher
 
-    try:
-        logger.info(f"Calling AI model with prompt: {prompt}")
-        response = get_default_ai_model_chain().generate(prompt)
-        answer = response
-    except Exception as e:
-        logger.error(f"An error occurred during AI model API call: {e}")
-        answer = "Sorry, I couldn't get a response from AI model."
 
-    # Send the LLM's response back to Slack
-    say(answer, thread_ts=thread_ts)
+def install_shard_rebuild_signal():
+    """
+    `kill -USR1 <bot pid>` rebuilds the vector store shards one at a time in the background (see
+    VectorStoreManager.rebuild_shards); queries keep being answered from each old shard store until
+    its replacement is swapped in. A signal received while a rebuild is running is ignored.
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        logger.warning("[Shards] SIGUSR1 is not available on this platform; shards cannot be rebuilt while serving.")
+        return
+    rebuilding = threading.Lock()
 
+    def rebuild():
+        if not rebuilding.acquire(blocking=False):
+            logger.info("[Shards] A shard rebuild is already running.")
+            return
+        try:
+            logger.info("[Shards] Rebuilding vector store shards...")
+            rag_pipeline.vector_store_manager.rebuild_shards()
+            logger.info("[Shards] All shards rebuilt.")
+        except Exception as e:
+            logger.error(f"[Shards] Shard rebuild failed: {e}")
+        finally:
+            rebuilding.release()
 
-def build_conversation_context(messages: list) -> str:
-    """Builds a string representation of the conversation history."""
-    context_parts = []
-    for message in messages:
-        message_user_id = message.get("user")
-        message_bot_id = message.get("bot_id")
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=rebuild, name="shard-rebuild",
+                                                                          daemon=True).start())
 
-        if message_bot_id:
-            sender_name = BOT_NAME
-        elif message_user_id:
-            sender_name = get_user_name(message_user_id)
-        else:
-            sender_name = "Unknown"
 
-        context_parts.append(f"{sender_name}: {message.get('text', '')}")
+# --- Slack Message Handler ---
+# This decorator registers a function to handle 'app_mention' events.
+# The bot will only respond when explicitly mentioned in a channel.
+@app.event("app_mention")
+def handle_app_mention(body, say, client):
+    """
+    Handles incoming Slack 'app_mention' events. The work (thread lookup, retrieval and the LLM call)
+    is handed to the mention dispatcher so this listener returns, and the event is acknowledged,
+    right away. Re-deliveries of the same event are ignored; when the queue is full the user is
+    told to try again instead of waiting indefinitely.
+    """
+    event = body["event"]
+    channel_id = event["channel"]
+    thread_ts = event.get("thread_ts", event["ts"])
+    event_key = body.get("event_id") or f"{channel_id}:{event['ts']}"
 
-    return "\n".join(context_parts)
+    outcome = dispatcher.submit(event_key, channel_id, lambda: mention_handler.handle(event, client))
+    if outcome == BUSY:
+        logger.warning(f"[Slack] Mention queue full, rejecting event {event_key}: {dispatcher.stats()}")
+        say(BUSY_MESSAGE, thread_ts=thread_ts)
+    elif outcome == DUPLICATE:
+        logger.info(f"[Slack] Ignoring re-delivered event {event_key}")
 
 
-def get_user_name(user_id):
-    if user_id in user_name_cache:
-        return user_name_cache[user_id]
-    try:
-        user_info = app.client.users_info(user=user_id)
-        name = user_info["user"]["real_name"] or user_info["user"]["name"]
-        user_name_cache[user_id] = name
-        return name
-    except SlackApiError:
-        logger.error(f"Failed to fetch user info for user ID {user_id}")
-        return "Unknown"
+# Message and profile events keep the Slack metadata cache current, so answering a mention does not
+# have to read the thread or user profiles back from Slack. Requires the message.* and user_change
+# event subscriptions; in a channel no message event has arrived from, each mention in a cached
+# thread also fetches the replies posted since it was cached.
+@app.event("message")
+def handle_message_events(event):
+    slack_cache.record_message_event(event)
+
+
+@app.event("user_change")
+def handle_user_change(event):
+    slack_cache.record_user(event["user"])
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IntelliBot Slack bot")
+    parser.add_argument("--ingest", action="store_true",
+                        help="build or update the vector store from the source directory, then exit")
+    args = parser.parse_args()
     try:
-        # Initialize RAG pipeline before starting the Slack app
-        initialize_rag()
-        logger.info("Starting Slack app...")
-        SocketModeHandler(app, os.getenv("SLACK_APP_TOKEN")).start()
+        startup.record("imports", startup.elapsed())
+        if args.ingest:
+            with startup.phase("ingest"):
+                initialize_rag(ingest=True)
+            startup.report("ingest finished")
+        else:
+            initialize_telemetry()
+            # The index is built by the ingest step; serving only opens it, unless configured otherwise.
+            with startup.phase("ingest" if INGEST_ON_STARTUP else "open_index"):
+                initialize_rag(ingest=INGEST_ON_STARTUP)
+            logger.info("Starting Slack app...")
+            handler = SocketModeHandler(app, os.getenv("SLACK_APP_TOKEN"))
+            with startup.phase("slack_connect"):
+                handler.connect()
+            startup.report("connected to Slack")
+            if WATCH_SOURCE_DIRECTORY:
+                start_source_watcher()
+            if VECTOR_STORE_SHARDS > 1:
+                install_shard_rebuild_signal()
+            if WARM_UP_ON_STARTUP:
+                threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+            threading.Event().wait()
     except Exception as e:
         logger.error(f"Failed to start application: {e}")
         raise
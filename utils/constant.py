@@ -4,7 +4,66 @@ CHROMA_DB_DIRECTORY = "knowledge/chroma_db"
 COLLECTION_NAME = "test"
 
 # Advanced Configuration
-CHUNK_SIZE = 10000
-CHUNK_OVERLAP = 500
+CHUNKING_STRATEGY = "structured"  # "structured" (split on headings/sections/code blocks, sized in tokens) or "recursive" (characters)
+CHUNK_TOKENS = 512  # Maximum tokens per chunk with structured chunking
+CHUNK_OVERLAP_TOKENS = 64  # Trailing paragraphs of up to this many tokens are repeated in the next chunk of a section
+CHUNKING_WORKERS = None  # Threads splitting the documents (e.g. PDF pages) of a file in parallel; None uses up to 8
+CHUNK_SIZE = 10000  # Characters per chunk with recursive chunking
+CHUNK_OVERLAP = 500  # Characters of overlap with recursive chunking
 EMBEDDING_MODEL_NAME = "models/embedding-001"  # Google's embedding model
-FORCE_RECREATE_STORE = True  # Set to True to re-process and re-store all documents
+FORCE_RECREATE_STORE = False  # Set to True to drop the store and re-process all documents; otherwise only changed files are re-embedded
+INGEST_ON_STARTUP = False  # Sync the store with the source directory before serving; otherwise build it with `python main.py --ingest`
+WARM_UP_ON_STARTUP = True  # After connecting to Slack, open the embedding/LLM connections and prime caches in the background
+WATCH_SOURCE_DIRECTORY = True  # Re-ingest changed source files in the background while serving (uses watchdog if installed, else polling)
+WATCH_DEBOUNCE_SECONDS = 2.0  # Quiet period after the last change before a re-ingest starts
+WATCH_POLL_INTERVAL_SECONDS = 5.0  # How often the directory is scanned when watchdog is not available
+EMBEDDING_CACHE_DIRECTORY = "knowledge/embedding_cache"  # On-disk cache of computed embeddings, keyed by model and text
+LOADER_WORKERS = None  # Worker processes used to parse documents; None uses one per CPU core
+INGEST_BATCH_SIZE = 64  # Chunks per embedding request and per vector store write during ingest
+EMBEDDING_CONCURRENCY = 2  # Embedding batches in flight at once during ingest
+EMBEDDING_BACKEND = "google"  # "google", or "fake" for deterministic offline embeddings (tests, benchmarks)
+EMBEDDING_REQUEST_CONCURRENCY = 4  # Parallel requests the embedding client sends for one large call
+EMBEDDING_REQUESTS_PER_MINUTE = 1000  # Client-side rate limit; retries back off on 429/5xx on top of this
+VECTOR_STORE_BACKEND = "chroma"  # "chroma", or "numpy" for in-process exact search over a memory-mapped matrix
+ANN_INDEX = None  # numpy backend only: None (exact), "ivf" (pure NumPy IVF-flat) or "hnsw" (needs hnswlib)
+ANN_NPROBE = 8  # IVF lists scanned per query; higher = better recall, slower
+ANN_EF_SEARCH = 64  # HNSW candidate list size per query; higher = better recall, slower
+VECTOR_QUANTIZATION = None  # numpy backend only: None (float32), "int8" (1/4 the memory) or "binary" (1/32) codes for exact search
+QUANTIZATION_RESCORE_FACTOR = 8  # Candidates per result rescored against the full-precision vectors; raise for "binary"
+VECTOR_STORE_SHARDS = 1  # Stores the chunks are split across, each searched by its own worker process; 1 keeps one in-process store
+SHARD_PARTITION = "hash"  # "hash" (spread chunks by ID) or "source" (keep each file's chunks on one shard)
+SHARD_TIMEOUT_MS = 500  # Shards that have not answered a search after this long are left out of its results
+QUERY_BATCH_WINDOW_MS = 2  # Queries arriving within this many ms of each other are embedded and searched together; 0 disables
+QUERY_BATCH_MAX_WAIT_MS = 10  # Longest a query waits for others to join its batch
+QUERY_BATCH_MAX_SIZE = 32  # Queries per embedding request / vector search batch
+DEDUP_CHUNKS = True  # Store near-duplicate chunks (e.g. the same page exported as .md, .html and .pdf) once
+DEDUP_THRESHOLD = 0.85  # Estimated word 3-gram Jaccard similarity above which two chunks are duplicates
+METADATA_PATH_FIELDS = ("team", "product")  # Tags named after the directory levels below SOURCE_DIRECTORY (source/payments/checkout/x.md)
+METADATA_FRONT_MATTER = True  # Also tag chunks with the YAML front-matter fields at the top of .md/.txt files
+METADATA_FILTER_FIELDS = ("team", "product", "file_type", "modified")  # Fields the numpy store keeps filter bitmaps for; others are scanned
+CHANNEL_METADATA_FILTERS = {}  # Retrieval filter per Slack channel ID, e.g. {"C0123ABC": {"team": "payments", "max_age_days": 365}}
+RETRIEVAL_MODE = "hybrid"  # "vector" (embeddings only) or "hybrid" (BM25 + embeddings fused with reciprocal rank fusion)
+RESPONSE_CACHE_SIZE = 512  # Answers kept by the semantic response cache (LRU beyond this)
+RESPONSE_CACHE_TTL_SECONDS = 3600  # Cached answers older than this are never served
+RESPONSE_CACHE_SIMILARITY = 0.95  # Minimum cosine similarity between query embeddings to reuse an answer
+MENTION_WORKERS = 4  # Threads answering mentions in parallel
+MENTION_QUEUE_SIZE = 32  # Mentions allowed to wait; beyond this the bot replies that it is busy
+MENTION_PER_CHANNEL_LIMIT = 2  # Mentions of one channel answered at the same time
+STREAM_RESPONSES = True  # Edit the reply in place while the LLM generates it
+STREAM_UPDATE_INTERVAL_SECONDS = 1.0  # Minimum time between edits of a streamed reply (chat.update is rate limited)
+LLM_TIMEOUT_SECONDS = 30  # A model call slower than this is abandoned and the next model is tried
+LLM_HEDGE_REQUESTS = True  # Also ask the next model once a call is slower than the model's p95 latency
+PROMPT_TOKEN_BUDGETS = {"gemini-2.0-flash": 16000, "gpt-3.5-turbo": 12000}  # Prompt tokens per model, leaving room for the answer
+DEFAULT_PROMPT_TOKEN_BUDGET = 8000  # Prompt tokens for models not listed above
+HISTORY_TOKEN_SHARE = 0.3  # Share of the prompt budget reserved for the thread history
+RERANKER = "lexical"  # None, "lexical" (term overlap, no extra dependency) or "cross-encoder" (needs sentence-transformers)
+RERANK_FETCH_K = 50  # Candidates retrieved for reranking
+RERANK_BUDGET_MS = 150  # Reranking slower than this falls back to the retrieval order
+RETRIEVAL_TOP_K = 3  # Chunks passed to the LLM per question
+SLACK_USER_CACHE_SIZE = 5000  # User names kept in memory (bulk-loaded from users.list at startup)
+SLACK_USER_CACHE_TTL_SECONDS = 3600  # User names older than this are fetched again
+SLACK_THREAD_CACHE_SIZE = 1000  # Threads whose messages are kept in memory
+SLACK_THREAD_CACHE_TTL_SECONDS = 3600  # Cached threads older than this are fetched again, repairing missed events
+TELEMETRY_ENABLED = False  # Record spans and metrics for every mention and ingest batch
+TELEMETRY_OPENTELEMETRY = False  # Also send spans to the OpenTelemetry tracer (needs opentelemetry-api)
+METRICS_PORT = 9464  # Port of the Prometheus /metrics endpoint when telemetry is enabled; None disables it
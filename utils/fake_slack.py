@@ -0,0 +1,91 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class FakeSlackClient:
+    """
+    In-memory stand-in for slack_sdk.WebClient covering the calls the bot makes. Threads are seeded
+    with add_message(); every call is recorded in `calls` and posted replies land in the thread.
+    `latency` (seconds) is added to each call to simulate Slack round-trips.
+    """
+
+    def __init__(self, bot_user_id: str = "UBOT", users: Optional[Dict[str, str]] = None, latency: float = 0.0):
+        self.bot_user_id = bot_user_id
+        self.users = dict(users or {})
+        self.latency = latency
+        self.calls: List[str] = []
+        self.threads: Dict[tuple, List[dict]] = {}
+        self._lock = threading.Lock()
+        self._next_ts = 1_700_000_000.0
+
+    def _record(self, name: str):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls.append(name)
+
+    def _ts(self) -> str:
+        with self._lock:
+            self._next_ts += 1
+            return f"{self._next_ts:.6f}"
+
+    def add_message(self, channel: str, text: str, user: Optional[str] = None, thread_ts: Optional[str] = None,
+                    bot_id: Optional[str] = None) -> dict:
+        ts = self._ts()
+        message = {"ts": ts, "text": text, "thread_ts": thread_ts or ts}
+        if user:
+            message["user"] = user
+        if bot_id:
+            message["bot_id"] = bot_id
+        with self._lock:
+            self.threads.setdefault((channel, thread_ts or ts), []).append(message)
+        return message
+
+    def call_count(self, name: str) -> int:
+        with self._lock:
+            return self.calls.count(name)
+
+    # --- slack_sdk.WebClient methods used by the bot ---
+
+    def auth_test(self):
+        self._record("auth_test")
+        return {"ok": True, "user_id": self.bot_user_id, "bot_id": "BBOT"}
+
+    def conversations_replies(self, channel: str, ts: str, limit: int = 10, **kwargs):
+        self._record("conversations_replies")
+        with self._lock:
+            messages = list(self.threads.get((channel, ts), []))
+        return {"ok": True, "messages": messages[:limit]}
+
+    def users_info(self, user: str):
+        self._record("users_info")
+        name = self.users.get(user, user)
+        return {"ok": True, "user": {"id": user, "name": name, "real_name": name}}
+
+    def users_list(self, cursor: Optional[str] = None, limit: int = 200, **kwargs):
+        self._record("users_list")
+        members = [{"id": user_id, "name": name, "real_name": name} for user_id, name in self.users.items()]
+        start = int(cursor or 0)
+        page = members[start:start + limit]
+        next_cursor = str(start + limit) if start + limit < len(members) else ""
+        return {"ok": True, "members": page, "response_metadata": {"next_cursor": next_cursor}}
+
+    def chat_postMessage(self, channel: str, text: str, thread_ts: Optional[str] = None, **kwargs):
+        self._record("chat_postMessage")
+        message = self.add_message(channel, text, thread_ts=thread_ts, bot_id="BBOT")
+        return {"ok": True, "channel": channel, "ts": message["ts"]}
+
+    def chat_update(self, channel: str, ts: str, text: str, **kwargs):
+        self._record("chat_update")
+        with self._lock:
+            for messages in self.threads.values():
+                for message in messages:
+                    if message["ts"] == ts:
+                        message["text"] = text
+        return {"ok": True, "channel": channel, "ts": ts}
+
+    def replies(self, channel: str, thread_ts: str) -> List[str]:
+        """Texts of the messages in a thread, oldest first."""
+        with self._lock:
+            return [message["text"] for message in self.threads.get((channel, thread_ts), [])]
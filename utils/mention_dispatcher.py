@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+BUSY = "busy"
+
+
+class MentionDispatcher:
+    """
+    Runs mention jobs on a bounded pool of worker threads so the Slack listener can return (and the
+    event be acknowledged) immediately.
+    - At most `max_queue` jobs wait at any time; beyond that submit() answers BUSY (backpressure).
+    - At most `per_channel_limit` jobs of one channel run at once; the rest wait in a per-channel
+      backlog, so one busy channel cannot take every worker.
+    - Slack re-delivers events it considers unacknowledged; submissions whose key was already seen
+      are dropped as DUPLICATE.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 32, per_channel_limit: int = 2, dedup_size: int = 2048):
+        self.max_queue = max_queue
+        self.per_channel_limit = per_channel_limit
+        self.dedup_size = dedup_size
+        self._ready: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._active: Dict[str, int] = {}
+        self._backlog: Dict[str, deque] = {}
+        self._queued = 0
+        self._stats = {ACCEPTED: 0, DUPLICATE: 0, BUSY: 0, "failed": 0}
+        self._workers = [threading.Thread(target=self._work, name=f"mention-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, event_key: str, channel_id: str, job: Callable[[], None]) -> str:
+        with self._lock:
+            if event_key in self._seen:
+                self._stats[DUPLICATE] += 1
+                return DUPLICATE
+            if self._queued >= self.max_queue:
+                self._stats[BUSY] += 1
+                return BUSY
+            self._seen[event_key] = None
+            if len(self._seen) > self.dedup_size:
+                self._seen.popitem(last=False)
+            self._queued += 1
+            self._stats[ACCEPTED] += 1
+            if self._active.get(channel_id, 0) < self.per_channel_limit:
+                self._active[channel_id] = self._active.get(channel_id, 0) + 1
+                self._ready.put((channel_id, job))
+            else:
+                self._backlog.setdefault(channel_id, deque()).append(job)
+            return ACCEPTED
+
+    def _work(self):
+        while True:
+            item = self._ready.get()
+            if item is None:
+                return
+            channel_id, job = item
+            with self._lock:
+                self._queued -= 1
+            try:
+                job()
+            except Exception as e:
+                logger.exception(f"Mention job for channel {channel_id} failed: {e}")
+                with self._lock:
+                    self._stats["failed"] += 1
+            finally:
+                self._release(channel_id)
+
+    def _release(self, channel_id: str):
+        """Hands the channel's slot to its next backlogged job, or frees the slot."""
+        with self._lock:
+            backlog = self._backlog.get(channel_id)
+            if backlog:
+                self._ready.put((channel_id, backlog.popleft()))
+                if not backlog:
+                    del self._backlog[channel_id]
+            else:
+                self._active[channel_id] -= 1
+                if not self._active[channel_id]:
+                    del self._active[channel_id]
+
+    def shutdown(self):
+        """Lets queued and backlogged jobs finish, then stops the workers."""
+        while True:
+            with self._lock:
+                if not self._queued and not self._active:
+                    break
+            time.sleep(0.05)
+        for _ in self._workers:
+            self._ready.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, queued=self._queued, active_channels=len(self._active))
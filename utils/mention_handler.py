@@ -0,0 +1,197 @@
+import json
+import logging
+from typing import Callable, Dict, List, Optional
+
+from utils import telemetry
+from utils.slack_cache import SlackMetadataCache
+from utils.slack_streamer import SlackStreamWriter
+from utils.slack_utils import build_prompt_with_context, token_budget_for_models
+
+logger = logging.getLogger(__name__)
+
+BOT_NAME = "Intellibot"
+
+
+class MentionHandler:
+    """
+    Answers one app_mention event: reads the thread, retrieves context, calls the LLM and posts the
+    reply. All Slack access goes through the `client` passed in, so it can run against a fake client;
+    reads go through `slack_cache`, so a mention in a known thread costs no Slack reads.
+    With `stream_responses` a placeholder reply is posted right away and edited as the LLM streams
+    its answer, at most once per `stream_update_interval` seconds.
+    `channel_filters` maps a channel ID to the metadata filter its questions are answered with
+    (e.g. {"team": "payments"}), so each channel only searches its own part of the knowledge base.
+    """
+
+    def __init__(self, rag_pipeline, response_cache, model_chain_factory: Callable,
+                 max_messages_per_thread: int = 10, bot_name: str = BOT_NAME,
+                 stream_responses: bool = True, stream_update_interval: float = 1.0, top_k: int = 2,
+                 slack_cache: Optional[SlackMetadataCache] = None, channel_filters: Optional[Dict[str, dict]] = None):
+        self.rag_pipeline = rag_pipeline
+        self.response_cache = response_cache
+        self.model_chain_factory = model_chain_factory
+        self.max_messages_per_thread = max_messages_per_thread
+        self.bot_name = bot_name
+        self.stream_responses = stream_responses
+        self.stream_update_interval = stream_update_interval
+        self.top_k = top_k
+        self.slack_cache = slack_cache or SlackMetadataCache()
+        self.channel_filters = channel_filters or {}
+
+    def handle(self, event: dict, client):
+        with telemetry.span("mention", channel=event["channel"]):
+            self._handle(event, client)
+
+    def _handle(self, event: dict, client):
+        text = event["text"]
+        user_id = event["user"]
+        channel_id = event["channel"]
+        thread_ts = event.get("thread_ts", event["ts"])
+
+        # Remove the bot's mention from the text to get the clean query
+        # Example: "<@U0123ABC> What is the weather like?" -> "What is the weather like?"
+        bot_user_id = self.slack_cache.bot_user_id(client)
+        user_query = text.replace(f"<@{bot_user_id}>", "").strip()
+
+        logger.info(f"[Slack] Received app_mention from user {user_id} in channel {channel_id} with query: {user_query}")
+
+        writer = None
+        if self.stream_responses:
+            writer = SlackStreamWriter(client, channel_id, thread_ts, min_update_interval=self.stream_update_interval)
+            with telemetry.span("slack.placeholder"):
+                writer.start()
+
+        answer = None
+        try:
+            answer = self._answer(user_query, channel_id, thread_ts, event, client, bot_user_id, writer)
+        except Exception as e:
+            logger.error(f"Failed to answer mention in channel {channel_id}: {e}")
+        finally:
+            # Whatever went wrong, the placeholder is replaced (or a reply posted) so the thread
+            # does not keep showing "Thinking..." forever.
+            if answer is None:
+                if writer is not None and writer.text:
+                    answer = f"{writer.text}\n\n_(response interrupted)_"
+                else:
+                    answer = "Sorry, I couldn't get a response from AI model."
+            with telemetry.span("slack.reply"):
+                self._reply(client, channel_id, thread_ts, writer, answer, bot_user_id)
+
+    def _answer(self, user_query: str, channel_id: str, thread_ts: str, event: dict, client, bot_user_id: str,
+                writer: Optional[SlackStreamWriter]) -> Optional[str]:
+        """Builds the context for the mention and returns the answer, or None if the LLM gave none."""
+        # build context for the LLM
+        with telemetry.span("slack.thread") as span:
+            self.slack_cache.record_message(channel_id, event)
+            messages = self.slack_cache.thread_messages(channel_id, thread_ts, client,
+                                                        limit=self.max_messages_per_thread)
+            if writer is not None:
+                messages = [message for message in messages if message.get("ts") != writer.ts]
+            conversation_context = self.build_conversation_context(messages, client, bot_user_id)
+            span.set_attribute("messages", len(messages))
+
+        # Only a question that starts a thread is answered from the cache: follow-ups depend on the
+        # conversation so far, which the cache does not take into account.
+        cacheable = len(messages) <= 1
+        query_embedding = None
+        metadata_filter = self.channel_filters.get(channel_id)
+        # Answers are only shared between channels searching with the same filter.
+        cache_scope = json.dumps(metadata_filter, sort_keys=True) if metadata_filter else ""
+
+        # Get relevant documents using RAG
+        rag_pipeline = self.rag_pipeline
+        if rag_pipeline and rag_pipeline.vector_store_manager.get_collection_count() > 0:
+            with telemetry.span("embed_query"):
+                query_embedding = rag_pipeline.embed_query(user_query)
+            cached_answer = self.response_cache.lookup(query_embedding, cache_scope) if cacheable else None
+            if cacheable:
+                telemetry.increment("response_cache_lookups_total", outcome="miss" if cached_answer is None else "hit")
+            if cached_answer is not None:
+                logger.info(f"Answered from response cache: {self.response_cache.stats()}")
+                telemetry.current_span().set_attribute("response_cache", "hit")
+                return cached_answer
+            with telemetry.span("retrieval") as span:
+                relevant_docs = rag_pipeline.query(user_query, k=self.top_k, query_embedding=query_embedding,
+                                                   filter=metadata_filter) or []
+                span.set_attribute("chunks", len(relevant_docs))
+        else:
+            relevant_docs = []
+            logger.warning("RAG Pipeline not initialized or empty vector store")
+
+        model_chain = self.model_chain_factory()
+        with telemetry.span("prompt"):
+            prompt = build_prompt_with_context(
+                query=user_query,
+                conversation_history=conversation_context,
+                relevant_docs=relevant_docs,
+                token_budget=token_budget_for_models(model_chain.model_names()),
+            )
+
+        with telemetry.span("llm", streaming=writer is not None):
+            if writer is not None:
+                answer = self._stream_answer(model_chain, prompt, writer)
+            else:
+                try:
+                    answer = model_chain.generate(prompt)
+                except Exception as e:
+                    logger.error(f"An error occurred during AI model API call: {e}")
+                    answer = None
+
+        if answer is not None and cacheable and query_embedding is not None:
+            self.response_cache.store(query_embedding, [doc.id for doc in relevant_docs], answer, cache_scope)
+        return answer
+
+    def _stream_answer(self, model_chain, prompt: str, writer: SlackStreamWriter) -> Optional[str]:
+        """Streams the LLM answer into the placeholder reply. Returns None unless the answer completed."""
+        try:
+            for fragment in model_chain.stream(prompt):
+                writer.append(fragment)
+        except Exception as e:
+            logger.error(f"An error occurred during AI model API call: {e}")
+            return None
+        finally:
+            time_to_first_visible = writer.time_to_first_visible()
+            if time_to_first_visible is not None:
+                telemetry.observe("time_to_first_visible_token_seconds", time_to_first_visible)
+            logger.info(f"Streamed reply: time to first visible token "
+                        f"{self._format_seconds(time_to_first_visible)}, {writer.updates} update(s)")
+        return writer.text or None
+
+    def _reply(self, client, channel_id: str, thread_ts: str, writer: Optional[SlackStreamWriter], text: str,
+               bot_user_id: str):
+        if writer is not None:
+            writer.finish(text)
+            reply_ts = writer.ts
+        else:
+            reply_ts = client.chat_postMessage(channel=channel_id, text=text, thread_ts=thread_ts)["ts"]
+        # Keeps the cached thread complete even if the message event for the reply is not delivered.
+        if reply_ts is not None:
+            self.slack_cache.record_message(channel_id, {
+                "ts": reply_ts, "thread_ts": thread_ts, "text": text, "user": bot_user_id,
+                "bot_id": self.slack_cache.bot_identity(client).get("bot_id"),
+            })
+
+    @staticmethod
+    def _format_seconds(seconds: Optional[float]) -> str:
+        return "n/a" if seconds is None else f"{seconds:.2f}s"
+
+    def build_conversation_context(self, messages: list, client, bot_user_id: Optional[str] = None) -> List[str]:
+        """Builds the conversation history as one "sender: text" line per message, oldest first."""
+        context_parts = []
+        for message in messages:
+            message_user_id = message.get("user")
+            message_bot_id = message.get("bot_id")
+
+            if message_bot_id or (bot_user_id and message_user_id == bot_user_id):
+                sender_name = self.bot_name
+            elif message_user_id:
+                sender_name = self.get_user_name(message_user_id, client)
+            else:
+                sender_name = "Unknown"
+
+            context_parts.append(f"{sender_name}: {message.get('text', '')}")
+
+        return context_parts
+
+    def get_user_name(self, user_id: str, client) -> str:
+        return self.slack_cache.user_name(user_id, client)
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from utils import telemetry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Gathers items submitted by concurrent callers and hands them to `process` as one list, then
+    gives every caller its own result.
+    - A batch closes once no new item arrived for `window_seconds`, once its first item has waited
+      `max_wait_seconds`, or once it holds `max_batch_size` items; a lone item therefore waits at
+      most `window_seconds`.
+    - Up to `max_concurrency` batches are processed at once. While all of them are busy the next
+      batch keeps filling instead of queueing behind them, so batches grow with the load.
+    - If `process` raises, every caller of that batch gets the exception.
+    """
+
+    def __init__(self, process: Callable[[List[T]], List[R]], window_seconds: float = 0.002,
+                 max_wait_seconds: float = 0.01, max_batch_size: int = 32, max_concurrency: int = 4,
+                 name: str = "micro-batcher"):
+        self.process = process
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max(max_wait_seconds, window_seconds)
+        self.max_batch_size = max(1, max_batch_size)
+        self.name = name
+        self._queue: List[Tuple[float, T, Future]] = []
+        self._last_arrival = 0.0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix=name)
+        self._slots = threading.Semaphore(max(1, max_concurrency))
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+    def submit(self, item: T) -> "Future[R]":
+        future: Future = Future()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError(f"{self.name} is shut down")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name=self.name, daemon=True)
+                self._thread.start()
+            self._last_arrival = time.monotonic()
+            self._queue.append((self._last_arrival, item, future))
+            self._condition.notify()
+        return future
+
+    def __call__(self, item: T) -> R:
+        return self.submit(item).result()
+
+    def shutdown(self):
+        """Processes the items already submitted, then stops."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _collect(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopped:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                while len(self._queue) < self.max_batch_size and not self._stopped:
+                    closes_at = min(self._last_arrival + self.window_seconds,
+                                    self._queue[0][0] + self.max_wait_seconds)
+                    remaining = closes_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            self._slots.acquire()
+            with self._condition:
+                batch = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch: List[Tuple[float, T, Future]]):
+        started = time.monotonic()
+        try:
+            results = self.process([item for _, item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name} returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            logger.warning(f"{self.name} batch of {len(batch)} failed: {e}")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+        with self._condition:
+            self._batches += 1
+            self._items += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+        telemetry.observe("micro_batch_wait_seconds", started - batch[0][0], batcher=self.name)
+        telemetry.increment("micro_batch_items_total", len(batch), batcher=self.name)
+        telemetry.increment("micro_batches_total", batcher=self.name)
+
+    def stats(self) -> Dict[str, float]:
+        with self._condition:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "waiting": len(self._queue),
+            }
@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+
+class _Thread:
+    def __init__(self, messages: List[dict], ttl_seconds: float):
+        self.messages: "OrderedDict[str, dict]" = OrderedDict((message["ts"], message) for message in messages)
+        self.expires_at = time.monotonic() + ttl_seconds
+        # Newest message read from Slack itself. Messages the bot records locally (the mention it is
+        # answering, its own replies) do not advance it, so a catch-up still finds replies before them.
+        self.synced_ts = max(self.messages, key=float) if self.messages else None
+
+
+class SlackMetadataCache:
+    """
+    Caches what the bot reads from Slack so that answering a mention in a known thread needs no
+    Slack reads at all:
+    - the bot's own user ID, fetched once;
+    - user display names in a bounded LRU with a TTL, bulk-loaded through users.list by prime()
+      and refreshed from user_change events;
+    - thread messages, fetched once per thread and then kept current from message events
+      (new, edited and deleted messages). Threads that start while the bot is running are cached
+      from their first message and never fetched. Entries expire after `thread_ttl_seconds` so a
+      missed event is eventually repaired by a fresh fetch.
+    Message events only arrive with the app's message.* event subscriptions. Until one has arrived
+    from a channel, a read of a cached thread there also fetches the replies newer than the last
+    cached one (a single small conversations.replies call), so follow-ups are never missed.
+    """
+
+    def __init__(self, user_ttl_seconds: float = 3600.0, max_users: int = 5000, thread_ttl_seconds: float = 3600.0,
+                 max_threads: int = 1000, max_messages_per_thread: int = 200):
+        self.user_ttl_seconds = user_ttl_seconds
+        self.max_users = max_users
+        self.thread_ttl_seconds = thread_ttl_seconds
+        self.max_threads = max_threads
+        self.max_messages_per_thread = max_messages_per_thread
+        self._bot_identity: Optional[dict] = None
+        self._users: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._threads: "OrderedDict[Tuple[str, str], _Thread]" = OrderedDict()
+        self._event_channels: Set[str] = set()  # channels message events were received from
+        self._lock = threading.Lock()
+        self._stats = {"user_hits": 0, "user_misses": 0, "thread_hits": 0, "thread_misses": 0, "thread_catch_ups": 0}
+
+    def prime(self, client):
+        """Fetches the bot identity and bulk-loads user names, so the first mentions start warm."""
+        self.bot_user_id(client)
+        loaded = 0
+        cursor = None
+        try:
+            while loaded < self.max_users:
+                response = client.users_list(cursor=cursor, limit=200)
+                for member in response["members"]:
+                    self._put_user(member["id"], self._display_name(member))
+                    loaded += 1
+                cursor = (response.get("response_metadata") or {}).get("next_cursor")
+                if not cursor:
+                    break
+        except SlackApiError as e:
+            logger.warning(f"Failed to prefetch users, names will be fetched on demand: {e}")
+        logger.info(f"Slack metadata cache primed with {loaded} user(s)")
+
+    # --- bot identity ---
+
+    def bot_identity(self, client) -> dict:
+        """The auth.test response for the bot token (user_id, bot_id, team), fetched once."""
+        if self._bot_identity is None:
+            self._bot_identity = dict(client.auth_test())
+        return self._bot_identity
+
+    def bot_user_id(self, client) -> str:
+        return self.bot_identity(client)["user_id"]
+
+    # --- users ---
+
+    @staticmethod
+    def _display_name(user: dict) -> str:
+        return user.get("real_name") or user.get("name") or "Unknown"
+
+    def _put_user(self, user_id: str, name: str):
+        with self._lock:
+            self._users[user_id] = (name, time.monotonic() + self.user_ttl_seconds)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def user_name(self, user_id: str, client) -> str:
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._users.move_to_end(user_id)
+                self._stats["user_hits"] += 1
+                return entry[0]
+            self._stats["user_misses"] += 1
+        try:
+            name = self._display_name(client.users_info(user=user_id)["user"])
+        except SlackApiError:
+            logger.error(f"Failed to fetch user info for user ID {user_id}")
+            return "Unknown"
+        self._put_user(user_id, name)
+        return name
+
+    def record_user(self, user: dict):
+        """Applies a user_change event."""
+        self._put_user(user["id"], self._display_name(user))
+
+    # --- threads ---
+
+    def thread_messages(self, channel: str, thread_ts: str, client, limit: Optional[int] = None) -> List[dict]:
+        """Messages of the thread oldest first; the newest `limit` when given."""
+        key = (channel, thread_ts)
+        with self._lock:
+            thread = self._threads.get(key)
+            if thread is not None and thread.expires_at > time.monotonic():
+                self._threads.move_to_end(key)
+                self._stats["thread_hits"] += 1
+                if channel in self._event_channels:
+                    messages = list(thread.messages.values())
+                    return messages[-limit:] if limit else messages
+                last_ts = thread.synced_ts
+                self._stats["thread_catch_ups"] += 1
+            else:
+                thread = None
+                self._stats["thread_misses"] += 1
+
+        if thread is not None:
+            return self._catch_up_thread(key, last_ts, client, limit)
+        messages = self._fetch_thread(channel, thread_ts, client)
+        with self._lock:
+            self._store_thread(key, _Thread(messages, self.thread_ttl_seconds))
+        return messages[-limit:] if limit else messages
+
+    def _catch_up_thread(self, key: Tuple[str, str], last_ts: Optional[str], client,
+                         limit: Optional[int]) -> List[dict]:
+        """Adds the replies posted after `last_ts` to a cached thread and returns its messages."""
+        try:
+            newer = self._fetch_thread(key[0], key[1], client, oldest=last_ts)
+        except SlackApiError as e:
+            logger.warning(f"Failed to fetch new replies of thread {key[1]}, using the cached thread: {e}")
+            newer = []
+        with self._lock:
+            thread = self._threads.get(key)
+            if thread is None:  # evicted meanwhile
+                thread = _Thread(newer, self.thread_ttl_seconds)
+                self._store_thread(key, thread)
+            elif newer:
+                merged = dict(thread.messages)
+                merged.update((message["ts"], message) for message in newer)
+                thread.messages = OrderedDict(sorted(merged.items(), key=lambda item: float(item[0])))
+                while len(thread.messages) > self.max_messages_per_thread:
+                    thread.messages.popitem(last=False)
+                newest = max((message["ts"] for message in newer), key=float)
+                if thread.synced_ts is None or float(newest) > float(thread.synced_ts):
+                    thread.synced_ts = newest
+            messages = list(thread.messages.values())
+        return messages[-limit:] if limit else messages
+
+    def _fetch_thread(self, channel: str, thread_ts: str, client, oldest: Optional[str] = None) -> List[dict]:
+        """The thread's messages (only the parent and the replies after `oldest`, if given)."""
+        messages: List[dict] = []
+        cursor = None
+        extra = {"oldest": oldest} if oldest else {}
+        while True:
+            response = client.conversations_replies(channel=channel, ts=thread_ts, cursor=cursor,
+                                                    limit=min(self.max_messages_per_thread, 200), **extra)
+            messages.extend(response["messages"])
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor or not response.get("has_more", True):
+                break
+        return messages[-self.max_messages_per_thread:]
+
+    def _store_thread(self, key: Tuple[str, str], thread: _Thread):
+        while len(thread.messages) > self.max_messages_per_thread:
+            thread.messages.popitem(last=False)
+        self._threads[key] = thread
+        self._threads.move_to_end(key)
+        while len(self._threads) > self.max_threads:
+            self._threads.popitem(last=False)
+
+    def record_message_event(self, event: dict):
+        """
+        Applies a `message` event. New top-level messages start a cached thread; replies, edits and
+        deletions only touch threads that are already cached (unknown threads are fetched when needed).
+        """
+        subtype = event.get("subtype")
+        channel = event.get("channel")
+        if channel is not None:
+            with self._lock:
+                self._event_channels.add(channel)
+        if subtype == "message_changed":
+            message = event.get("message") or {}
+            edited_ts = message.get("ts")
+
+            def replace(thread: _Thread):
+                if edited_ts in thread.messages:
+                    thread.messages[edited_ts] = message
+
+            self._apply(channel, message.get("thread_ts") or edited_ts, replace)
+        elif subtype == "message_deleted":
+            previous = event.get("previous_message") or {}
+            deleted_ts = event.get("deleted_ts")
+            self._apply(channel, previous.get("thread_ts") or deleted_ts,
+                        lambda thread: thread.messages.pop(deleted_ts, None))
+        elif "ts" in event:
+            self.record_message(channel, event)
+
+    def record_message(self, channel: str, message: dict):
+        """Adds a message the bot saw or posted to its thread, if the thread is cached or starts with it."""
+        thread_ts = message.get("thread_ts") or message["ts"]
+        key = (channel, thread_ts)
+        with self._lock:
+            thread = self._threads.get(key)
+            if thread is None:
+                if thread_ts == message["ts"]:
+                    self._store_thread(key, _Thread([message], self.thread_ttl_seconds))
+                return
+            thread.messages[message["ts"]] = message
+            while len(thread.messages) > self.max_messages_per_thread:
+                thread.messages.popitem(last=False)
+
+    def _apply(self, channel: str, thread_ts: Optional[str], change):
+        if thread_ts is None:
+            return
+        with self._lock:
+            thread = self._threads.get((channel, thread_ts))
+            if thread is not None:
+                change(thread)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, users=len(self._users), threads=len(self._threads))
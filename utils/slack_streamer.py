@@ -0,0 +1,79 @@
+import logging
+import time
+from typing import Optional
+
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_TEXT = "_Thinking..._"
+
+
+class SlackStreamWriter:
+    """
+    Shows an answer in a Slack thread while it is being generated. start() posts a placeholder reply;
+    append() collects text fragments and edits the reply with everything received so far, at most once
+    per `min_update_interval` seconds (chat.update is rate limited per workspace, so fragments are
+    coalesced rather than sent one by one); finish() writes the final text.
+    """
+
+    def __init__(self, client, channel: str, thread_ts: str, min_update_interval: float = 1.0,
+                 placeholder: str = PLACEHOLDER_TEXT):
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.min_update_interval = min_update_interval
+        self.placeholder = placeholder
+        self.ts: Optional[str] = None
+        self.updates = 0
+        self.started_at: Optional[float] = None
+        self.first_visible_at: Optional[float] = None
+        self._parts = []
+        self._shown = ""
+        self._last_update = 0.0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def start(self):
+        """Posts the placeholder reply that later updates edit."""
+        self.started_at = time.monotonic()
+        response = self.client.chat_postMessage(channel=self.channel, text=self.placeholder, thread_ts=self.thread_ts)
+        self.ts = response["ts"]
+
+    def append(self, fragment: str):
+        if not fragment:
+            return
+        self._parts.append(fragment)
+        if time.monotonic() - self._last_update >= self.min_update_interval:
+            self._update(self.text)
+
+    def finish(self, text: Optional[str] = None):
+        """Writes the final text (default: everything appended) into the reply."""
+        final_text = text if text is not None else self.text
+        if final_text and final_text != self._shown:
+            self._update(final_text)
+
+    def time_to_first_visible(self) -> Optional[float]:
+        """Seconds from start() until the first update with answer text reached Slack."""
+        if self.started_at is None or self.first_visible_at is None:
+            return None
+        return self.first_visible_at - self.started_at
+
+    def _update(self, text: str):
+        self._last_update = time.monotonic()
+        try:
+            if self.ts is None:
+                response = self.client.chat_postMessage(channel=self.channel, text=text, thread_ts=self.thread_ts)
+                self.ts = response["ts"]
+            else:
+                self.client.chat_update(channel=self.channel, ts=self.ts, text=text)
+        except SlackApiError as e:
+            # A rejected intermediate update is harmless: the next one carries the full text again.
+            logger.warning(f"Failed to update streamed reply in channel {self.channel}: {e}")
+            return
+        self._shown = text
+        self.updates += 1
+        if self.first_visible_at is None:
+            self.first_visible_at = time.monotonic()
@@ -1,8 +1,14 @@
-def build_prompt_with_context(query: str, conversation_history: str, relevant_docs: list) -> str:
-    # Combine relevant documents into context
-    doc_context = "\n".join([doc.page_content for doc in relevant_docs])
+import logging
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
 
-    prompt = f"""
+from utils import telemetry
+from utils.constant import PROMPT_TOKEN_BUDGETS, DEFAULT_PROMPT_TOKEN_BUDGET, HISTORY_TOKEN_SHARE
+from utils.token_counter import TokenCounter, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEMPLATE = """
     Based on the following context and conversation history, please provide a helpful response.
 
     KNOWLEDGE BASE CONTEXT:
@@ -16,4 +22,116 @@ def build_prompt_with_context(query: str, conversation_history: str, relevant_do
 
     Please provide a clear and concise response that incorporates both the relevant knowledge base information and takes into account the conversation context."""
 
-    return prompt
+# A chunk is dropped when this share of its word 8-grams already appears in chunks selected before it.
+DUPLICATE_OVERLAP = 0.8
+_SHINGLE_SIZE = 8
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def token_budget_for_models(model_names: Iterable[str]) -> int:
+    """Prompt budget that fits every model the prompt may be sent to."""
+    budgets = [PROMPT_TOKEN_BUDGETS.get(name, DEFAULT_PROMPT_TOKEN_BUDGET) for name in model_names]
+    return min(budgets) if budgets else DEFAULT_PROMPT_TOKEN_BUDGET
+
+
+def _shingles(text: str) -> set:
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < _SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)}
+
+
+def _rank_documents(relevant_docs: list) -> list:
+    """Documents best first. Entries may be (document, score) pairs; plain documents keep their order."""
+    if relevant_docs and isinstance(relevant_docs[0], tuple):
+        return [doc for doc, _ in sorted(relevant_docs, key=lambda pair: pair[1], reverse=True)]
+    return list(relevant_docs)
+
+
+def _select_documents(documents: list, budget: int, counter: TokenCounter) -> Tuple[List[str], int]:
+    """Fills the budget with documents in rank order, skipping near-duplicates of earlier ones."""
+    selected: List[str] = []
+    seen_shingles: set = set()
+    used = 0
+    for doc in documents:
+        text = doc.page_content
+        shingles = _shingles(text)
+        if shingles and len(shingles & seen_shingles) >= DUPLICATE_OVERLAP * len(shingles):
+            continue
+        tokens = counter.count(text, key=getattr(doc, "id", None))
+        if used + tokens > budget:
+            if selected or budget <= 0:
+                continue
+            # Even the best document is too large: keep as much of it as fits.
+            text = counter.truncate(text, budget)
+            tokens = counter.count(text)
+        selected.append(text)
+        seen_shingles |= shingles
+        used += tokens
+    return selected, used
+
+
+def _select_history(messages: Sequence[str], budget: int, counter: TokenCounter) -> Tuple[List[str], int]:
+    """Keeps the newest messages that fit; the oldest are dropped (or cut) first."""
+    kept: List[str] = []
+    used = 0
+    for message in reversed(messages):
+        tokens = counter.count(message)
+        if used + tokens > budget:
+            remaining = budget - used
+            if remaining > 16:
+                kept.append("..." + counter.truncate(message, remaining - 1, keep="end"))
+                used += remaining
+            break
+        kept.append(message)
+        used += tokens
+    omitted = len(messages) - len(kept)
+    kept.reverse()
+    if omitted:
+        kept.insert(0, f"[{omitted} earlier message(s) omitted]")
+    return kept, used
+
+
+def build_prompt_with_context(query: str, conversation_history: Union[str, Sequence[str]], relevant_docs: list,
+                              token_budget: Optional[int] = None, counter: Optional[TokenCounter] = None) -> str:
+    """
+    Builds the LLM prompt within `token_budget` tokens (DEFAULT_PROMPT_TOKEN_BUDGET if not given).
+    The query always goes in. Up to HISTORY_TOKEN_SHARE of the rest is reserved for the conversation
+    history; retrieved chunks fill the remainder best first, and whatever they leave unused goes back
+    to the history, which keeps its newest messages.
+
+    Args:
+        query (str): The user's question.
+        conversation_history: Thread messages oldest first, or the history as one string.
+        relevant_docs (list): Retrieved documents best first, or (document, score) pairs.
+        token_budget (int): Maximum prompt size in tokens.
+        counter (TokenCounter): Token counter; defaults to the shared one.
+    """
+    counter = counter or get_token_counter()
+    token_budget = token_budget or DEFAULT_PROMPT_TOKEN_BUDGET
+    messages = conversation_history.splitlines() if isinstance(conversation_history, str) \
+        else list(conversation_history)
+
+    fixed_tokens = counter.count(PROMPT_TEMPLATE.format(doc_context="", conversation_history="", query=query))
+    available = max(token_budget - fixed_tokens, 0)
+    history_tokens = sum(counter.count(message) for message in messages)
+    history_reserve = min(history_tokens, int(available * HISTORY_TOKEN_SHARE))
+
+    documents = _rank_documents(relevant_docs)
+    doc_texts, doc_tokens = _select_documents(documents, available - history_reserve, counter)
+    history, used_history_tokens = _select_history(messages, available - doc_tokens, counter)
+
+    prompt_tokens = fixed_tokens + doc_tokens + used_history_tokens
+    telemetry.observe("prompt_tokens", prompt_tokens, buckets=telemetry.TOKEN_BUCKETS)
+    span = telemetry.current_span()
+    span.set_attribute("prompt_tokens", prompt_tokens)
+    span.set_attribute("chunks_used", len(doc_texts))
+    logger.info(f"Prompt tokens: {prompt_tokens} of {token_budget} "
+                f"(query/template {fixed_tokens}, {len(doc_texts)}/{len(documents)} chunk(s) {doc_tokens}, "
+                f"{len(messages)} message(s) of history {used_history_tokens}/{history_tokens})")
+
+    return PROMPT_TEMPLATE.format(
+        doc_context="\n".join(doc_texts),
+        conversation_history="\n".join(history),
+        query=query,
+    )
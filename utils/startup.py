@@ -0,0 +1,36 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """
+    Times the phases of process start-up (imports, opening the index, connecting to Slack, warm-up)
+    and logs each one, so a slow cold start shows which phase to look at.
+    """
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        logger.info(f"[Startup] {name} took {seconds:.2f}s")
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def report(self, label: str = "ready"):
+        phases = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.phases.items())
+        logger.info(f"[Startup] {label} after {self.elapsed():.2f}s ({phases})")
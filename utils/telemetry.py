@@ -0,0 +1,273 @@
+"""
+Lightweight tracing and metrics.
+
+    with telemetry.span("retrieval", mode="hybrid") as span:
+        docs = ...
+        span.set_attribute("chunks", len(docs))
+    telemetry.increment("response_cache_total", outcome="hit")
+    telemetry.observe("prompt_tokens", 1834, buckets=telemetry.TOKEN_BUCKETS)
+
+Every span's duration is recorded in the `intellibot_span_duration_seconds` histogram, and when a
+root span ends one structured log line with the durations of its child spans is written, so a slow
+request shows where its time went. Metrics are exposed in the Prometheus text format by
+start_metrics_server(). With OpenTelemetry installed, configure(opentelemetry=True) also mirrors
+spans to the globally configured tracer.
+
+Telemetry is off until configure(enabled=True) is called; while off, span() returns a shared no-op
+object and increment()/observe() return immediately, so instrumented code pays one flag check.
+"""
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "intellibot_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_enabled = False
+_otel_tracer = None
+_current_span: contextvars.ContextVar = contextvars.ContextVar("intellibot_span", default=None)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts: Dict[LabelKey, List[int]] = {}
+        self.sums: Dict[LabelKey, float] = {}
+
+    def observe(self, labels: LabelKey, value: float):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+
+class MetricsRegistry:
+    """Counters and histograms keyed by name and labels, plus collectors read at scrape time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, _Histogram] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]] = []
+
+    @staticmethod
+    def _labels(labels: Dict[str, object]) -> LabelKey:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def increment(self, name: str, value: float = 1.0, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = _Histogram(buckets)
+            histogram.observe(key, value)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]):
+        """Adds a callable returning (name, labels, value) gauges, evaluated on every scrape."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    @staticmethod
+    def _format_labels(labels: Iterable[Tuple[str, str]], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{PREFIX}{name}{self._format_labels(labels)} {value:g}")
+            for name, histogram in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for labels, counts in histogram.counts.items():
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ["+Inf"], counts):
+                        cumulative += count
+                        le = bound if isinstance(bound, str) else f"{bound:g}"
+                        lines.append(f"{PREFIX}{name}_bucket{self._format_labels(labels, ('le', le))} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{self._format_labels(labels)} {histogram.sums[labels]:g}")
+                    lines.append(f"{PREFIX}{name}_count{self._format_labels(labels)} {cumulative}")
+            collectors = list(self._collectors)
+        gauges: Dict[str, List[str]] = {}
+        for collector in collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges.setdefault(name, []).append(
+                        f"{PREFIX}{name}{self._format_labels(self._labels(labels))} {float(value):g}")
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        for name, samples in sorted(gauges.items()):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class Span:
+    """A timed unit of work. Child spans started while it is current are attached to it."""
+
+    __slots__ = ("name", "attributes", "parent", "children", "start", "duration", "_token", "_otel_scope",
+                 "_otel_span")
+
+    def __init__(self, name: str, attributes: Dict[str, object]):
+        self.name = name
+        self.attributes = attributes
+        self.parent: Optional["Span"] = None
+        self.children: List["Span"] = []
+        self.start = 0.0
+        self.duration = 0.0
+        self._token = None
+        self._otel_scope = None
+        self._otel_span = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self)
+        if _otel_tracer is not None:
+            self._otel_scope = _otel_tracer.start_as_current_span(self.name)
+            self._otel_span = self._otel_scope.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        if self._otel_scope is not None:
+            self._otel_span.set_attributes(_otel_attributes(self.attributes))
+            self._otel_scope.__exit__(exc_type, exc, traceback)
+        registry.observe("span_duration_seconds", self.duration, span=self.name)
+        if self.parent is not None:
+            self.parent.children.append(self)
+        else:
+            logger.info(self.summary())
+        return False
+
+    def summary(self) -> str:
+        """One line with this span, its attributes and its children's durations."""
+        parts = [f"trace {self.name} {self.duration * 1000:.1f}ms"]
+        parts.extend(f"{key}={value}" for key, value in self.attributes.items())
+        for child in self._descendants():
+            parts.append(f"{child.name}={child.duration * 1000:.1f}ms")
+        return " ".join(parts)
+
+    def _descendants(self):
+        for child in self.children:
+            yield child
+            yield from child._descendants()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otel_attributes(attributes: Dict[str, object]) -> Dict[str, object]:
+    return {key: value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in attributes.items()}
+
+
+def configure(enabled: bool, opentelemetry: bool = False):
+    """Turns telemetry on or off; with opentelemetry=True spans are also sent to the OpenTelemetry tracer."""
+    global _enabled, _otel_tracer
+    _enabled = enabled
+    _otel_tracer = None
+    if enabled and opentelemetry:
+        try:
+            from opentelemetry import trace
+            _otel_tracer = trace.get_tracer("intellibot")
+        except ImportError:
+            logger.warning("opentelemetry is not installed; spans are recorded locally only")
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def span(name: str, **attributes):
+    """Context manager timing a stage; a shared no-op while telemetry is disabled."""
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+def current_span():
+    """The innermost active span (or the no-op span), for adding attributes from nested code."""
+    if not _enabled:
+        return NOOP_SPAN
+    return _current_span.get() or NOOP_SPAN
+
+
+def increment(name: str, value: float = 1.0, **labels):
+    if _enabled:
+        registry.increment(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels):
+    if _enabled:
+        registry.observe(name, value, buckets, **labels)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes are not worth a log line each
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves /metrics in the Prometheus text format from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,101 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Used when the tiktoken encoding cannot be loaded (it is downloaded on first use).
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken. Counts are cached in an LRU keyed by the caller's key (e.g. a chunk
+    ID, which changes whenever the chunk's content changes) or by a hash of the text, so chunks that
+    are retrieved again are not re-tokenised. Without tiktoken the count is estimated from the length.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base", cache_size: int = 8192):
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._encoding = None
+        self._encoding_loaded = False
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _get_encoding(self):
+        if not self._encoding_loaded:
+            with self._load_lock:
+                if not self._encoding_loaded:
+                    try:
+                        import tiktoken
+                        self._encoding = tiktoken.get_encoding(self.encoding_name)
+                    except Exception as e:
+                        logger.warning(
+                            f"tiktoken encoding '{self.encoding_name}' unavailable, estimating token counts: {e}")
+                    self._encoding_loaded = True
+        return self._encoding
+
+    def count(self, text: str, key: Optional[str] = None, cache: bool = True) -> int:
+        """
+        Number of tokens in text. With cache=False the count is neither looked up nor stored, for
+        one-off texts (e.g. paragraphs while chunking) that would only evict useful entries.
+        """
+        if not cache:
+            return self._count(text)
+        cache_key = key if key is not None else hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key]
+        tokens = self._count(text)
+        with self._lock:
+            self._cache[cache_key] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def _count(self, text: str) -> int:
+        encoding = self._get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def windows(self, text: str, max_tokens: int, overlap: int = 0) -> List[str]:
+        """Cuts text into consecutive pieces of at most max_tokens, each sharing `overlap` tokens with the previous one."""
+        step = max(1, max_tokens - overlap)
+        encoding = self._get_encoding()
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            return [encoding.decode(tokens[start:start + max_tokens])
+                    for start in range(0, max(len(tokens) - overlap, 1), step)]
+        max_chars, step_chars = max_tokens * CHARS_PER_TOKEN, step * CHARS_PER_TOKEN
+        return [text[start:start + max_chars]
+                for start in range(0, max(len(text) - overlap * CHARS_PER_TOKEN, 1), step_chars)]
+
+    def truncate(self, text: str, max_tokens: int, keep: str = "start") -> str:
+        """Cuts text to at most max_tokens, keeping its start (or its end with keep="end")."""
+        if max_tokens <= 0:
+            return ""
+        encoding = self._get_encoding()
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            kept = tokens[:max_tokens] if keep == "start" else tokens[-max_tokens:]
+            return encoding.decode(kept)
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        return text[:max_chars] if keep == "start" else text[-max_chars:]
+
+
+_default_counter = TokenCounter()
+
+
+def get_token_counter() -> TokenCounter:
+    """The process-wide counter, so cached counts are shared by all callers."""
+    return _default_counter